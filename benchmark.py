@@ -0,0 +1,284 @@
+## Benchmarks of process_land_data and kw_flow on synthetic extracts (synthetic_data.py).
+## The flows run as they do in production and their @instrumented tasks record time
+## and memory (instrumentation.py): wall and CPU time, the process RSS high-water mark
+## and, unless --no-tracemalloc, the peak traced allocations above the level at task
+## start (numpy/pandas buffers included, Arrow buffers not). The benchmark reads these
+## records from the JSON run record task_metrics writes for each land, appends each
+## task as one JSON line to the results file together with the commit and the run
+## options, and compares it with the median of the previous runs with the same scale
+## and options, so regressions show up as a ratio next to each task. The task cache is
+## cleared before every run. --flows kernels times the per-customer kernels
+## (order_kernels, numba and numpy) against the pandas groupby path on the same orders.
+##
+##   python benchmark.py --order-lines 1M --lands F01 --repeat 3
+##   python benchmark.py --order-lines 10M --flows rfm --engine index --fail-on-regression
+##   python benchmark.py --order-lines 10M --flows kernels --repeat 5
+import argparse
+import datetime as dt
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+
+FLOWS = ("kw", "rfm")
+KERNELS = "kernels"
+HISTORY_RUNS = 5
+# Tasks faster than this are too noisy to call a regression
+MIN_SECONDS = 0.5
+
+
+def configure(data_dir):
+    # Environment of the pipeline modules; must be set before they are imported
+    work = os.path.join(data_dir, "work")
+    for sub in ["Data", os.path.join("Data", "rfm_labels")]:
+        os.makedirs(os.path.join(work, sub), exist_ok=True)
+    os.environ.update(
+        RFM_CSV_ROOT=os.path.join(data_dir, "CSV"),
+        RFM_CACHE_DIR=os.path.join(work, "cache"),
+        RFM_STATE_DIR=os.path.join(work, "state"),
+        RFM_KW_DIR=os.path.join(work, "Data"),
+        RFM_KW_OUTPUT_DIR=os.path.join(work, "Data"),
+        RFM_LABEL_DIR=os.path.join(work, "Data", "rfm_labels"),
+        RFM_RUN_DIR=os.path.join(work, "runs"),
+    )
+    # paths.py of the synthetic data set (inx_path, ks_path)
+    sys.path.insert(0, data_dir)
+    os.chdir(work)
+    return work
+
+
+def reset_state(work, cold):
+    # In-process memos (workbooks, published KW tables) and the task cache always; the
+    # Parquet caches and the order state only for cold runs
+    import extract_cache
+    import kw_handoff
+    from task_cache import clear_task_cache
+
+    extract_cache._workbooks.clear()
+    kw_handoff._published.clear()
+    clear_task_cache()
+    if cold:
+        for sub in ["cache", "state"]:
+            shutil.rmtree(os.path.join(work, sub), ignore_errors=True)
+
+
+def run_record(flow, land, since):
+    # The newest run record task_metrics wrote for the flow and land since `since`
+    from instrumentation import RUN_DIR
+
+    paths = [
+        path for path in glob.glob(os.path.join(RUN_DIR, f"{flow}_{land}_*.json"))
+        if os.path.getmtime(path) >= since
+    ]
+    if not paths:
+        raise RuntimeError(f"No task metrics of {flow} {land} in {RUN_DIR}")
+    with open(max(paths, key=os.path.getmtime), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def benchmark_records(run):
+    # Instrumented task records of a run record (plus the whole land) -> benchmark rows
+    tasks = run["tasks"] + [
+        {"task": run["flow"], "status": "completed", "wall_s": run["wall_s"], "max_rss_mb": run["max_rss_mb"]}
+    ]
+    return [
+        {
+            "task": t["task"],
+            "status": t["status"],
+            "seconds": t["wall_s"],
+            "cpu_s": t.get("cpu_s"),
+            "peak_mb": t.get("tracemalloc_peak_mb"),
+            "max_rss_mb": t["max_rss_mb"],
+            "rows_out": t.get("rows_out"),
+        }
+        for t in tasks
+    ]
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmarks(args, work):
+    from prefect import flow
+
+    import kw_flow
+    import rfm_pipeline_prefect
+
+    @flow(name="benchmark_kw_land")
+    def kw_land(land):
+        return kw_flow.run_land(land, write_csv=True)
+
+    rfm_options = {
+        "engine": args.engine, "streaming": args.streaming, "incremental": args.incremental, "handoff": args.handoff,
+    }
+    runs = []
+    for repeat in range(args.repeat):
+        for land in args.lands:
+            for name in FLOWS:
+                if name not in args.flows and not (name == "kw" and repeat == 0):
+                    continue
+                reset_state(work, cold=not args.warm)
+                since = time.time() - 1
+                if name == "kw":
+                    # Also run when only rfm is measured: it publishes the KW labels rfm reads
+                    kw_land(land)
+                    run = run_record("kw_flow", land, since)
+                else:
+                    # Like a separate RFM run: the KW labels come from the Arrow file
+                    rfm_pipeline_prefect.process_land_data(land, **rfm_options)
+                    run = run_record("process_land_data", land, since)
+                if name in args.flows:
+                    runs += [{**r, "flow": name, "land": land, "repeat": repeat} for r in benchmark_records(run)]
+                print(f"{name} {land} run {repeat + 1}/{args.repeat} done")
+    return runs
+
+
+def run_kernel_benchmarks(args):
+    # aggregate_orders (pandas groupbys) against aggregate_order_index and pd.cut against
+    # recency_scores, per kernel backend, on the order lines of each land
+    from helper import get_halfyear_bins, get_halfyear_reference_dates
+    from instrumentation import instrumented, task_metrics
+    from order_aggregates import aggregate_orders, order_lines
+    from order_index import aggregate_order_index, build_order_index
+    from order_kernels import numba, recency_scores
+    from schemas import load_extract
+
+    five_years_ago_start, two_years_ago_start, today = get_halfyear_reference_dates()
+    today = pd.Timestamp(today)
+    windows = (five_years_ago_start, two_years_ago_start, today)
+    bin_edges, bin_labels = get_halfyear_bins(today)
+    backends = ["numpy"] + (["numba"] if numba is not None else [])
+
+    runs = []
+    for land in args.lands:
+        orders = order_lines(load_extract(land, "V2AD1056", "rfm"))
+        index = build_order_index(orders)
+        recency = aggregate_orders(orders, *windows)["recency"]
+        if numba is not None:
+            # Compile (or load from the numba cache) outside the timings
+            aggregate_order_index(index, *windows, backend="numba")
+            recency_scores(recency, bin_edges, bin_labels, backend="numba")
+        for repeat in range(args.repeat):
+            since = time.time() - 1
+            with task_metrics(KERNELS, land):
+                instrumented(aggregate_orders, name="aggregate_orders:pandas")(orders, *windows)
+                for backend in backends:
+                    instrumented(aggregate_order_index, name=f"aggregate_order_index:{backend}")(
+                        index, *windows, backend=backend
+                    )
+                for backend in ["pandas"] + backends:
+                    instrumented(recency_scores, name=f"recency_scores:{backend}")(
+                        recency, bin_edges, bin_labels, backend=backend
+                    )
+            run = run_record(KERNELS, land, since)
+            runs += [{**r, "flow": KERNELS, "land": land, "repeat": repeat} for r in benchmark_records(run)]
+        print(f"kernels {land} done")
+    return runs
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    with open(path, encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare(current, history, threshold):
+    # Median seconds per flow/land/task against the median of the last HISTORY_RUNS runs
+    keys = ["flow", "land", "task"]
+    summary = current.groupby(keys, sort=False).agg(
+        seconds=("seconds", "median"), peak_mb=("peak_mb", "max"), max_rss_mb=("max_rss_mb", "max")
+    )
+    if history.empty:
+        summary["baseline"] = float("nan")
+    else:
+        history = history[history["config"] == current["config"].iloc[0]]
+        last_runs = history["run"].drop_duplicates().tail(HISTORY_RUNS)
+        per_run = history[history["run"].isin(last_runs)].groupby(["run"] + keys)["seconds"].median()
+        summary["baseline"] = per_run.groupby(level=keys).median().reindex(summary.index)
+    summary["ratio"] = summary["seconds"] / summary["baseline"]
+    summary["regression"] = (summary["ratio"] > threshold) & (summary["seconds"] >= MIN_SECONDS)
+    return summary.reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark process_land_data and kw_flow on synthetic data")
+    parser.add_argument("--order-lines", default="1M", help="order lines per land, e.g. 100k, 5M, 50M")
+    parser.add_argument("--lands", nargs="+", default=["F01"])
+    parser.add_argument("--flows", nargs="+", choices=FLOWS + (KERNELS,), default=list(FLOWS))
+    parser.add_argument("--engine", default="pandas")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--handoff", choices=["memory", "arrow"], default="memory")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--warm", action="store_true", help="keep the extract cache between repeats")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="time only, without tracemalloc overhead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="synthetic data set (default: <tmp>/rfm_bench_<--order-lines>)")
+    parser.add_argument("--results", default=os.path.join("Data", "benchmarks.jsonl"))
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.abspath(args.data_dir or os.path.join(tempfile.gettempdir(), f"rfm_bench_{args.order_lines}"))
+    results_path = os.path.abspath(args.results)
+    work = configure(data_dir)
+    # Imported after configure(): the pipeline modules read their directories from the
+    # environment at import time
+    from order_kernels import kernel_backend
+    from synthetic_data import generate, parse_scale
+
+    order_lines = parse_scale(args.order_lines)
+    generate(data_dir, order_lines, args.lands, args.seed)
+
+    # The instrumented tasks start tracemalloc on their first call
+    os.environ["RFM_TRACEMALLOC"] = "0" if args.no_tracemalloc else "1"
+    runs = run_benchmarks(args, work) if set(args.flows) & set(FLOWS) else []
+    if KERNELS in args.flows:
+        runs += run_kernel_benchmarks(args)
+
+    config = {
+        "order_lines": order_lines, "lands": args.lands, "engine": args.engine, "streaming": args.streaming,
+        "incremental": args.incremental, "handoff": args.handoff, "kernels": kernel_backend(), "warm": args.warm,
+        "tracemalloc": not args.no_tracemalloc,
+    }
+    run = {
+        "run": dt.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": json.dumps(config, sort_keys=True),
+    }
+    current = pd.DataFrame([{**run, **r} for r in runs])
+    summary = compare(current, load_history(results_path), args.threshold)
+
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    with open(results_path, "a", encoding="utf-8") as f:
+        for record in current.to_dict("records"):
+            f.write(json.dumps(record) + "\n")
+
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(summary.round(3).to_string(index=False))
+    regressions = summary[summary["regression"]]
+    if len(regressions):
+        print(f"{len(regressions)} tasks slower than {args.threshold}x their baseline")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+## KW preparation and RFM scoring of a land in one flow.
+## V2AD1001, the largest extract, is read and normalized once per land and handed to
+## both stages: the KW classification (kw_flow.classify_land) publishes its labels as an
+## Arrow table (kw_handoff) that goes straight on to the RFM scoring
+## (rfm_pipeline_prefect.score_land), which then only reads the orders and Inxmail.
+## Data/kw_<land>.csv is still written unless kw_csv=False. The scoring stages are
+## cached like in main_flow (task_cache), keyed on the six input files of the land.
+from prefect import task, flow
+
+from helper import normalize_addresses
+from kw_flow import classify_land, kw_inputs, read_kw_inputs, write_kw_labels
+from kw_handoff import kw_csv_path, kw_labels, publish_kw_labels
+from instrumentation import instrumented, profiling, task_metrics
+from task_cache import refresh_task_cache, stage_cache
+from frame_handoff import frame_handoff
+from parallel import run_lands
+from rfm_pipeline_prefect import LANDS, check_options, load_data, rfm_inputs, score_land
+from schemas import apply_schema, load_extract
+
+
+@task
+@instrumented
+def load_addresses(land):
+    # One parse of V2AD1001 with the columns of both stages; the KW classification gets
+    # its own SYS_ANLAGE parsed like in kw_flow (mixed formats), the scoring ISO dates
+    addresses = load_extract(land, "V2AD1001", "rfm")
+    kw_addresses = normalize_addresses(addresses[["NUMMER", "SYS_ANLAGE"]].copy(), date_format="mixed")
+    return normalize_addresses(addresses), kw_addresses
+
+
+@task
+@instrumented
+def classify_kw(land, addresses, kw_csv=True):
+    kw, stat, kunden_segment_dict = read_kw_inputs(land)
+    labels = classify_land(land, addresses, kw, stat, kunden_segment_dict)
+    if kw_csv:
+        write_kw_labels(labels, kw_csv_path(land))
+    table = publish_kw_labels(land, labels)
+    return apply_schema(kw_labels(table), "rfm", "kw", source=f"kw_{land}")
+
+
+@flow(name="process_land_combined")
+def process_land_combined(
+    land, incremental=False, streaming=False, chunksize=1_000_000, engine="pandas",
+    excel_per_segment=False, excel_workers=1, label_formats=("csv",), kw_csv=True, handoff="memory",
+):
+    check_options(incremental, streaming, engine)
+    options = {
+        "incremental": incremental, "streaming": streaming, "chunksize": chunksize, "engine": engine,
+        "handoff": handoff,
+    }
+    with (
+        task_metrics("process_land_combined", land),
+        stage_cache(land, combined_inputs(land), **options),
+        frame_handoff(land, handoff),
+    ):
+        addresses, kw_addresses = load_addresses(land)
+        kw = classify_kw(land, kw_addresses, kw_csv)
+        _, v21056, inx, _ = load_data(
+            land, incremental=incremental, streaming=streaming, engine=engine, with_addresses=False
+        )
+        score_land(
+            land, addresses, v21056, inx, kw,
+            incremental=incremental, streaming=streaming, chunksize=chunksize, engine=engine,
+            excel_per_segment=excel_per_segment, excel_workers=excel_workers, label_formats=label_formats,
+        )
+
+
+def combined_inputs(land):
+    # The KW files are written by this flow, so only the extracts and workbooks count
+    return sorted(set(kw_inputs(land)) | set(rfm_inputs(land)[:3]))
+
+
+def run_land(land, **options):
+    # Module-level entry point for the worker processes of run_lands
+    return process_land_combined(land, **options)
+
+
+@flow(name="kw_rfm_flow")
+def kw_rfm_flow(
+    incremental=False, streaming=False, chunksize=1_000_000, engine="pandas", workers=1, memory_limit_gb=None,
+    excel_per_segment=False, excel_workers=1, label_formats=("csv",), kw_csv=True, profile_tasks=None,
+    refresh_cache=False, handoff="memory",
+):
+    # workers > 1 (None: one per land) runs the lands in parallel processes, each capped
+    # at memory_limit_gb; profile_tasks: task names (or "*") to run under cProfile;
+    # refresh_cache: True, a land or a list of lands whose cached stage results are dropped
+    # before the run; handoff: "memory" or "arrow" (frames between the stages as
+    # memory-mapped Arrow files); chunksize: V2AD1056 lines per chunk in streaming mode
+    # and when the incremental order state is rebuilt
+    with profiling(profile_tasks):
+        refresh_task_cache(refresh_cache, LANDS)
+        run_lands(
+            run_land, LANDS, workers=workers, memory_limit_gb=memory_limit_gb,
+            incremental=incremental, streaming=streaming, chunksize=chunksize, engine=engine,
+            excel_per_segment=excel_per_segment, excel_workers=excel_workers, label_formats=label_formats,
+            kw_csv=kw_csv, handoff=handoff,
+        )
+
+if __name__ == "__main__":
+    kw_rfm_flow()
@@ -0,0 +1,132 @@
+## Segmented Excel export of the RFM result.
+## The frame is partitioned once by sorting on the segment codes, and every segment is
+## written row by row into an xlsxwriter workbook in constant_memory mode, so only the
+## current row is held by the writer. A segment longer than an Excel sheet is split
+## across numbered sheets (or numbered files). With one workbook per segment the
+## workbooks can be written in parallel worker processes, which are spawned like the
+## land workers (parallel.py) because the export runs inside a Prefect flow.
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+
+EXCEL_MAX_ROWS = 1_048_576
+SHEET_ROWS = EXCEL_MAX_ROWS - 1  # one row for the header
+SHEET_NAME_LENGTH = 31
+
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+DATE_FORMAT = {"num_format": "yyyy-mm-dd"}
+CURRENCY_FORMAT = {"num_format": "#,##0 [$€-1];[Red]-#,##0 [$€-1]"}
+YELLOW_FILL = {"bg_color": "#FFFF00"}
+
+
+def partition_segments(df, column, labels):
+    # One stable sort on the segment codes instead of one boolean scan per label.
+    # Rows with a label outside `labels` are left out, like the per-label filters did.
+    codes = pd.Categorical(df[column], categories=labels).codes
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+    ordered = df.iloc[order]
+    return {
+        label: ordered.iloc[start:end] for label, start, end in zip(labels, bounds[:-1], bounds[1:])
+    }
+
+
+def shard(frame, max_rows=SHEET_ROWS):
+    # Slices of at most max_rows rows, an empty frame gives one empty slice
+    return [frame.iloc[start:start + max_rows] for start in range(0, max(len(frame), 1), max_rows)]
+
+
+def shard_name(name, number, max_length=None):
+    suffix = "" if number == 1 else f" ({number})"
+    if max_length is not None:
+        name = name[: max_length - len(suffix)]
+    return f"{name}{suffix}"
+
+
+def workbook_formats(workbook):
+    return {
+        "header": workbook.add_format(HEADER_FORMAT),
+        "date": workbook.add_format(DATE_FORMAT),
+        "currency": workbook.add_format(CURRENCY_FORMAT),
+        "yellow": workbook.add_format(YELLOW_FILL),
+    }
+
+
+def format_segment_sheet(worksheet, formats):
+    # Column layout of the segment sheets; must be set before any row is written
+    worksheet.set_column("A:X", 22)
+    worksheet.set_column("G:G", 22, formats["date"])
+    worksheet.set_column("H:H", 22, formats["date"])
+    for col in ["J", "N", "P", "R"]:
+        worksheet.set_column(f"{col}:{col}", 22, formats["currency"])
+    # Highlight and hide M:P and T:U
+    worksheet.set_column("M:P", 22, formats["yellow"])
+    worksheet.set_column("M:P", 22, None, {"hidden": True})
+    worksheet.set_column("T:U", 22, formats["yellow"])
+    worksheet.set_column("T:U", 22, None, {"hidden": True})
+    worksheet.set_column("X:X", 22)
+
+
+def cell_values(frame):
+    # Columns as Python objects with None for missing values (written as empty cells)
+    return [
+        frame[col].astype(object).where(frame[col].notna(), None).tolist() for col in frame.columns
+    ]
+
+
+def write_sheet(workbook, name, frame, formats):
+    worksheet = workbook.add_worksheet(name)
+    format_segment_sheet(worksheet, formats)
+    worksheet.write_row(0, 0, [str(col) for col in frame.columns], formats["header"])
+    for row, values in enumerate(zip(*cell_values(frame)), start=1):
+        worksheet.write_row(row, 0, values)
+    return worksheet
+
+
+def write_segment_workbook(path, segments, max_rows=SHEET_ROWS):
+    # segments: list of (label, frame); each label gets one sheet per max_rows rows
+    tmp = f"{path}.tmp.xlsx"
+    workbook = xlsxwriter.Workbook(tmp, {"constant_memory": True})
+    formats = workbook_formats(workbook)
+    for label, frame in segments:
+        for number, part in enumerate(shard(frame, max_rows), start=1):
+            write_sheet(workbook, shard_name(label, number, SHEET_NAME_LENGTH), part, formats)
+    workbook.close()
+    os.replace(tmp, path)
+    return path
+
+
+def segment_workbook_path(path, label, number=1):
+    base, ext = os.path.splitext(path)
+    suffix = "" if number == 1 else f"_{number}"
+    return f"{base}_{label}{suffix}{ext}"
+
+
+def export_segments(df, path, labels, column="rfm_label", max_rows=SHEET_ROWS, per_file=False, workers=1):
+    # One workbook with a sheet per label, or with per_file=True one workbook per label
+    # (and per max_rows rows), written by `workers` processes. Returns the written paths.
+    segments = partition_segments(df, column, labels)
+    if not per_file:
+        return [write_segment_workbook(path, list(segments.items()), max_rows)]
+
+    jobs = [
+        (segment_workbook_path(path, label, number), [(label, part)])
+        for label, frame in segments.items()
+        for number, part in enumerate(shard(frame, max_rows), start=1)
+    ]
+    if workers is None or workers <= 1:
+        return [write_segment_workbook(job_path, parts, max_rows) for job_path, parts in jobs]
+
+    written = []
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = [pool.submit(write_segment_workbook, job_path, parts, max_rows) for job_path, parts in jobs]
+        for future in as_completed(futures):
+            written.append(future.result())
+    return sorted(written)
@@ -0,0 +1,224 @@
+## Columnar cache for the cp850 CSV extracts under /Volumes/MARAL/CSV.
+## The first read of an extract parses the CSV and stores it as Parquet next to a
+## small JSON file with the source fingerprint; later reads serve the Parquet copy
+## (only the requested columns) until the source file changes.
+## The Excel lookup workbooks (Inxmail list, segment mapping) go through the same cache
+## and are additionally kept in memory, so openpyxl parses each of them at most once.
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import run_logger
+
+try:
+    import pyarrow  # noqa: F401 - Parquet engine
+except ImportError:
+    pyarrow = None
+
+
+CSV_ROOT = os.environ.get("RFM_CSV_ROOT", "/Volumes/MARAL/CSV")
+CACHE_DIR = os.environ.get("RFM_CACHE_DIR", "Data/cache")
+ENC = "cp850"
+SEP = ";"
+
+_workbooks = {}
+_workbooks_lock = threading.Lock()
+
+
+def extract_path(land, name):
+    return os.path.join(CSV_ROOT, land, f"{name}.csv")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path, hash_source=False):
+    # Size + mtime are enough for the nightly exports, the hash is opt-in
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if hash_source:
+        fingerprint["sha1"] = file_digest(path)
+    return fingerprint
+
+
+def cache_files(path, read_options):
+    # One cache entry per source file and parse options (columns are projected on read)
+    key = json.dumps(
+        {"path": os.path.abspath(path), "options": read_options}, sort_keys=True, default=str
+    )
+    key = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    name = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(CACHE_DIR, f"{parent}_{name}_{key}")
+    return f"{base}.parquet", f"{base}.json"
+
+
+def read_cached_meta(meta_path):
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(df, parquet_path, meta_path, fingerprint):
+    # Write to temporary files first so an interrupted run never leaves a half cache behind
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    tmp_parquet = f"{parquet_path}.tmp"
+    df.to_parquet(tmp_parquet, index=False)
+    os.replace(tmp_parquet, parquet_path)
+    tmp_meta = f"{meta_path}.tmp"
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "fingerprint": fingerprint,
+                "columns": list(df.columns),
+                "skipped_lines": df.attrs.get("skipped_lines"),
+            },
+            f,
+        )
+    os.replace(tmp_meta, meta_path)
+
+
+def scan_lines(path, sep=SEP, chunk_size=1 << 26):
+    # One pass over the raw bytes: physical line numbers (0 = header) with more fields
+    # than the header, the number of non-blank data lines and whether the file has
+    # quote characters (then separators inside quoted fields cannot be told apart)
+    sep_byte, quote_byte, newline_byte = ord(sep), ord('"'), ord("\n")
+    bad, header_seps, data_lines = [], None, 0
+    line, carry_seps, carry_len, quoted = 0, 0, 0, False
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            quoted = quoted or bool((data == quote_byte).any())
+            newlines = np.flatnonzero(data == newline_byte)
+            seps = np.flatnonzero(data == sep_byte)
+            if len(newlines) == 0:
+                carry_seps += len(seps)
+                carry_len += len(data)
+                continue
+            seps_per_line = np.diff(np.searchsorted(seps, newlines), prepend=0)
+            seps_per_line[0] += carry_seps
+            line_len = np.diff(newlines, prepend=-1)
+            line_len[0] += carry_len
+            if header_seps is None:
+                header_seps = int(seps_per_line[0])
+            numbers = np.arange(line, line + len(newlines))
+            bad.append(numbers[seps_per_line > header_seps])
+            data_lines += int(((line_len > 1) & (numbers > 0)).sum())
+            line += len(newlines)
+            carry_seps = len(seps) - int(np.searchsorted(seps, newlines[-1]))
+            carry_len = len(data) - int(newlines[-1]) - 1
+    if carry_len > 0 and line > 0:
+        # Last line without a trailing newline
+        if carry_seps > header_seps:
+            bad.append(np.array([line]))
+        data_lines += 1
+    bad = np.concatenate(bad) if bad else np.array([], dtype=np.int64)
+    return bad, data_lines, quoted
+
+
+def parse_extract(path, columns, read_options):
+    # pd.read_csv(path, usecols=columns, **read_options). With on_bad_lines="skip" the
+    # number of dropped lines is kept in df.attrs["skipped_lines"]. The C parser stops
+    # flagging lines with too many fields once usecols is given, so those lines are
+    # found by counting separators first and passed as skiprows.
+    if read_options.get("on_bad_lines") != "skip":
+        return pd.read_csv(path, usecols=columns, **read_options)
+
+    bad, data_lines, quoted = scan_lines(path, read_options["sep"])
+    if quoted:
+        # Separators may sit inside quoted fields: full parse, skipped lines estimated
+        df = pd.read_csv(path, **read_options)
+        if columns is not None:
+            df = df[list(columns)]
+        df.attrs["skipped_lines"] = max(data_lines - len(df), 0)
+        return df
+
+    options = {k: v for k, v in read_options.items() if k != "on_bad_lines"}
+    df = pd.read_csv(path, usecols=columns, skiprows=bad.tolist(), **options)
+    df.attrs["skipped_lines"] = len(bad)
+    return df
+
+
+def read_extract(path, columns=None, hash_source=False, use_cache=True, project_parse=False, **read_csv_kwargs):
+    # Drop-in for pd.read_csv(path, sep=";", encoding="cp850", usecols=columns, ...).
+    # The full extract is parsed and cached once and projected on read; project_parse=True
+    # parses and caches only `columns` instead, for wide files of which each run needs
+    # a small, changing subset.
+    read_options = {"sep": SEP, "encoding": ENC, "low_memory": False, **read_csv_kwargs}
+    if not use_cache or pyarrow is None:
+        return parse_extract(path, columns, read_options)
+
+    parse_columns = list(columns) if project_parse and columns is not None else None
+    cache_options = read_options if parse_columns is None else {**read_options, "usecols": sorted(parse_columns)}
+    parquet_path, meta_path = cache_files(path, cache_options)
+    fingerprint = source_fingerprint(path, hash_source=hash_source)
+    meta = read_cached_meta(meta_path)
+    if meta is not None and meta["fingerprint"] == fingerprint and os.path.exists(parquet_path):
+        if columns is not None:
+            missing = [c for c in columns if c not in meta["columns"]]
+            if missing:
+                raise ValueError(f"Columns {missing} not found in {path}")
+        df = pd.read_parquet(parquet_path, columns=columns)
+        if meta.get("skipped_lines") is not None:
+            df.attrs["skipped_lines"] = meta["skipped_lines"]
+        return df
+
+    # Cache miss or stale cache: parse the extract once and store it columnar
+    df = parse_extract(path, parse_columns, read_options)
+    try:
+        write_cache(df, parquet_path, meta_path, fingerprint)
+    except (OSError, ValueError, TypeError) as e:
+        run_logger().warning(f"Could not cache {path}: {e}")
+    if columns is not None:
+        attrs = df.attrs
+        df = df[list(columns)]
+        df.attrs = attrs
+    return df
+
+
+def load_workbook(path, fingerprint, use_cache, read_excel_kwargs):
+    if not use_cache or pyarrow is None:
+        return pd.read_excel(path, **read_excel_kwargs)
+    parquet_path, meta_path = cache_files(path, {"read_excel": read_excel_kwargs})
+    meta = read_cached_meta(meta_path)
+    if meta is not None and meta["fingerprint"] == fingerprint and os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+
+    df = pd.read_excel(path, **read_excel_kwargs)
+    try:
+        write_cache(df, parquet_path, meta_path, fingerprint)
+    except (OSError, ValueError, TypeError) as e:
+        run_logger().warning(f"Could not cache {path}: {e}")
+    return df
+
+
+def read_workbook(path, columns=None, use_cache=True, **read_excel_kwargs):
+    # Drop-in for pd.read_excel(path, usecols=columns, ...). The parsed sheet is shared by
+    # all lands of a run and persisted as Parquet until the workbook changes.
+    fingerprint = source_fingerprint(path)
+    key = json.dumps(
+        [os.path.abspath(path), read_excel_kwargs, fingerprint], sort_keys=True, default=str
+    )
+    with _workbooks_lock:
+        df = _workbooks.get(key)
+        if df is None:
+            df = load_workbook(path, fingerprint, use_cache, read_excel_kwargs)
+            _workbooks[key] = df
+    if columns is not None:
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} not found in {path}")
+        df = df[list(columns)]
+    # Callers modify their frame (keys, dtypes), the shared one stays untouched
+    return df.copy()
@@ -0,0 +1,164 @@
+## Arrow IPC handoff of the DataFrames passed between the stage tasks.
+## Inside `frame_handoff(land, "arrow")` the tasks decorated with @arrow_frames (below
+## @task, above @instrumented) write the frames they return to uncompressed Arrow IPC
+## files in Data/cache/frames/<land> and return a FrameHandle (path, rows, columns)
+## instead. The next task memory-maps the file: persisted task results and process
+## based task runners only pickle the handle, and the string and category columns stay
+## on the page cache instead of being copied into every consumer. Numeric columns
+## are still converted into pandas blocks, because the stages modify their inputs.
+## Frames Arrow cannot hold (mixed-type object columns) are passed on in memory.
+##
+## Files of a scope are deleted when it ends, except those returned by tasks whose
+## results are persisted (the cached stages): their cached results are handles to
+## them, and the task cache removes them with its own entries (clear_frames).
+import contextvars
+import functools
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from extract_cache import CACHE_DIR
+from instrumentation import run_logger
+
+
+FRAME_DIR = os.path.join(CACHE_DIR, "frames")
+HANDOFFS = ("memory", "arrow")
+
+_scope = contextvars.ContextVar("frame_handoff", default=None)
+
+
+class FrameHandle:
+    # What a task returns instead of a DataFrame; small enough to pickle
+
+    def __init__(self, path, rows, columns):
+        self.path = path
+        self.rows = rows
+        self.columns = columns
+
+    def __repr__(self):
+        return f"FrameHandle({os.path.basename(self.path)}, {self.rows} rows)"
+
+
+def write_ipc(table, path):
+    # Uncompressed so that readers can memory-map the buffers
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return path
+
+
+def read_ipc(path):
+    # Memory-mapped, the columns point into the page cache instead of being copied
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def persisted_result():
+    # True inside a task run whose result is persisted, i.e. may be served again later
+    try:
+        from prefect.context import TaskRunContext
+    except ImportError:
+        return False
+    context = TaskRunContext.get()
+    return context is not None and bool(context.persist_result)
+
+
+def to_handle(frame, name):
+    # DataFrame -> FrameHandle in the current scope; anything else is returned as is
+    scope = _scope.get()
+    if scope is None or not isinstance(frame, pd.DataFrame):
+        return frame
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        run_logger().warning(f"{name}: frame kept in memory, not representable in Arrow ({e})")
+        return frame
+    path = os.path.join(scope["dir"], f"{name}-{uuid.uuid4().hex[:12]}.arrow")
+    write_ipc(table, path)
+    if not persisted_result():
+        scope["paths"].append(path)
+    return FrameHandle(path, len(frame), list(frame.columns))
+
+
+def resolve(value):
+    # FrameHandle -> DataFrame on the memory-mapped file; anything else as is
+    if not isinstance(value, FrameHandle):
+        return value
+    if not os.path.exists(value.path):
+        raise FileNotFoundError(
+            f"Handed-off frame {value.path} is gone; refresh the task cache of the land"
+        )
+    return read_ipc(value.path).to_pandas()
+
+
+def convert(value, func):
+    # func on the value, or on each element of a returned/passed tuple or list
+    if isinstance(value, (tuple, list)):
+        return type(value)(func(v) for v in value)
+    return func(value)
+
+
+def arrow_frames(func):
+    # Place below @task: @task @arrow_frames @instrumented def final_processing(...)
+    name = func.__name__
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        args = [convert(a, resolve) for a in args]
+        kwargs = {k: convert(v, resolve) for k, v in kwargs.items()}
+        result = func(*args, **kwargs)
+        return convert(result, lambda v: to_handle(v, name))
+
+    return run
+
+
+@contextmanager
+def frame_handoff(land, handoff="memory"):
+    # Scope of one land; "memory" passes the frames as they are
+    if handoff not in HANDOFFS:
+        raise ValueError(f"Unknown frame handoff {handoff!r}, expected one of {HANDOFFS}")
+    if handoff == "memory":
+        yield
+        return
+    if pa is None:
+        raise ImportError("The arrow frame handoff needs pyarrow")
+    scope = {"dir": os.path.join(FRAME_DIR, land), "paths": []}
+    token = _scope.set(scope)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+        for path in scope["paths"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def clear_frames(lands=None, older_than_days=None):
+    # Removes the handed-off frames of the given lands (all if None), optionally only
+    # those older than older_than_days
+    if not os.path.isdir(FRAME_DIR):
+        return
+    cutoff = None if older_than_days is None else time.time() - older_than_days * 86400
+    for land in os.listdir(FRAME_DIR):
+        if lands is not None and land not in lands:
+            continue
+        land_dir = os.path.join(FRAME_DIR, land)
+        if cutoff is None:
+            shutil.rmtree(land_dir, ignore_errors=True)
+            continue
+        for name in os.listdir(land_dir):
+            path = os.path.join(land_dir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
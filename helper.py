@@ -1,8 +1,14 @@
 import pandas as pd
+import numpy as np
+import os
+import re
+import json
 import datetime as dt
 from dateutil.relativedelta import relativedelta
 from datetime import  date
 
+from instrumentation import run_logger
+
 
 anrede = {
     "1": "Herrn",
@@ -25,163 +31,173 @@ def process_anrede(value):
     return value  # Return non-numeric values as they are
 
 
-def assign_age(aa):
-    current_date = dt.datetime.now()
-    aa["age"] = aa["geburt"].apply(
-        lambda x: current_date.year
-        - x.year
-        - ((current_date.month, current_date.day) < (x.month, x.day))
+def normalize_anrede(values):
+    # Normalize and translate ANREDE once per distinct value instead of per row
+    codes, uniques = pd.factorize(
+        pd.Series(values).to_numpy(dtype=object), use_na_sentinel=False
+    )
+    normalized = np.array(
+        [anrede.get(v, v) for v in map(process_anrede, uniques)], dtype=object
     )
+    return pd.Series(normalized[codes], index=pd.Series(values).index)
 
-    # Define age groups
-    def assign_age_group(age):
-        if age <= 18:
-            return "0-18"
-        elif age <= 30:
-            return "19-30"
-        elif age <= 50:
-            return "31-50"
-        elif age <= 65:
-            return "51-65"
-        elif age > 65:
-            return "65+"
-        else:
-            return "Keine Angabe"
 
-    aa["age_group"] = aa["age"].apply(assign_age_group)
+## Age groups as right-closed bins: <=18, 19-30, 31-50, 51-65, 65+
+AGE_BINS = [-np.inf, 18, 30, 50, 65, np.inf]
+AGE_LABELS = ["0-18", "19-30", "31-50", "51-65", "65+"]
+NO_AGE = "Keine Angabe"
+
+
+def assign_age(aa, today=None):
+    today = pd.Timestamp.now() if today is None else pd.Timestamp(today)
+    geburt = pd.to_datetime(aa["geburt"], errors="coerce")
+
+    # Subtract a year if this year's birthday is still ahead
+    birthday_ahead = (geburt.dt.month * 100 + geburt.dt.day) > (today.month * 100 + today.day)
+    aa["age"] = today.year - geburt.dt.year - birthday_ahead.astype(int)
+
+    # Missing birth dates always end up as "Keine Angabe"
+    age_group = pd.cut(aa["age"], bins=AGE_BINS, labels=AGE_LABELS)
+    aa["age_group"] = age_group.cat.add_categories(NO_AGE).fillna(NO_AGE)
     return aa
 
 
-def assign_sources(aa):
-    aa["SOURCE"] = ""
-
-    ## Amazon
-    aa.loc[(aa["QUELLE"].str[3:] == "921am"), "SOURCE"] = "Amazon"
-    ## AWIN
-    aa.loc[(aa["QUELLE"].str[3:6] == "929"), "SOURCE"] = "AWIN"
-    ## Blätterkatalog
-    aa.loc[(aa["QUELLE"].str[3:6] == "938"), "SOURCE"] = "Blätterkatalog"
-    ## Corporate Benefits
-    aa.loc[(aa["QUELLE"].str[3:6] == "943"), "SOURCE"] = "Corporate Benefits"
-    ## Genussmagazin
-    aa.loc[(aa["QUELLE"].str.contains(r"936gm|925gm", case=False, regex=True, na=False)),"SOURCE"] = "Genussmagazin"
-    ## Google Shopping
-    aa.loc[(aa["QUELLE"].str.contains(r"926gs|924gs", case=False, regex=True, na=False)),"SOURCE"] = "Google Shopping"
-    ## Internet Import
-    aa.loc[(aa["QUELLE"].str.contains(r"20i|INT", case=False, regex=True, na=False)), "SOURCE"] = "Internet Import"
-    ## Inventur Trost
-    aa.loc[(aa["QUELLE"].str[3:] == "022iv"), "SOURCE"] = "Inventur Trost"
-    ## Lionshome
-    aa.loc[(aa["QUELLE"].str[3:] == "921lh"), "SOURCE"] = "Lionshome"
-    ## Newsletter
-    aa.loc[(aa["QUELLE"].str[3:6] == "923"), "SOURCE"] = "Newsletter"
-    ## Newsletter Angebot
-    aa.loc[(aa["QUELLE"].str[3:] == "923na"), "SOURCE"] = "Newsletter Angebot"
-    ## Newsletter Rezept
-    aa.loc[(aa["QUELLE"].str[3:] == "923nr"), "SOURCE"] = "Newsletter Rezept"
-    ## Newsletter Thema
-    aa.loc[(aa["QUELLE"].str[3:] == "923nt"), "SOURCE"] = "Newsletter Thema"
-    ## Otto
-    aa.loc[(aa["QUELLE"].str[3:] == "921ot"), "SOURCE"] = "Otto"
-    ## Google SEA
-    aa.loc[(aa["QUELLE"].str[3:6] == "926"), "SOURCE"] = "Google SEA"
-    ## SEA Brand
-    aa.loc[(aa["QUELLE"].str[3:] == "926br"), "SOURCE"] = "SEA Brand"
-    ## SEA Non-Brand
-    aa.loc[(aa["QUELLE"].str[3:] == "926sa"), "SOURCE"] = "SEA Non-Brand"
-    ## SEO
-    aa.loc[(aa["QUELLE"].str[3:6] == "927"), "SOURCE"] = "SEO"
-    ## SEO Brand
-    aa.loc[(aa["QUELLE"].str[3:] == "927br"), "SOURCE"] = "SEO Brand"
-    ## SEO Non-Brand
-    aa.loc[(aa["QUELLE"].str[3:] == "927so"), "SOURCE"] = "SEO Non-Brand"
-    ## Social Media
-    aa.loc[(aa["QUELLE"].str[3:6] == "925"), "SOURCE"] = "Social Media"
-    ## Pinterest
-    aa.loc[(aa["QUELLE"].str.contains(
-                r"925pi|925pt|932aa|pinterest", regex=True, case=False, na=False)),"SOURCE"] = "Pinterest"
-    ## Instagram
-    aa.loc[
-        (aa["QUELLE"].str.contains(r"925ig", regex=True, case=False, na=False)),"SOURCE"] = "Instagram"
-    ## Facebook
-    aa.loc[
-        (aa["QUELLE"].str.contains(r"925fb", regex=True, case=False, na=False)),"SOURCE"] = "Facebook"
-    ## Sovendus
-    aa.loc[
-        (aa["QUELLE"].str.contains(r"928so|sov", regex=True, case=False, na=False)),"SOURCE"] = "Sovendus"
-
-    ## Fremdadressen
-    aa.loc[
-        (aa["QUELLE"].str[3].isin(["1", "2", "3", "4"])) & (aa["QUELLE"].str[4:6].isin(["01"])),"SOURCE"] = "Fremdadressen"
-    ## Katalog und Karte
-    aa.loc[
-        (aa["QUELLE"].str[3].isin(["1", "2", "3", "4"])) & (aa["QUELLE"].str[4:6].isin(["02", "03", "04"])), "SOURCE"] = "Katalog und Karte"
-    ## Beilage
-    aa.loc[(aa["QUELLE"].str[3:6].isin(["011", "012", "013"])), "SOURCE"] = "Beilage"
-    aa.loc[(aa["QUELLE"].str[3:6].isin(["040"])), "SOURCE"] = "Beilage"
-    ## Geburtstagskarte
-    aa.loc[(aa["QUELLE"].str[3:6] == "060"), "SOURCE"] = "Geburtstagskarte"
-    ## Kataloganforderung
-    aa.loc[(aa["QUELLE"].str[3:6] == "000"), "SOURCE"] = "Kataloganforderung"
-    ## Freundschaftswerbung
-    aa.loc[(aa["QUELLE"].str[3:6] == "030"), "SOURCE"] = "Freundschaftswerbung"
-    ## Mailing
-    aa.loc[(aa["QUELLE"].str[3:6] == "014"), "SOURCE"] = "Mailing"
-    ## Blackweek
-    aa.loc[(aa["QUELLE"].str[3:6] == "016"), "SOURCE"] = "Blackweek"
-    ## Altcode
-    aa.loc[(aa["SOURCE"] == ""), "SOURCE"] = "Altcode"
-
-    aa["ON-OFF"] = ""
-    ## SOURCE -> Online/Offline
-    aa.loc[
-        aa["SOURCE"].isin(
-            [
-                "Amazon",
-                "AWIN",
-                "Blätterkatalog",
-                "Corporate Benefits",
-                "Genussmagazin",
-                "Google Shopping",
-                "Internet Import",
-                "Inventur Trost",
-                "Lionshome",
-                "Newsletter",
-                "Newsletter Angebot",
-                "Newsletter Rezept",
-                "Newsletter Thema",
-                "Otto",
-                "Google SEA",
-                "SEA Brand",
-                "SEA Non-Brand",
-                "SEO",
-                "SEO Brand",
-                "SEO Non-Brand",
-                "Social Media",
-                "Pinterest",
-                "Instagram",
-                "Facebook",
-                "Sovendus",
-            ]
-        ),
-        "ON-OFF",
-    ] = "Online"
-    aa.loc[
-        aa["SOURCE"].isin(
-            [
-                "Fremdadressen",
-                "Katalog und Karte",
-                "Beilage",
-                "Geburtstagskarte",
-                "Kataloganforderung",
-                "Freundschaftswerbung",
-                "Mailing",
-                "Blackweek",
-            ]
-        ),
-        "ON-OFF",
-    ] = "Offline"
-    aa.loc[aa["SOURCE"].isin(["Altcode"]), "ON-OFF"] = "Altcode"
+## QUELLE -> SOURCE rules, a later matching rule overrides an earlier one.
+## Kinds: "rest" compares QUELLE[3:], "code" checks QUELLE[3:6] against a list,
+## "contains" is a case-insensitive regex search and "channel" checks
+## QUELLE[3] and QUELLE[4:6] against two lists.
+SOURCE_RULES = [
+    ("Amazon", "rest", "921am"),
+    ("AWIN", "code", ["929"]),
+    ("Blätterkatalog", "code", ["938"]),
+    ("Corporate Benefits", "code", ["943"]),
+    ("Genussmagazin", "contains", r"936gm|925gm"),
+    ("Google Shopping", "contains", r"926gs|924gs"),
+    ("Internet Import", "contains", r"20i|INT"),
+    ("Inventur Trost", "rest", "022iv"),
+    ("Lionshome", "rest", "921lh"),
+    ("Newsletter", "code", ["923"]),
+    ("Newsletter Angebot", "rest", "923na"),
+    ("Newsletter Rezept", "rest", "923nr"),
+    ("Newsletter Thema", "rest", "923nt"),
+    ("Otto", "rest", "921ot"),
+    ("Google SEA", "code", ["926"]),
+    ("SEA Brand", "rest", "926br"),
+    ("SEA Non-Brand", "rest", "926sa"),
+    ("SEO", "code", ["927"]),
+    ("SEO Brand", "rest", "927br"),
+    ("SEO Non-Brand", "rest", "927so"),
+    ("Social Media", "code", ["925"]),
+    ("Pinterest", "contains", r"925pi|925pt|932aa|pinterest"),
+    ("Instagram", "contains", r"925ig"),
+    ("Facebook", "contains", r"925fb"),
+    ("Sovendus", "contains", r"928so|sov"),
+    ("Fremdadressen", "channel", (["1", "2", "3", "4"], ["01"])),
+    ("Katalog und Karte", "channel", (["1", "2", "3", "4"], ["02", "03", "04"])),
+    ("Beilage", "code", ["011", "012", "013"]),
+    ("Beilage", "code", ["040"]),
+    ("Geburtstagskarte", "code", ["060"]),
+    ("Kataloganforderung", "code", ["000"]),
+    ("Freundschaftswerbung", "code", ["030"]),
+    ("Mailing", "code", ["014"]),
+    ("Blackweek", "code", ["016"]),
+]
+ALTCODE = "Altcode"
+
+ONLINE_SOURCES = [
+    "Amazon", "AWIN", "Blätterkatalog", "Corporate Benefits", "Genussmagazin",
+    "Google Shopping", "Internet Import", "Inventur Trost", "Lionshome",
+    "Newsletter", "Newsletter Angebot", "Newsletter Rezept", "Newsletter Thema",
+    "Otto", "Google SEA", "SEA Brand", "SEA Non-Brand", "SEO", "SEO Brand",
+    "SEO Non-Brand", "Social Media", "Pinterest", "Instagram", "Facebook", "Sovendus",
+]
+OFFLINE_SOURCES = [
+    "Fremdadressen", "Katalog und Karte", "Beilage", "Geburtstagskarte",
+    "Kataloganforderung", "Freundschaftswerbung", "Mailing", "Blackweek",
+]
+
+
+def compile_source_rules(rules=None):
+    # Turn SOURCE_RULES into (source, description, match) with regexes compiled once
+    if rules is None:
+        rules = SOURCE_RULES
+    compiled = []
+    for source, kind, value in rules:
+        if kind == "rest":
+            match = lambda q, value=value: q[3:] == value
+        elif kind == "code":
+            match = lambda q, codes=frozenset(value): q[3:6] in codes
+        elif kind == "contains":
+            match = lambda q, rx=re.compile(value, re.IGNORECASE): rx.search(q) is not None
+        elif kind == "channel":
+            match = lambda q, first=frozenset(value[0]), rest=frozenset(value[1]): (
+                q[3:4] in first and q[4:6] in rest
+            )
+        else:
+            raise ValueError(f"Unknown source rule kind '{kind}' for {source}")
+        compiled.append((source, f"{kind}:{value}", match))
+    return compiled
+
+
+COMPILED_SOURCE_RULES = compile_source_rules()
+
+
+def classify_sources(quelle, rules=None):
+    # Classify each distinct QUELLE once and map the result back through the code array
+    if rules is None:
+        rules = COMPILED_SOURCE_RULES
+    codes, uniques = pd.factorize(pd.Series(quelle).to_numpy(dtype=object))
+
+    # Rule index per distinct code, len(rules) means Altcode (last slot is for missing QUELLE)
+    altcode_rule = len(rules)
+    rule_of_code = np.full(len(uniques) + 1, altcode_rule, dtype=np.int64)
+    for i, q in enumerate(uniques):
+        if not isinstance(q, str):
+            continue
+        for j in range(len(rules) - 1, -1, -1):
+            if rules[j][2](q):
+                rule_of_code[i] = j
+                break
+    row_rule = rule_of_code[codes]
+
+    # SOURCE and ON-OFF as categoricals
+    rule_sources = [source for source, _, _ in rules] + [ALTCODE]
+    categories = list(dict.fromkeys(rule_sources))
+    category_of_rule = np.array([categories.index(s) for s in rule_sources])
+    source = pd.Categorical.from_codes(category_of_rule[row_rule], categories=categories)
+    on_off_of_source = [
+        "Online" if s in ONLINE_SOURCES else "Offline" if s in OFFLINE_SOURCES
+        else ALTCODE if s == ALTCODE else ""
+        for s in categories
+    ]
+    on_off = pd.Categorical(np.asarray(on_off_of_source, dtype=object)[source.codes])
+
+    # Hits per rule: distinct codes, rows and the most frequent codes
+    code_rows = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    code_rule = rule_of_code[:-1]
+    top_codes = []
+    for j in range(len(rule_sources)):
+        members = np.flatnonzero(code_rule == j)
+        members = members[np.argsort(-code_rows[members], kind="stable")[:10]]
+        top_codes.append([uniques[m] for m in members])
+    rule_hits = pd.DataFrame(
+        {
+            "SOURCE": rule_sources,
+            "rule": [description for _, description, _ in rules] + ["no match"],
+            "codes": np.bincount(code_rule, minlength=len(rule_sources)),
+            "rows": np.bincount(row_rule, minlength=len(rule_sources)),
+            "top_codes": top_codes,
+        }
+    )
+    return source, on_off, rule_hits
+
+
+def assign_sources(aa, return_hits=False):
+    source, on_off, rule_hits = classify_sources(aa["QUELLE"])
+    aa["SOURCE"] = source
+    aa["ON-OFF"] = on_off
+    if return_hits:
+        return aa, rule_hits
     return aa
 
 
@@ -193,28 +209,103 @@ def not_yet_bought(auftrag):
     return len(auftrag) == 0
 
 
-def seasonal_ostern(dates):
-    ostern = {2, 3, 4}
-    unique_months = set(dates.dt.month.unique())
-    years = dates.dt.year.nunique()
-    if years >= 2 and unique_months.issubset(ostern):
-        return True
-    return False
+## Season definitions for the vectorized seasonality detection (name -> months)
+SEASONS = {
+    "ostern": (2, 3, 4),
+    "weihnachten": (10, 11, 12),
+}
+## Bit set for orders without a date, so they never fall inside a season
+MISSING_MONTH_BIT = 1 << 12
+
+
+def month_bits(months):
+    # One bit per month (January = bit 0), missing months get MISSING_MONTH_BIT
+    months = np.asarray(months, dtype="float64")
+    bits = np.full(len(months), MISSING_MONTH_BIT, dtype=np.int64)
+    valid = ~np.isnan(months)
+    bits[valid] = np.left_shift(1, months[valid].astype(np.int64) - 1)
+    return bits
+
+
+def season_masks(nummer, dates):
+    # Per customer: bitmask of the months ordered in and number of distinct order years
+    codes, uniques = pd.factorize(pd.Series(nummer).to_numpy(), sort=True)
+    dates = pd.Series(pd.to_datetime(dates).to_numpy())
+    valid = codes >= 0
+    codes = codes[valid]
+    dates = dates[valid]
+
+    month_mask = np.zeros(len(uniques), dtype=np.int64)
+    np.bitwise_or.at(month_mask, codes, month_bits(dates.dt.month))
+
+    years = dates.dt.year.to_numpy(dtype="float64", na_value=np.nan)
+    has_year = ~np.isnan(years)
+    customer_years = np.unique(
+        np.column_stack([codes[has_year], years[has_year].astype(np.int64)]), axis=0
+    )
+    year_count = np.bincount(customer_years[:, 0], minlength=len(uniques))
+
+    return pd.DataFrame(
+        {"month_mask": month_mask, "year_count": year_count},
+        index=pd.Index(uniques, name="NUMMER"),
+    )
+
+
+def season_flags(masks, seasons=None):
+    # Seasonal buyers ordered in at least two years and only inside the season's months
+    if seasons is None:
+        seasons = SEASONS
+    flags = pd.DataFrame(index=masks.index)
+    for name, months in seasons.items():
+        season_bits = int(month_bits(months).sum())
+        flags[f"seasonal_{name}"] = (masks["year_count"].to_numpy() >= 2) & (
+            (masks["month_mask"].to_numpy() & ~season_bits) == 0
+        )
+    return flags
 
 
-def seasonal_weihnachten(dates):
-    weihnachten = {10, 11, 12}
-    unique_months = set(dates.dt.month.unique())
-    years = dates.dt.year.nunique()
-    if years >= 2 and unique_months.issubset(weihnachten):
-        return True
-    return False
+NUMMER_WIDTH = 10
+
+
+def customer_keys(values, source="NUMMER", errors="raise"):
+    # Customer IDs (ints, floats like 123.0, zero-padded strings) -> int64 keys.
+    # Non-numeric IDs raise a ValueError, or become <NA> with errors="coerce";
+    # with missing IDs the result is a nullable Int64 column.
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        numbers = values
+    else:
+        numbers = pd.to_numeric(values, errors="coerce")
+    unparsed = numbers.isna() & values.notna()
+    blank = values[unparsed].astype(str).str.strip() == ""
+    invalid = unparsed & ~blank.reindex(values.index, fill_value=False)
+    invalid |= numbers.notna() & ((numbers < 0) | (numbers % 1 != 0))
 
+    if invalid.any():
+        examples = values[invalid].unique()[:5].tolist()
+        if errors == "raise":
+            raise ValueError(f"{source}: {int(invalid.sum())} non-numeric customer IDs, e.g. {examples}")
+        run_logger().warning(f"{source}: ignoring {int(invalid.sum())} non-numeric customer IDs, e.g. {examples}")
 
-def pad_column_with_zeros(df, column_name):
-    df[column_name] = df[column_name].astype(str)  # Convert to string
-    df[column_name] = df[column_name].str.zfill(10)  # Pad with zeros
-    return df
+    keys = numbers.where(~invalid & numbers.notna()).astype("Int64")
+    return keys.astype("int64") if keys.notna().all() else keys
+
+
+def normalize_addresses(addresses, source="V2AD1001", date_format="%Y-%m-%d"):
+    # V2AD1001 as used by both the KW preparation and the RFM pipeline: int64 keys and
+    # dates (columns already parsed by read_csv pass through unchanged). The RFM
+    # pipeline reads ISO dates; the KW preparation passes date_format="mixed" like
+    # process_date, so that dates such as "05.01.2020" keep their KW labels
+    addresses["NUMMER"] = customer_keys(addresses["NUMMER"], source)
+    for col in ["SYS_ANLAGE", "GEBURT"]:
+        if col in addresses:
+            addresses[col] = pd.to_datetime(addresses[col], format=date_format, errors="coerce")
+    return addresses
+
+
+def format_customer_keys(keys):
+    # int64 keys -> the 10-character zero-padded NUMMER of the exported files
+    return pd.Series(keys).astype("Int64").astype("string").str.zfill(NUMMER_WIDTH).astype(object)
 
 
 def get_halfyear_reference_dates(today=None):
@@ -303,46 +394,44 @@ def get_halfyear_bins(reference_date=None):
     return bin_edges, bin_labels
 
 
-def assign_rfm_label(row):
-    mf = row["mf_score"]
-    r = row["r_score"]
-
-    if mf in [4, 5] and r in [10, 9]:
-        return "Champions"
-    elif mf in [4, 5] and r in [5, 6, 7, 8]:
-        return "Treue Kunden"
-    elif mf == 5 and r in [1, 2, 3, 4]:
-        return 'Nicht zu verlieren'
-    elif mf in [2, 3, 4] and r in [7, 8, 9, 10]:
-        return "Potenziell loyale Kunden"
-    elif mf in [3] and r in [5, 6]:
-        return 'Brauchen Aufmerksamkeit'
-    elif mf in [3, 4] and r in [1, 2, 3, 4]:
-        return "Gefährdete Kunden"
-    elif mf == 1 and r in [9, 10]:
-        return "Reaktivierte Kunden"
-    elif mf == 1 and r in [7, 8]:
-        return "Vielversprechende Kunden"
-    elif mf in [1, 2] and r in [5, 6]:
-        return "Abwandernde Kunden"
-    elif mf == 2 and r in [1, 2, 3, 4]:
-        return "Schlafende Kunden"
-    elif mf == 1 and r in [1, 2, 3, 4]:
-        return "Verlorene Kunden"
-    else:
-        return "Nicht klassifiziert"
+## RFM label rules live in rfm_label_rules.json (first matching rule wins)
+RFM_LABEL_RULES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rfm_label_rules.json"
+)
+RFM_DEFAULT_LABEL = "Nicht klassifiziert"
 
 
+def load_rfm_label_rules(path=RFM_LABEL_RULES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
 
 
+def build_rfm_label_table(rules=None):
+    # Lookup array indexed by [mf_score, r_score], filled so earlier rules take precedence
+    if rules is None:
+        rules = load_rfm_label_rules()
+    max_mf = max(max(rule["mf_score"]) for rule in rules)
+    max_r = max(max(rule["r_score"]) for rule in rules)
+    table = np.full((max_mf + 1, max_r + 1), RFM_DEFAULT_LABEL, dtype=object)
+    for rule in reversed(rules):
+        table[np.ix_(rule["mf_score"], rule["r_score"])] = rule["label"]
+    return table
 
 
+def assign_rfm_labels(mf_score, r_score, table=None):
+    # Label per (mf_score, r_score) pair; scores outside the table are not classified
+    if table is None:
+        table = build_rfm_label_table()
+    mf = np.asarray(mf_score, dtype="float64")
+    r = np.asarray(r_score, dtype="float64")
+    valid = (
+        (mf >= 0) & (mf < table.shape[0]) & (mf == np.floor(mf))
+        & (r >= 0) & (r < table.shape[1]) & (r == np.floor(r))
+    )
+    labels = np.full(len(mf), RFM_DEFAULT_LABEL, dtype=object)
+    labels[valid] = table[mf[valid].astype(np.int64), r[valid].astype(np.int64)]
+    return labels
 
-def process_id(data):
-    data = data.astype(str)
-    data = data.replace(".0","")
-    data = data.str.zfill(10)
-    return data
 
 def process_date(data):
     return pd.to_datetime(data,format='mixed',errors='coerce')
@@ -0,0 +1,192 @@
+## Incremental order state for the RFM pipeline.
+## V2AD1056 grows by appending lines, so the orders are kept as persisted per-customer
+## aggregates (order_aggregates.fold_order_lines, the sums with their compensation) for
+## the reference dates they were computed with. On the next run only the bytes appended
+## after the stored offset are parsed and folded into the aggregates; the scores are
+## then derived from one row per customer instead of all order lines. The sums continue
+## in line order, so they are the same as those of a full run to the last bit.
+## Lines whose window membership can still change (orders dated on or after `today`)
+## and the last order of the parsed bytes, which may continue in the next append, stay
+## pending at line grain until a later run settles them, together with every later
+## line of the same customer so that its sums keep their line order. Like the
+## streaming mode this assumes that the lines of an order are written together.
+## The 3-5 year and 2 year windows move every half-year: when the reference dates
+## change, or the file was rewritten (shrunk, header or sampled blocks changed), the
+## state is rebuilt from the full file, chunk by chunk.
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+
+from extract_cache import ENC, SEP, extract_path
+from instrumentation import run_logger
+from order_aggregates import ORDER_LINE_COLUMNS, empty_order_lines, finish_partials, fold_order_lines, order_lines
+
+
+STATE_DIR = os.environ.get("RFM_STATE_DIR", "Data/state")
+# Bumped when the state layout changes (3: customer partials instead of the order
+# ledger, 4: compensation of the sums), older state is rebuilt
+STATE_VERSION = 4
+SAMPLE_BYTES = 1 << 20
+
+
+def state_files(land):
+    return (
+        os.path.join(STATE_DIR, f"orders_{land}.parquet"),
+        os.path.join(STATE_DIR, f"orders_{land}_pending.parquet"),
+        os.path.join(STATE_DIR, f"orders_{land}.json"),
+    )
+
+
+def file_samples(path, offset):
+    # Header line plus hashes of the first and last block before offset
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(0)
+        head = f.read(min(SAMPLE_BYTES, offset))
+        f.seek(max(offset - SAMPLE_BYTES, 0))
+        tail = f.read(min(SAMPLE_BYTES, offset))
+        f.seek(max(offset - 1, 0))
+        last_byte = f.read(1)
+    return {
+        "header": header.decode(ENC),
+        "head_sha1": hashlib.sha1(head).hexdigest(),
+        "tail_sha1": hashlib.sha1(tail).hexdigest(),
+        "ends_with_newline": last_byte == b"\n",
+    }
+
+
+def is_append_only(path, meta):
+    # The file may only have grown behind the stored offset
+    offset = meta["offset"]
+    if os.path.getsize(path) < offset or not meta["samples"]["ends_with_newline"]:
+        return False
+    return file_samples(path, offset) == meta["samples"]
+
+
+def read_order_chunks(source, chunksize):
+    return pd.read_csv(
+        source,
+        sep=SEP,
+        encoding=ENC,
+        usecols=ORDER_LINE_COLUMNS,
+        dtype={"VERWEIS": str},
+        chunksize=chunksize,
+    )
+
+
+def read_appended_chunks(path, start, end, header, chunksize):
+    with open(path, "rb") as f:
+        f.seek(start)
+        appended = f.read(end - start)
+    return read_order_chunks(io.BytesIO(header.encode(ENC) + appended), chunksize)
+
+
+def split_settled(lines, today):
+    # Lines whose aggregates are final for the windows ending at today, and the pending
+    # rest: orders with a line dated today or later and the last order of the lines,
+    # plus all later lines of their customers
+    lines = lines[lines["NUMMER"].notna()]
+    if lines.empty:
+        return lines, lines
+    orders = lines["AUFTRAG_NR"]
+    open_orders = orders[lines["AUF_ANLAGE"] >= pd.Timestamp(today)]
+    pending = orders.isin(pd.concat([open_orders, orders.iloc[-1:]]))
+    pending = pending.groupby(lines["NUMMER"]).cummax()
+    return lines[~pending], lines[pending]
+
+
+def fold_chunks(chunks, partials, pending, windows):
+    # Raw V2AD1056 chunks -> folded settled aggregates and the lines still pending
+    # Pending lines of an earlier run may have settled since (today moved on)
+    settled, pending = split_settled(pending, windows[2])
+    if not settled.empty:
+        partials = fold_order_lines(partials, settled, *windows)
+    lines_read = 0
+    for chunk in chunks:
+        lines_read += len(chunk)
+        lines = pd.concat([pending, order_lines(chunk)], ignore_index=True)
+        settled, pending = split_settled(lines, windows[2])
+        if not settled.empty:
+            partials = fold_order_lines(partials, settled, *windows)
+    if partials is None:
+        partials = fold_order_lines(None, empty_order_lines(), *windows)
+    return partials, pending.reset_index(drop=True), lines_read
+
+
+def window_key(windows):
+    # The partials stay valid while the window starts are the same and today does not
+    # move back (their lines are all dated before the today they were settled for)
+    five_years_ago_start, two_years_ago_start, _ = windows
+    return [str(pd.Timestamp(five_years_ago_start)), str(pd.Timestamp(two_years_ago_start))]
+
+
+def save_state(land, partials, pending, path, offset, windows):
+    partials_path, pending_path, meta_path = state_files(land)
+    os.makedirs(STATE_DIR, exist_ok=True)
+    partials.to_parquet(f"{partials_path}.tmp")
+    os.replace(f"{partials_path}.tmp", partials_path)
+    pending.to_parquet(f"{pending_path}.tmp", index=False)
+    os.replace(f"{pending_path}.tmp", pending_path)
+    meta = {
+        "version": STATE_VERSION,
+        "offset": offset,
+        "samples": file_samples(path, offset),
+        "windows": window_key(windows),
+        "today": str(pd.Timestamp(windows[2])),
+        "watermark": str(partials["recency"].max()),
+    }
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def load_state(land):
+    partials_path, pending_path, meta_path = state_files(land)
+    if not all(os.path.exists(p) for p in state_files(land)):
+        return None, None, None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != STATE_VERSION:
+        return None, None, None
+    return pd.read_parquet(partials_path), pd.read_parquet(pending_path), meta
+
+
+def incremental_order_aggregates(
+    land, five_years_ago_start, two_years_ago_start, today, chunksize=1_000_000, rebuild=False,
+):
+    # Per-customer order aggregates of a land (the frame aggregate_orders returns) and
+    # how the state was brought up to date
+    logger = run_logger()
+    path = extract_path(land, "V2AD1056")
+    offset = os.path.getsize(path)
+    windows = (five_years_ago_start, two_years_ago_start, today)
+    partials, pending, meta = (None, None, None) if rebuild else load_state(land)
+
+    reusable = (
+        meta is not None
+        and meta["windows"] == window_key(windows)
+        and pd.Timestamp(today) >= pd.Timestamp(meta["today"])
+        and is_append_only(path, meta)
+    )
+    if reusable:
+        chunks = read_appended_chunks(path, meta["offset"], offset, meta["samples"]["header"], chunksize)
+        mode = "incremental" if offset > meta["offset"] else "unchanged"
+    else:
+        if meta is not None:
+            logger.info(f"{land}: V2AD1056 was rewritten or the reference dates moved, rebuilding the order state")
+        partials, pending = None, empty_order_lines()
+        chunks = read_order_chunks(path, chunksize)
+        mode = "full"
+
+    partials, pending, lines_read = fold_chunks(chunks, partials, pending, windows)
+    if mode == "incremental":
+        logger.info(f"{land}: merged {lines_read} new order lines after {meta['watermark']}")
+    elif mode == "unchanged":
+        logger.info(f"{land}: no new orders since {meta['watermark']}")
+    save_state(land, partials, pending, path, offset, windows)
+
+    aggregates = finish_partials(fold_order_lines(partials, pending, *windows))
+    return aggregates, mode
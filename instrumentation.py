@@ -0,0 +1,257 @@
+## Per-task performance records of the Prefect flows.
+## Tasks decorated with @instrumented (below @task) record per call and land the wall
+## and CPU time, the RSS high-water mark and how much it grew during the task, the
+## tracemalloc peak (only with RFM_TRACEMALLOC=1, it slows Python-heavy code down; the
+## peaks of nested instrumented calls count towards the enclosing call) and the rows
+## and bytes of the DataFrames / Arrow tables going in and out. Bytes are the
+## shallow memory_usage (no per-string scan). A flow collects the records of a land with
+## `task_metrics(flow, land)`, which publishes them as a Prefect table artifact and as
+## a JSON run record in Data/runs. Tasks named in RFM_PROFILE_TASKS (comma separated,
+## "*" for all) are additionally run under cProfile, with one .prof dump per call.
+import cProfile
+import contextvars
+import datetime as dt
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+RUN_DIR = os.environ.get("RFM_RUN_DIR", "Data/runs")
+
+RECORDS = []
+_records_lock = threading.Lock()
+# Tracemalloc frames of the instrumented calls in progress (innermost last)
+_traced = []
+_land = contextvars.ContextVar("instrumented_land", default=None)
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def run_logger(name="rfm_pipeline"):
+    # Logger of the current Prefect flow or task run; a plain logger outside of one
+    try:
+        from prefect import get_run_logger
+        from prefect.exceptions import MissingContextError
+    except ImportError:
+        return logging.getLogger(name)
+    try:
+        return get_run_logger()
+    except MissingContextError:
+        return logging.getLogger(name)
+
+
+def profiled_tasks():
+    # Read at call time so that worker processes started later see the setting
+    names = os.environ.get("RFM_PROFILE_TASKS", "")
+    return {name.strip() for name in names.split(",") if name.strip()}
+
+
+@contextmanager
+def profiling(names):
+    # Flow parameter -> RFM_PROFILE_TASKS for the run, inherited by the land worker
+    # processes started inside it; the previous setting is restored afterwards
+    if not names:
+        yield
+        return
+    previous = os.environ.get("RFM_PROFILE_TASKS")
+    os.environ["RFM_PROFILE_TASKS"] = ",".join([names] if isinstance(names, str) else names)
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("RFM_PROFILE_TASKS", None)
+        else:
+            os.environ["RFM_PROFILE_TASKS"] = previous
+
+
+def frame_size(value, depth=1):
+    # (rows, bytes) of the frames in value; tuples, lists and dicts are looked into once
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value), int(np.sum(value.memory_usage(index=True)))
+    if pa is not None and isinstance(value, pa.Table):
+        return value.num_rows, value.nbytes
+    if isinstance(value, np.ndarray):
+        return len(value), value.nbytes
+    if depth > 0 and isinstance(value, (tuple, list, dict)):
+        values = value.values() if isinstance(value, dict) else value
+        sizes = [frame_size(v, depth - 1) for v in values]
+        return sum(s[0] for s in sizes), sum(s[1] for s in sizes)
+    return 0, 0
+
+
+def sizes_of(values):
+    sizes = [frame_size(v) for v in values]
+    return sum(s[0] for s in sizes), sum(s[1] for s in sizes)
+
+
+def profile_path(name, land):
+    stamp = dt.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    return os.path.join(RUN_DIR, f"profile_{name}_{land or 'all'}_{stamp}.prof")
+
+
+def instrumented(func, name=None):
+    # Place below @task: @task @instrumented def load_data(...); name overrides the
+    # task name of the records
+    name = name or func.__name__
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        bound = signature.bind_partial(*args, **kwargs)
+        land = bound.arguments.get("land", _land.get())
+        rows_in, bytes_in = sizes_of(bound.arguments.values())
+        tracing = tracemalloc.is_tracing() or os.environ.get("RFM_TRACEMALLOC") == "1"
+        traced = {"start": 0, "peak": 0}
+        if tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Nested instrumented calls hand the peak so far on to the enclosing call
+            current, peak = tracemalloc.get_traced_memory()
+            with _records_lock:
+                if _traced:
+                    _traced[-1]["peak"] = max(_traced[-1]["peak"], peak)
+                _traced.append(traced)
+            tracemalloc.reset_peak()
+            traced["start"] = current
+        profiled = profiled_tasks()
+        profiler = cProfile.Profile() if name in profiled or "*" in profiled else None
+
+        record = {"task": name, "land": land, "started": dt.datetime.now().isoformat(timespec="seconds")}
+        rss_start = max_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        status = "failed"
+        try:
+            if profiler is not None:
+                result = profiler.runcall(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+            status = "completed"
+            return result
+        finally:
+            record["status"] = status
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+            record["max_rss_mb"] = max_rss_mb()
+            record["max_rss_growth_mb"] = None if rss_start is None else record["max_rss_mb"] - rss_start
+            record["tracemalloc_peak_mb"] = None
+            if tracing:
+                peak = max(traced["peak"], tracemalloc.get_traced_memory()[1])
+                record["tracemalloc_peak_mb"] = (peak - traced["start"]) / 1024**2
+                with _records_lock:
+                    _traced[:] = [t for t in _traced if t is not traced]
+                    if _traced:
+                        _traced[-1]["peak"] = max(_traced[-1]["peak"], peak)
+            record["rows_in"], record["bytes_in"] = rows_in, bytes_in
+            record["rows_out"], record["bytes_out"] = (
+                sizes_of([result]) if status == "completed" else (None, None)
+            )
+            if profiler is not None:
+                os.makedirs(RUN_DIR, exist_ok=True)
+                record["profile"] = profile_path(name, land)
+                profiler.dump_stats(record["profile"])
+            with _records_lock:
+                RECORDS.append(record)
+
+    return run
+
+
+def take_records(land):
+    # Removes and returns the records of a land (None: records without a land too)
+    with _records_lock:
+        taken = [r for r in RECORDS if r["land"] in (land, None)]
+        RECORDS[:] = [r for r in RECORDS if r["land"] not in (land, None)]
+    return taken
+
+
+def flow_run_id():
+    try:
+        from prefect.context import FlowRunContext
+    except ImportError:
+        return None
+    context = FlowRunContext.get()
+    return str(context.flow_run.id) if context is not None and context.flow_run is not None else None
+
+
+def write_run_record(run, path=None):
+    os.makedirs(RUN_DIR, exist_ok=True)
+    stamp = run["started"].replace(":", "").replace("-", "")
+    path = path or os.path.join(RUN_DIR, f"{run['flow']}_{run['land']}_{stamp}.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def publish_artifact(run):
+    # Table artifact on the flow run; skipped outside a Prefect flow run (plain .fn calls)
+    if run["flow_run_id"] is None:
+        return None
+    from prefect.artifacts import create_table_artifact
+
+    columns = [
+        "task", "status", "wall_s", "cpu_s", "max_rss_mb", "max_rss_growth_mb", "tracemalloc_peak_mb",
+        "rows_in", "bytes_in", "rows_out", "bytes_out",
+    ]
+    table = [
+        {col: round(v, 3) if isinstance(v, float) else v for col, v in ((c, r.get(c)) for c in columns)}
+        for r in run["tasks"]
+    ]
+    key = f"task-metrics-{run['flow']}-{run['land']}".lower().replace("_", "-")
+    return create_table_artifact(
+        table, key=key, description=f"Task metrics of {run['flow']} for {run['land']} ({run['started']})"
+    )
+
+
+@contextmanager
+def task_metrics(flow, land):
+    # Collects the instrumented tasks of a land and publishes them when the block ends
+    token = _land.set(land)
+    take_records(land)  # leftovers of an earlier run in this process
+    started = dt.datetime.now().isoformat(timespec="seconds")
+    wall = time.perf_counter()
+    try:
+        yield
+    finally:
+        _land.reset(token)
+        run = {
+            "flow": flow,
+            "land": land,
+            "flow_run_id": flow_run_id(),
+            "started": started,
+            "wall_s": time.perf_counter() - wall,
+            "max_rss_mb": max_rss_mb(),
+            "tasks": take_records(land),
+        }
+        logger = run_logger()
+        try:
+            path = write_run_record(run)
+            publish_artifact(run)
+            logger.info(f"{flow} {land}: task metrics in {path}")
+        except Exception as e:
+            logger.warning(f"Could not publish the task metrics of {flow} {land}: {e!r}")
@@ -4,6 +4,9 @@ import datetime as dt
 from dateutil.relativedelta import relativedelta
 from helper import *
 from paths import *
+from extract_cache import read_workbook
+from kw_handoff import publish_kw_labels
+from schemas import apply_schema, load_extract, schema_columns
 
 ## Repetitive setting
 enc = "cp850"
@@ -22,11 +25,18 @@ current_end = pd.to_datetime(result["prev_end"] + relativedelta(months=6))
 
 
 ## Importing all required data
-kunden_segments = pd.read_excel(ks_path)
+kunden_segments = apply_schema(
+    read_workbook(ks_path, columns=schema_columns("kw", "kunden_segments")), "kw", "kunden_segments"
+)
 kunden_segment_dict = dict(zip(kunden_segments["Alt"], kunden_segments["Neu"]))
-kw = pd.read_csv(f'/Volumes/MARAL/CSV/{land}/V2AD2000.csv', sep=sep, encoding=enc, on_bad_lines="skip")
-adresse = pd.read_csv(f'/Volumes/MARAL/CSV/{land}/V2AD1001.csv', sep=sep, encoding=enc)
-stat = pd.read_csv(f'/Volumes/MARAL/CSV/{land}/V2AD1005.csv', sep=sep, encoding=enc, usecols=["NUMMER", "ERSTKAUF"])
+kw = load_extract(
+    land, "V2AD2000", "kw",
+    extra_columns={last_hj: None, current_hj: None},
+    project_parse=True,
+    on_bad_lines="skip",
+)
+adresse = normalize_addresses(load_extract(land, "V2AD1001", "kw"), date_format="mixed")
+stat = load_extract(land, "V2AD1005", "kw")
 
 
 
@@ -35,10 +45,8 @@ kw[last_hj] = kw[last_hj].map(kunden_segment_dict)
 kw[current_hj] = kw[current_hj].map(kunden_segment_dict)
 
 ## Data preprocessing to connect the clean tables together
-kw["NUMMER"] = process_id(kw["NUMMER"])
-adresse["NUMMER"] = process_id(adresse["NUMMER"])
-adresse["SYS_ANLAGE"] = process_date(adresse["SYS_ANLAGE"])
-stat["NUMMER"] = process_id(stat["NUMMER"])
+kw["NUMMER"] = customer_keys(kw["NUMMER"], "V2AD2000")
+stat["NUMMER"] = customer_keys(stat["NUMMER"], "V2AD1005")
 stat["ERSTKAUF"] = process_date(stat["ERSTKAUF"])
 
 
@@ -101,6 +109,10 @@ all_addresses_labeled = pd.concat([address_kw_nk_kw, nk])
 ## Removing duplicated Nummers
 all_addresses_labeled = all_addresses_labeled.drop_duplicates(subset=["NUMMER"])
 today = dt.date.today()
-all_addresses_labeled[["NUMMER", "Kundengruppe"]].to_csv(
+all_addresses_labeled[["NUMMER", "Kundengruppe"]].assign(
+    NUMMER=lambda df: format_customer_keys(df["NUMMER"])
+).to_csv(
     f"Data/kw_{land}.csv", sep=";", index=False, encoding="cp850"
 )
+## Arrow copy for the RFM pipeline, written after the CSV so it counts as current
+publish_kw_labels(land, all_addresses_labeled)
@@ -4,42 +4,73 @@ import datetime as dt
 from dateutil.relativedelta import relativedelta
 from helper import *
 from paths import *
+from extract_cache import extract_path, read_workbook
+from kw_handoff import publish_kw_labels
+from instrumentation import instrumented, profiling, task_metrics
+from task_cache import CACHED_STAGE, refresh_task_cache, stage_cache
+from schemas import apply_schema, load_extract, schema_columns
+from parallel import run_lands
 from prefect import task, flow, get_run_logger
 
 # List of lands to process
 lands = ["F01", "F02", "F03", "F04"]
+# Where process_land writes kw_<land>_flow.csv
+KW_OUTPUT_DIR = os.environ.get(
+    "RFM_KW_OUTPUT_DIR", "/Users/maralsheikhzadeh/Documents/Codes/Repeating-Analytics/RFM_Pipeline/Data"
+)
+
+def half_year_columns(land):
+    # KW history columns of the last and the current half-year
+    number = get_half_year_info(land=land)["number"]
+    return f"Z{number}", f"Z{number + 1}"
+
+
+def read_kw_history(land):
+    # Only NUMMER and the two needed Z columns of the (ever wider) V2AD2000
+    last_hj, current_hj = half_year_columns(land)
+    return load_extract(
+        land, "V2AD2000", "kw",
+        extra_columns={last_hj: None, current_hj: None},
+        project_parse=True,
+        on_bad_lines="skip",
+    )
 
-@task
-def process_land(land: str):
-    # Repetitive setting
-    enc = "cp850"
-    sep = ";"
+
+def read_kw_inputs(land):
+    # KW extract, first-purchase dates and the Alt -> Neu segment mapping of a land
+    kunden_segments = apply_schema(
+        read_workbook(ks_path, columns=schema_columns("kw", "kunden_segments")), "kw", "kunden_segments"
+    )
+    kunden_segment_dict = dict(zip(kunden_segments["Alt"], kunden_segments["Neu"]))
+    kw = read_kw_history(land)
+    stat = load_extract(land, "V2AD1005", "kw")
+    return kw, stat, kunden_segment_dict
+
+
+def read_kw_addresses(land):
+    return normalize_addresses(load_extract(land, "V2AD1001", "kw"), date_format="mixed")
+
+
+def classify_land(land, adresse, kw, stat, kunden_segment_dict):
+    # NUMMER -> Kundengruppe of a land; adresse is V2AD1001 after normalize_addresses
+    # (the combined flow passes the frame it also scores, so it is not modified here)
+    adresse = adresse[["NUMMER", "SYS_ANLAGE"]]
 
     # Defining the dates for the beginning and end of previous and Current HJ, as well as the Number of the Column in KW data
     result = get_half_year_info(land=land)
-    last_hj = f"Z{result['number']}"
-    current_hj = f"Z{result['number'] + 1}"
+    last_hj, current_hj = half_year_columns(land)
     prev_start = pd.to_datetime(result["prev_start"])
     prev_end = pd.to_datetime(result["prev_end"])
     current_start = pd.to_datetime(result["prev_start"] + relativedelta(months=6))
     current_end = pd.to_datetime(result["prev_end"] + relativedelta(months=6))
 
-    # Importing all required data
-    kunden_segments = pd.read_excel(ks_path)
-    kunden_segment_dict = dict(zip(kunden_segments["Alt"], kunden_segments["Neu"]))
-    kw = pd.read_csv(f'/Volumes/MARAL/CSV/{land}/V2AD2000.csv', sep=sep, encoding=enc, on_bad_lines="skip")
-    adresse = pd.read_csv(f'/Volumes/MARAL/CSV/{land}/V2AD1001.csv', sep=sep, encoding=enc)
-    stat = pd.read_csv(f'/Volumes/MARAL/CSV/{land}/V2AD1005.csv', sep=sep, encoding=enc, usecols=["NUMMER", "ERSTKAUF"])
-
     # mapping the names to the codes in the columns related to last HJ and current HJ in the KW data
     kw[last_hj] = kw[last_hj].map(kunden_segment_dict)
     kw[current_hj] = kw[current_hj].map(kunden_segment_dict)
 
     # Data preprocessing to connect the clean tables together
-    kw["NUMMER"] = process_id(kw["NUMMER"])
-    adresse["NUMMER"] = process_id(adresse["NUMMER"])
-    adresse["SYS_ANLAGE"] = process_date(adresse["SYS_ANLAGE"])
-    stat["NUMMER"] = process_id(stat["NUMMER"])
+    kw["NUMMER"] = customer_keys(kw["NUMMER"], "V2AD2000")
+    stat["NUMMER"] = customer_keys(stat["NUMMER"], "V2AD1005")
     stat["ERSTKAUF"] = process_date(stat["ERSTKAUF"])
 
     # Merging tables to each other using the customer ID (NUMMER) column
@@ -87,23 +118,61 @@ def process_land(land: str):
     all_addresses_labeled = pd.concat([address_kw_nk_kw, nk])
     all_addresses_labeled = all_addresses_labeled.drop_duplicates(subset=["NUMMER"])
 
-    # Ensure output directory exists
-    output_dir = "/Users/maralsheikhzadeh/Documents/Codes/Repeating-Analytics/RFM_Pipeline/Data"
-    os.makedirs(output_dir, exist_ok=True)
+    return all_addresses_labeled[["NUMMER", "Kundengruppe"]]
+
+
+def write_kw_labels(labels, path):
+    # The kw_<land>.csv contract: padded NUMMER, cp850, semicolon
+    labels.assign(NUMMER=lambda df: format_customer_keys(df["NUMMER"])).to_csv(
+        path, sep=";", index=False, encoding="cp850"
+    )
+
+
+def kw_inputs(land):
+    # Files the KW labels of a land are computed from (keys of the task cache)
+    return [extract_path(land, name) for name in ["V2AD2000", "V2AD1001", "V2AD1005"]] + [ks_path]
+
+
+@task(**CACHED_STAGE)
+@instrumented
+def classify_kw_land(land: str):
+    kw, stat, kunden_segment_dict = read_kw_inputs(land)
+    return classify_land(land, read_kw_addresses(land), kw, stat, kunden_segment_dict)
+
+
+@task
+@instrumented
+def process_land(land: str, write_csv: bool = True):
+    all_addresses_labeled = classify_kw_land(land)
 
     # Test print (will appear in Prefect logs)
     print(f"writing {land} data ...")
 
-    # Correct absolute path without leading space
-    all_addresses_labeled[["NUMMER", "Kundengruppe"]].to_csv(
-        os.path.join(output_dir, f"kw_{land}_flow.csv"),
-        sep=";", index=False, encoding="cp850"
-    )
+    if write_csv:
+        # Ensure output directory exists
+        os.makedirs(KW_OUTPUT_DIR, exist_ok=True)
+
+        # Correct absolute path without leading space
+        write_kw_labels(all_addresses_labeled, os.path.join(KW_OUTPUT_DIR, f"kw_{land}_flow.csv"))
+
+    # Arrow handoff (Data/kw_<land>.arrow) that the RFM flow reads instead of the CSV
+    publish_kw_labels(land, all_addresses_labeled)
+
+def run_land(land, write_csv=True):
+    # Module-level entry point for the worker processes of run_lands
+    with task_metrics("kw_flow", land), stage_cache(land, kw_inputs(land)):
+        return process_land(land, write_csv)
+
 
 @flow
-def kw_flow():
-    for land in lands:
-        process_land(land)
+def kw_flow(workers=1, memory_limit_gb=None, write_csv=True, profile_tasks=None, refresh_cache=False):
+    # workers > 1 (None: one per land) runs the lands in parallel processes, each capped
+    # at memory_limit_gb; profile_tasks: task names (or "*") to run under cProfile;
+    # refresh_cache: True, a land or a list of lands whose cached KW labels are dropped before
+    # the run
+    with profiling(profile_tasks):
+        refresh_task_cache(refresh_cache, lands)
+        run_lands(run_land, lands, workers=workers, memory_limit_gb=memory_limit_gb, write_csv=write_csv)
 
 if __name__ == "__main__":
     kw_flow()
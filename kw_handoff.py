@@ -0,0 +1,93 @@
+## Handoff of the KW labels (NUMMER -> Kundengruppe of a land) to the RFM flow.
+## The KW stage publishes its result as an Arrow table: kept in this process for a
+## consumer in the same run and written as an uncompressed Arrow IPC file
+## (Data/kw_<land>.arrow) that a separately started RFM run memory-maps instead of
+## parsing Data/kw_<land>.csv. The in-process table is only served while the IPC file
+## is still the one it was written to, so a newer file or CSV from another run wins.
+## The CSV stays the human-readable export and the fallback input when no Arrow file
+## exists.
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from frame_handoff import read_ipc, write_ipc
+
+
+KW_DIR = os.environ.get("RFM_KW_DIR", "Data")
+KW_COLUMNS = ["NUMMER", "Kundengruppe"]
+
+_published = {}
+_published_lock = threading.Lock()
+
+
+def kw_ipc_path(land):
+    return os.path.join(KW_DIR, f"kw_{land}.arrow")
+
+
+def kw_csv_path(land):
+    return os.path.join(KW_DIR, f"kw_{land}.csv")
+
+
+def kw_table(labels):
+    # int64 NUMMER (nullable) and dictionary-encoded Kundengruppe
+    labels = labels[KW_COLUMNS]
+    return pa.table(
+        {
+            "NUMMER": pa.array(labels["NUMMER"], type=pa.int64(), from_pandas=True),
+            "Kundengruppe": pa.array(labels["Kundengruppe"].astype("category"), from_pandas=True),
+        }
+    )
+
+
+def kw_labels(table):
+    # Arrow table -> the frame read_kw returns (Kundengruppe as category)
+    labels = table.to_pandas()
+    if labels["NUMMER"].isna().any():
+        labels["NUMMER"] = labels["NUMMER"].astype("Int64")
+    return labels
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def publish_kw_labels(land, labels, path=None):
+    # Arrow table for consumers in this process plus the IPC file for later runs
+    if pa is None:
+        raise ImportError("The KW handoff needs pyarrow")
+    table = kw_table(labels)
+    path = write_ipc(table, path or kw_ipc_path(land))
+    with _published_lock:
+        _published[land] = (table, path, file_stamp(path))
+    return table
+
+
+def load_kw_table(land, path=None):
+    # The IPC file unless the CSV was written after it (e.g. by an older kw.py), else
+    # None; the published table of this process while the file is the one it wrote
+    path = path or kw_ipc_path(land)
+    if pa is None or not os.path.exists(path):
+        return None
+    csv_path = kw_csv_path(land)
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(path):
+        return None
+    with _published_lock:
+        published = _published.get(land)
+    if published is not None and published[1] == path and published[2] == file_stamp(path):
+        return published[0]
+    return read_ipc(path)
+
+
+def load_kw_labels(land):
+    # KW labels of a land; falls back to the CSV export when nothing was published
+    table = load_kw_table(land)
+    if table is not None:
+        return kw_labels(table)
+    return pd.read_csv(kw_csv_path(land), sep=";", encoding="cp850", usecols=KW_COLUMNS)
@@ -0,0 +1,70 @@
+## Output formats of the labeled customer table (rfm_labels_<land>*.csv).
+## "csv" keeps the cp850/semicolon file the legacy consumers read, written in chunks
+## into one open handle; "csv.gz" and "csv.zst" are the same bytes compressed on the
+## fly. "parquet" stores the table typed (datetime64 dates, categorical labels) so
+## downstream jobs can load it without parsing text.
+import gzip
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from extract_cache import ENC, SEP
+
+
+LABEL_FORMATS = ("csv", "csv.gz", "csv.zst", "parquet")
+CSV_CHUNK_ROWS = 250_000
+
+
+def open_compressed(path, fmt):
+    if fmt == "csv":
+        return open(path, "wb")
+    if fmt == "csv.gz":
+        # Level 6 instead of the default 9: nearly the same size at a fraction of the time
+        return gzip.open(path, "wb", compresslevel=6)
+    if pa is None:
+        raise ImportError("csv.zst output needs pyarrow")
+    return pa.CompressedOutputStream(path, "zstd")
+
+
+def write_csv_chunked(df, path, fmt="csv", chunksize=CSV_CHUNK_ROWS, encoding=ENC, sep=SEP):
+    # Same content as df.to_csv(path, sep=sep, index=False, encoding=encoding), streamed
+    # chunk by chunk through one (compressed) handle
+    tmp = f"{path}.tmp"
+    with open_compressed(tmp, fmt) as raw:
+        for start in range(0, max(len(df), 1), chunksize):
+            chunk = df.iloc[start:start + chunksize]
+            text = chunk.to_csv(sep=sep, index=False, header=start == 0)
+            raw.write(text.encode(encoding))
+    os.replace(tmp, path)
+    return path
+
+
+def write_parquet(df, path, categories=None):
+    # categories: column -> category list for label columns stored as categoricals
+    typed = df.copy()
+    for col, values in (categories or {}).items():
+        typed[col] = pd.Categorical(typed[col], categories=values)
+    tmp = f"{path}.tmp"
+    typed.to_parquet(tmp, index=False, compression="zstd")
+    os.replace(tmp, path)
+    return path
+
+
+def write_label_table(df, base_path, formats=("csv",), categories=None):
+    # base_path without extension; returns the written paths
+    unknown = [fmt for fmt in formats if fmt not in LABEL_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown output formats {unknown}, expected some of {LABEL_FORMATS}")
+    written = []
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        if fmt == "parquet":
+            written.append(write_parquet(df, path, categories))
+        else:
+            written.append(write_csv_chunked(df, path, fmt))
+    return written
@@ -0,0 +1,214 @@
+## Per-customer order aggregates for the RFM pipeline.
+## Order lines (NUMMER, AUFTRAG_NR, AUF_ANLAGE, NETTO_UMSATZ) are reduced to one row
+## per customer with the lifetime values, the 3-5 year / last 2 year window values and
+## the month mask for the seasonality flags. The reduction works on a whole frame or
+## chunk by chunk (stream_order_aggregates), where each chunk is folded into the
+## customer aggregates so far, so memory scales with the number of customers, not order
+## lines. The folded amounts carry the compensation of their sums and continue them
+## line by line (order_kernels.group_sums): the truncated window sums of the later
+## stages would otherwise differ from a whole-frame run wherever the last bit flips.
+import numpy as np
+import pandas as pd
+
+from helper import customer_keys, season_flags, season_masks
+from order_kernels import group_sums
+from schemas import schema_columns
+
+
+ORDER_LINE_COLUMNS = schema_columns("rfm", "V2AD1056")
+SUM_COLUMNS = [
+    "gesamt_frequency", "gesamt_monetary",
+    "freq_3_to_5_years_ago", "monetary_3_to_5_years_ago",
+    "freq_last_2_years", "monetary_last_2_years",
+]
+MONETARY_COLUMNS = ["gesamt_monetary", "monetary_3_to_5_years_ago", "monetary_last_2_years"]
+# Compensation of the folded sums (fold_order_lines), dropped by finish_partials
+COMPENSATION_COLUMNS = [f"{col}_compensation" for col in MONETARY_COLUMNS]
+
+
+def order_lines(v21056):
+    # Raw V2AD1056 columns -> NUMMER (int64 key), AUFTRAG_NR, AUF_ANLAGE, NETTO_UMSATZ.
+    # References that are not customer numbers cannot match an address and are dropped.
+    return pd.DataFrame(
+        {
+            "NUMMER": customer_keys(v21056["VERWEIS"].str[2:12], "V2AD1056 VERWEIS", errors="coerce"),
+            "AUFTRAG_NR": v21056["AUFTRAG_NR"],
+            "AUF_ANLAGE": pd.to_datetime(v21056["AUF_ANLAGE"], format="%Y-%m-%d", errors="coerce"),
+            "NETTO_UMSATZ": v21056["BEST_WERT"] - v21056["MWST1"] - v21056["MWST2"] - v21056["MWST3"],
+        }
+    )
+
+
+def empty_order_lines():
+    # order_lines of an extract without lines
+    return pd.DataFrame(
+        {
+            "NUMMER": pd.Series(dtype="int64"),
+            "AUFTRAG_NR": pd.Series(dtype="float64"),
+            "AUF_ANLAGE": pd.Series(dtype="datetime64[ns]"),
+            "NETTO_UMSATZ": pd.Series(dtype="float64"),
+        }
+    )
+
+
+def aggregate_orders(orders, five_years_ago_start, two_years_ago_start, today):
+    # One row per NUMMER (sorted), the same values group_addresses and
+    # calculate_time_period_metrics compute from the merged order lines
+    orders = orders[orders["NUMMER"].notna()]
+    dates = orders["AUF_ANLAGE"]
+    in_5to3 = (dates >= pd.Timestamp(five_years_ago_start)) & (dates < pd.Timestamp(two_years_ago_start))
+    in_2 = (dates >= pd.Timestamp(two_years_ago_start)) & (dates < pd.Timestamp(today))
+
+    lifetime = orders.groupby("NUMMER").agg(
+        first_kaufdatum=("AUF_ANLAGE", "min"),
+        recency=("AUF_ANLAGE", "max"),
+        gesamt_frequency=("AUFTRAG_NR", "nunique"),
+        gesamt_monetary=("NETTO_UMSATZ", "sum"),
+    )
+    last_3_to_5_years = orders[in_5to3].groupby("NUMMER").agg(
+        freq_3_to_5_years_ago=("AUFTRAG_NR", "nunique"),
+        monetary_3_to_5_years_ago=("NETTO_UMSATZ", "sum"),
+    )
+    last_2_years = orders[in_2].groupby("NUMMER").agg(
+        freq_last_2_years=("AUFTRAG_NR", "nunique"),
+        monetary_last_2_years=("NETTO_UMSATZ", "sum"),
+    )
+    masks = season_masks(orders["NUMMER"], dates)
+
+    aggregates = lifetime.join(last_3_to_5_years).join(last_2_years).join(masks)
+    for col in SUM_COLUMNS[2:]:
+        aggregates[col] = aggregates[col].fillna(0)
+    return aggregates
+
+
+def merge_partials(partials):
+    # Combine partial aggregates of several chunks (min/max, sums, OR of month masks)
+    combined = pd.concat(partials)
+    codes, uniques = pd.factorize(combined.index, sort=True)
+    month_mask = np.zeros(len(uniques), dtype=np.int64)
+    np.bitwise_or.at(month_mask, codes, combined["month_mask"].to_numpy())
+
+    merged = combined.groupby(level=0, sort=True).agg(
+        first_kaufdatum=("first_kaufdatum", "min"),
+        recency=("recency", "max"),
+        **{col: (col, "sum") for col in SUM_COLUMNS},
+    )
+    merged["month_mask"] = month_mask
+    # Seasonal flags only need to know whether there are at least two order years
+    multi_year = merged["first_kaufdatum"].dt.year < merged["recency"].dt.year
+    merged["year_count"] = np.where(multi_year, 2, np.where(merged["recency"].notna(), 1, 0))
+    return merged
+
+
+def fold_order_lines(partials, orders, five_years_ago_start, two_years_ago_start, today):
+    # Aggregates of the lines so far (None for none) plus the next order lines, with the
+    # sums continued in line order as if all lines had been aggregated at once
+    orders = orders[orders["NUMMER"].notna()]
+    chunk = aggregate_orders(orders, five_years_ago_start, two_years_ago_start, today)
+    merged = merge_partials([chunk] if partials is None else [partials, chunk])
+
+    totals = np.zeros((len(merged), len(MONETARY_COLUMNS)))
+    compensation = np.zeros_like(totals)
+    if partials is not None:
+        known = merged.index.get_indexer(partials.index)
+        totals[known] = partials[MONETARY_COLUMNS].to_numpy(dtype="float64")
+        compensation[known] = partials[COMPENSATION_COLUMNS].to_numpy(dtype="float64")
+    dates = orders["AUF_ANLAGE"]
+    windows = np.column_stack([
+        np.ones(len(orders), dtype=bool),
+        ((dates >= pd.Timestamp(five_years_ago_start)) & (dates < pd.Timestamp(two_years_ago_start))).to_numpy(),
+        ((dates >= pd.Timestamp(two_years_ago_start)) & (dates < pd.Timestamp(today))).to_numpy(),
+    ])
+    group_sums(
+        merged.index.get_indexer(orders["NUMMER"]), windows,
+        orders["NETTO_UMSATZ"].to_numpy(dtype="float64", na_value=np.nan), totals, compensation,
+    )
+    merged[MONETARY_COLUMNS] = totals
+    merged[COMPENSATION_COLUMNS] = compensation
+    return merged
+
+
+def finish_partials(partials):
+    # Folded aggregates -> the frame aggregate_orders returns
+    return partials.drop(columns=COMPENSATION_COLUMNS)
+
+
+def split_trailing_order(chunk):
+    # Hold back the lines of the last order so an order is never split across chunks
+    if chunk.empty:
+        return chunk, chunk
+    orders = chunk["AUFTRAG_NR"].to_numpy()
+    changes = np.flatnonzero(orders[1:] != orders[:-1])
+    start = changes[-1] + 1 if len(changes) else 0
+    return chunk.iloc[:start], chunk.iloc[start:]
+
+
+def stream_order_aggregates(
+    path, five_years_ago_start, two_years_ago_start, today,
+    chunksize=1_000_000, encoding="cp850", sep=";",
+):
+    # Assumes the lines of an order are contiguous in the extract (written order by order)
+    reader = pd.read_csv(
+        path,
+        sep=sep,
+        encoding=encoding,
+        usecols=ORDER_LINE_COLUMNS,
+        dtype={"VERWEIS": str},
+        chunksize=chunksize,
+    )
+    windows = (five_years_ago_start, two_years_ago_start, today)
+    partials = None
+    carry = None
+    for chunk in reader:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        chunk, carry = split_trailing_order(chunk)
+        if not chunk.empty:
+            partials = fold_order_lines(partials, order_lines(chunk), *windows)
+    if carry is not None and not carry.empty:
+        partials = fold_order_lines(partials, order_lines(carry), *windows)
+    if partials is None:
+        partials = fold_order_lines(None, empty_order_lines(), *windows)
+    return finish_partials(partials)
+
+
+def join_customers(addresses, inx, aggregates):
+    # Customer-grain equivalent of merging every address onto every order line and the
+    # Inxmail list and collapsing the result again with group_addresses. Returns the
+    # grouped addresses plus the two window frames for merge_time_periods.
+    customers = addresses.groupby("NUMMER").agg(
+        geburt=("GEBURT", "first"),
+        anrede=("ANREDE", "first"),
+        QUELLE=("QUELLE", "first"),
+        plz=("PLZ", "first"),
+        registered_since=("SYS_ANLAGE", "first"),
+        address_rows=("NUMMER", "size"),
+    )
+    newsletter = inx.groupby("NUMMER").agg(nl_type=("NL_TYPE", "first"), inx_rows=("NUMMER", "size"))
+    customers = customers.join(newsletter)
+    customers = customers.join(aggregates.drop(columns=["month_mask", "year_count"]))
+
+    # The fan-out merge repeated every order line once per address row and Inxmail row
+    weight = customers["address_rows"] * customers["inx_rows"].fillna(1)
+    for col in MONETARY_COLUMNS:
+        customers[col] = customers[col].fillna(0) * weight
+    customers["gesamt_frequency"] = customers["gesamt_frequency"].fillna(0).astype("int64")
+
+    flags = season_flags(aggregates.reindex(customers.index, fill_value=0))
+    customers = customers.join(flags)
+
+    grouped = customers[
+        [
+            "geburt", "anrede", "QUELLE", "plz", "nl_type", "registered_since",
+            "first_kaufdatum", "recency", "gesamt_frequency", "gesamt_monetary",
+            *flags.columns,
+        ]
+    ].reset_index()
+    grouped["kundengruppe"] = None
+
+    has_orders = customers["recency"].notna() | (customers["gesamt_frequency"] > 0)
+    last_3_to_5_years = customers.loc[
+        has_orders, ["freq_3_to_5_years_ago", "monetary_3_to_5_years_ago"]
+    ].reset_index()
+    last_2_years = customers.loc[has_orders, ["freq_last_2_years", "monetary_last_2_years"]].reset_index()
+    return grouped, last_3_to_5_years, last_2_years
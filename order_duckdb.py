@@ -0,0 +1,218 @@
+## DuckDB engine for the per-customer order aggregates.
+## The order lines are reduced to customer grain by one SQL query in an embedded
+## DuckDB database: NUMMER from VERWEIS, net amounts, lifetime and window
+## frequency/monetary, first/last order date and the season month mask, the same frame
+## order_aggregates.aggregate_orders returns. The query scans a Parquet copy of the
+## order columns of V2AD1056, which is converted from the CSV chunk by chunk (and
+## again when the extract changes), so the order lines are never loaded whole.
+## It spills to Data/cache/duckdb when the data exceeds the memory limit
+## (RFM_DUCKDB_MEMORY_LIMIT, e.g. "8GB"; else 60% of the worker's address space cap
+## under parallel.run_lands, else DuckDB's default of 80% of the RAM) and shares the
+## cores with the other land workers. The ordered and distinct aggregates keep their
+## per-customer state in memory, so a query that runs out of memory is repeated over
+## more customer hash partitions.
+## The customer-grain stages after it are the same as with the other engines.
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from extract_cache import CACHE_DIR, ENC, SEP, extract_path, read_cached_meta, source_fingerprint
+from helper import MISSING_MONTH_BIT
+from instrumentation import run_logger
+from order_aggregates import ORDER_LINE_COLUMNS
+
+
+DUCKDB_TEMP_DIR = os.path.join(CACHE_DIR, "duckdb")
+DUCKDB_MEMORY_LIMIT = os.environ.get("RFM_DUCKDB_MEMORY_LIMIT")
+# Share of the worker's address space cap DuckDB may use; the rest is left to the
+# Python side and DuckDB's own allocations outside its buffer manager
+ADDRESS_SPACE_SHARE = 0.6
+MAX_PARTITIONS = 256
+# Columns of the Parquet copy: dates stay text and are parsed in the query like
+# order_lines parses them, amounts and order numbers are float64 in every chunk
+ORDER_COLUMN_TYPES = {
+    "VERWEIS": "string",
+    "AUFTRAG_NR": "float64",
+    "AUF_ANLAGE": "string",
+    "BEST_WERT": "float64",
+    "MWST1": "float64",
+    "MWST2": "float64",
+    "MWST3": "float64",
+}
+
+# V2AD1056 columns -> order lines, like order_aggregates.order_lines; customer
+# references that are not non-negative whole numbers become NULL and are dropped.
+# strptime skips surrounding whitespace and takes short years, which
+# pd.to_datetime(format="%Y-%m-%d") turns into NaT, hence the full match first.
+RAW_LINES_SQL = """
+SELECT
+    CASE WHEN isfinite(ref) AND ref >= 0 AND ref = floor(ref) THEN CAST(ref AS BIGINT) END AS NUMMER,
+    AUFTRAG_NR,
+    CASE WHEN regexp_full_match(AUF_ANLAGE, '[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}')
+        THEN try_strptime(AUF_ANLAGE, '%Y-%m-%d') END AS AUF_ANLAGE,
+    BEST_WERT - MWST1 - MWST2 - MWST3 AS NETTO_UMSATZ,
+    file_row_number AS line
+FROM (
+    SELECT *, TRY_CAST(trim(substr(VERWEIS, 3, 10)) AS DOUBLE) AS ref
+    FROM read_parquet($parquet_path, file_row_number = true)
+)
+"""
+
+# Pandas skips NaN in nunique and sum, DuckDB only NULL. The sums are compensated
+# (fsum) and taken in line order, which gives the bit-identical results of the pandas
+# groupby sums; a plain parallel sum differs in the last bits.
+AGGREGATE_SQL = """
+WITH lines AS (
+    SELECT
+        NUMMER,
+        CASE WHEN isnan(TRY_CAST(AUFTRAG_NR AS DOUBLE)) THEN NULL ELSE AUFTRAG_NR END AS AUFTRAG_NR,
+        AUF_ANLAGE,
+        CASE WHEN isnan(NETTO_UMSATZ) THEN NULL ELSE NETTO_UMSATZ END AS NETTO_UMSATZ,
+        AUF_ANLAGE >= $five_years_ago_start AND AUF_ANLAGE < $two_years_ago_start AS in_5to3,
+        AUF_ANLAGE >= $two_years_ago_start AND AUF_ANLAGE < $today AS in_2,
+        line
+    FROM ({lines})
+    WHERE NUMMER IS NOT NULL AND hash(NUMMER) % $partitions = $partition
+)
+SELECT
+    NUMMER,
+    min(AUF_ANLAGE) AS first_kaufdatum,
+    max(AUF_ANLAGE) AS recency,
+    count(DISTINCT AUFTRAG_NR) AS gesamt_frequency,
+    coalesce(fsum(NETTO_UMSATZ ORDER BY line), 0) AS gesamt_monetary,
+    count(DISTINCT AUFTRAG_NR) FILTER (WHERE in_5to3) AS freq_3_to_5_years_ago,
+    coalesce(fsum(NETTO_UMSATZ ORDER BY line) FILTER (WHERE in_5to3), 0) AS monetary_3_to_5_years_ago,
+    count(DISTINCT AUFTRAG_NR) FILTER (WHERE in_2) AS freq_last_2_years,
+    coalesce(fsum(NETTO_UMSATZ ORDER BY line) FILTER (WHERE in_2), 0) AS monetary_last_2_years,
+    CAST(bit_or(
+        CASE WHEN AUF_ANLAGE IS NULL THEN $missing_month ELSE CAST(1 AS BIGINT) << (month(AUF_ANLAGE) - 1) END
+    ) AS BIGINT) AS month_mask,
+    count(DISTINCT year(AUF_ANLAGE)) AS year_count
+FROM lines
+GROUP BY NUMMER
+"""
+
+
+def worker_limits():
+    # (memory limit, threads) of this land worker: the address space cap set by
+    # parallel.run_lands and the cores divided by the number of land workers
+    memory_limit = DUCKDB_MEMORY_LIMIT
+    if memory_limit is None and resource is not None:
+        cap = resource.getrlimit(resource.RLIMIT_AS)[0]
+        if cap != resource.RLIM_INFINITY:
+            memory_limit = f"{int(cap * ADDRESS_SPACE_SHARE) // 1024**2}MB"
+    workers = int(os.environ.get("RFM_LAND_WORKERS", "1"))
+    return memory_limit, max(1, (os.cpu_count() or 1) // workers)
+
+
+def connect(memory_limit=None, threads=None):
+    # In-memory database that spills to DUCKDB_TEMP_DIR
+    if duckdb is None:
+        raise ImportError("The duckdb engine needs the duckdb package")
+    os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET temp_directory = '{os.path.abspath(DUCKDB_TEMP_DIR)}'")
+    # Lets aggregations and sorts larger than memory spill instead of failing
+    con.execute("SET preserve_insertion_order = false")
+    worker_memory_limit, worker_threads = worker_limits()
+    memory_limit = memory_limit or worker_memory_limit
+    if memory_limit:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET threads = {int(threads or worker_threads)}")
+    return con
+
+
+def order_parquet_files(land):
+    base = os.path.join(CACHE_DIR, f"{land}_V2AD1056_orders")
+    return f"{base}.parquet", f"{base}.json"
+
+
+def order_parquet(land, chunksize=1_000_000):
+    # Parquet copy of the order columns of V2AD1056, written chunk by chunk with a fixed
+    # schema; reused until the extract changes
+    if pa is None:
+        raise ImportError("The duckdb engine needs pyarrow")
+    path = extract_path(land, "V2AD1056")
+    parquet_path, meta_path = order_parquet_files(land)
+    fingerprint = source_fingerprint(path)
+    meta = read_cached_meta(meta_path)
+    if meta is not None and meta["fingerprint"] == fingerprint and os.path.exists(parquet_path):
+        return parquet_path
+
+    schema = pa.schema(
+        [(name, pa.string() if dtype == "string" else pa.float64()) for name, dtype in ORDER_COLUMN_TYPES.items()]
+    )
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    chunks = pd.read_csv(
+        path, sep=SEP, encoding=ENC, usecols=ORDER_LINE_COLUMNS,
+        dtype={"VERWEIS": str, "AUF_ANLAGE": str}, chunksize=chunksize,
+    )
+    with pq.ParquetWriter(f"{parquet_path}.tmp", schema) as writer:
+        for chunk in chunks:
+            chunk = chunk[list(ORDER_COLUMN_TYPES)].astype(ORDER_COLUMN_TYPES)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    os.replace(f"{parquet_path}.tmp", parquet_path)
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    return parquet_path
+
+
+def aggregate_orders_duckdb(
+    land, orders, five_years_ago_start, two_years_ago_start, today, memory_limit=None, chunksize=1_000_000,
+):
+    # orders: order lines (order_lines) or None for the V2AD1056 of the land
+    con = connect(memory_limit)
+    try:
+        params = {
+            "five_years_ago_start": pd.Timestamp(five_years_ago_start).to_pydatetime(),
+            "two_years_ago_start": pd.Timestamp(two_years_ago_start).to_pydatetime(),
+            "today": pd.Timestamp(today).to_pydatetime(),
+            "missing_month": MISSING_MONTH_BIT,
+        }
+        if orders is None:
+            params["parquet_path"] = order_parquet(land, chunksize)
+            lines = RAW_LINES_SQL
+        else:
+            lines = orders[["NUMMER", "AUFTRAG_NR", "AUF_ANLAGE", "NETTO_UMSATZ"]].assign(line=np.arange(len(orders)))
+            con.register("order_lines", lines)
+            lines = "SELECT * FROM order_lines"
+        aggregates = run_partitioned(con, AGGREGATE_SQL.format(lines=lines), params, land)
+    finally:
+        con.close()
+    return aggregates.sort_values("NUMMER").set_index("NUMMER")
+
+
+def run_partitioned(con, sql, params, land):
+    # All customers in one query, else in 4, 16, ... hash partitions of them
+    partitions = 1
+    while True:
+        try:
+            parts = [
+                con.execute(sql, {**params, "partitions": partitions, "partition": i}).df()
+                for i in range(partitions)
+            ]
+            return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        except duckdb.OutOfMemoryException:
+            if partitions >= MAX_PARTITIONS:
+                raise
+            partitions *= 4
+            run_logger().warning(f"{land}: DuckDB out of memory, aggregating the orders in {partitions} partitions")
@@ -0,0 +1,166 @@
+## Customer-sorted order index and a single-pass aggregation kernel.
+## The order lines are stored once as contiguous arrays sorted by customer and order:
+## factorized customer codes with segment offsets, day numbers, order codes and net
+## amounts. The kernel computes every per-customer value of aggregate_orders (lifetime,
+## 3-5 year and last 2 year frequency/monetary, first/last order date, season month
+## mask) with segment reductions over these arrays instead of several groupbys, or with
+## one compiled pass per customer when the numba kernels are available (order_kernels).
+## The index of an extract is persisted as .npy files and memory-mapped on later runs
+## until the source file changes.
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from extract_cache import CACHE_DIR, extract_path, source_fingerprint
+from helper import MISSING_MONTH_BIT
+from order_aggregates import order_lines
+from order_kernels import MAX_DAY, NAT_DAY, kernel_backend, segment_aggregates
+from schemas import load_extract
+
+
+# Bumped when the index layout changes (3: missing amounts stay NaN), older indexes
+# are rebuilt
+INDEX_VERSION = 3
+INDEX_ARRAYS = ["customers", "offsets", "customer", "order", "day", "netto"]
+
+
+def to_day(values):
+    # datetime64 -> days since 1970-01-01 as int32, NaT -> NAT_DAY
+    days = pd.to_datetime(values).to_numpy(dtype="datetime64[D]")
+    result = np.full(len(days), NAT_DAY, dtype=np.int32)
+    valid = ~np.isnat(days)
+    result[valid] = days[valid].astype(np.int64)
+    return result
+
+
+def day_of(timestamp):
+    return int(np.datetime64(pd.Timestamp(timestamp).date(), "D").astype(np.int64))
+
+
+def build_order_index(orders):
+    # orders: NUMMER, AUFTRAG_NR, AUF_ANLAGE, NETTO_UMSATZ (order_lines)
+    orders = orders[orders["NUMMER"].notna()]
+    customer, customers = pd.factorize(orders["NUMMER"].to_numpy(dtype="int64"), sort=True)
+    order, _ = pd.factorize(orders["AUFTRAG_NR"].to_numpy())
+    netto = orders["NETTO_UMSATZ"].to_numpy(dtype="float64", na_value=np.nan)
+
+    # Sort by customer, then order; stable so lines keep their file order within an order
+    perm = np.lexsort((order, customer))
+    counts = np.bincount(customer, minlength=len(customers))
+    return {
+        "customers": np.asarray(customers, dtype=np.int64),
+        "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        "customer": customer[perm].astype(np.int64),
+        "order": order[perm].astype(np.int64),
+        "day": to_day(orders["AUF_ANLAGE"])[perm],
+        # Missing amounts stay NaN: the compensated sums skip them like pandas does
+        "netto": netto[perm],
+    }
+
+
+def distinct_orders(index, mask):
+    # Orders per customer with at least one line in mask (rows are sorted by customer, order)
+    rows = np.flatnonzero(mask & (index["order"] >= 0))
+    customer = index["customer"][rows]
+    order = index["order"][rows]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (customer[1:] != customer[:-1]) | (order[1:] != order[:-1])
+    return np.bincount(customer[first], minlength=len(index["customers"]))
+
+
+def month_bits_of_days(day):
+    valid = day != NAT_DAY
+    months = day.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) % 12
+    return np.where(valid, np.left_shift(1, months), MISSING_MONTH_BIT).astype(np.int64)
+
+
+def aggregate_order_index(index, five_years_ago_start, two_years_ago_start, today, backend=None):
+    # Same frame as order_aggregates.aggregate_orders, from one set of segment reductions
+    five, two, end = day_of(five_years_ago_start), day_of(two_years_ago_start), day_of(today)
+    if kernel_backend(backend) == "numba":
+        columns = segment_aggregates(index, five, two, end)
+    else:
+        columns = numpy_segment_aggregates(index, five, two, end)
+    return pd.DataFrame(columns, index=pd.Index(index["customers"], name="NUMMER"))
+
+
+def numpy_segment_aggregates(index, five, two, end):
+    n = len(index["customers"])
+    starts = np.asarray(index["offsets"][:-1])
+    day = np.asarray(index["day"])
+    netto = np.nan_to_num(np.asarray(index["netto"]), nan=0.0)
+    customer = np.asarray(index["customer"])
+    valid = day != NAT_DAY
+
+    in_5to3 = valid & (day >= five) & (day < two)
+    in_2 = valid & (day >= two) & (day < end)
+
+    first_day = np.minimum.reduceat(np.where(valid, day, MAX_DAY), starts)
+    last_day = np.maximum.reduceat(np.where(valid, day, NAT_DAY), starts)
+    month_mask = np.bitwise_or.reduceat(month_bits_of_days(day), starts)
+
+    first_kaufdatum = pd.to_datetime(np.where(first_day == MAX_DAY, np.nan, first_day), unit="D")
+    recency = pd.to_datetime(np.where(last_day == NAT_DAY, np.nan, last_day), unit="D")
+    # Seasonal flags only need to know whether there are at least two order years
+    multi_year = first_kaufdatum.year < recency.year
+    year_count = np.where(multi_year, 2, np.where(recency.notna(), 1, 0))
+
+    return {
+        "first_kaufdatum": first_kaufdatum,
+        "recency": recency,
+        "gesamt_frequency": distinct_orders(index, np.ones(len(day), dtype=bool)),
+        "gesamt_monetary": np.bincount(customer, weights=netto, minlength=n),
+        "freq_3_to_5_years_ago": distinct_orders(index, in_5to3),
+        "monetary_3_to_5_years_ago": np.bincount(customer, weights=netto * in_5to3, minlength=n),
+        "freq_last_2_years": distinct_orders(index, in_2),
+        "monetary_last_2_years": np.bincount(customer, weights=netto * in_2, minlength=n),
+        "month_mask": month_mask,
+        "year_count": year_count,
+    }
+
+
+def index_dir(land):
+    return os.path.join(CACHE_DIR, f"order_index_{land}")
+
+
+def save_order_index(index, directory, fingerprint):
+    tmp = f"{directory}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(tmp, f"{name}.npy"), index[name], allow_pickle=False)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "fingerprint": fingerprint}, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+def load_order_index(directory, fingerprint):
+    # Memory-mapped arrays of a persisted index, None if missing or stale
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != INDEX_VERSION or meta.get("fingerprint") != fingerprint:
+        return None
+    return {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+        for name in INDEX_ARRAYS
+    }
+
+
+def order_index_for_land(land):
+    # Persisted index of V2AD1056, rebuilt when the extract changes
+    path = extract_path(land, "V2AD1056")
+    fingerprint = source_fingerprint(path)
+    directory = index_dir(land)
+    index = load_order_index(directory, fingerprint)
+    if index is None:
+        orders = order_lines(load_extract(land, "V2AD1056", "rfm"))
+        index = build_order_index(orders)
+        save_order_index(index, directory, fingerprint)
+    return index
@@ -0,0 +1,231 @@
+## Compiled per-customer kernels over the customer-sorted order index (order_index.py)
+## and the half-year recency binning of calculate_rfm_scores.
+## segment_aggregates walks the lines of each customer once (they are sorted by
+## customer and order) and returns first/last order day, distinct orders, lifetime and
+## window sums, the month mask and the year count. The sums are compensated in line
+## order and skip missing amounts like the pandas groupby sums, so they match the
+## pandas engine bit for bit. group_sums continues such sums over further lines, for
+## the aggregates that are built chunk by chunk (order_aggregates.fold_order_lines).
+## recency_scores bins the last order dates by binary search over the half-year edges.
+## The kernels are compiled with Numba (njit) when it is installed; RFM_KERNELS=numpy
+## (or "pandas" for the binning) selects the fallbacks. The NumPy reductions in
+## order_index sum plainly, so their sums can differ from the pandas engine in the
+## last bits; the binning gives the same scores with every backend.
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from helper import MISSING_MONTH_BIT
+
+
+BACKENDS = ("numba", "numpy", "pandas")
+NAT_DAY = np.iinfo(np.int32).min
+MAX_DAY = np.iinfo(np.int32).max
+NAT = np.iinfo(np.int64).min
+
+
+def kernel_backend(backend=None):
+    # Explicit backend, else RFM_KERNELS, else numba when it can be imported
+    backend = backend or os.environ.get("RFM_KERNELS") or ("numba" if numba is not None else "numpy")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "numba" and numba is None:
+        raise ImportError("The numba kernels need the numba package")
+    return backend
+
+
+def njit(func):
+    # Compiled (and cached on disk) with Numba, the plain Python function without it
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+@njit
+def civil_year_month(day):
+    # Days since 1970-01-01 -> (year, month 1-12), proleptic Gregorian
+    z = day + 719468
+    era = (z if z >= 0 else z - 146096) // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400 + (1 if month <= 2 else 0)
+    return year, month
+
+
+@njit
+def compensated_add(total, compensation, value):
+    # One step of the Kahan summation of pandas' group_sum
+    y = value - compensation
+    t = total + y
+    compensation = t - total - y
+    if compensation != compensation:
+        compensation = 0.0
+    return t, compensation
+
+
+@njit
+def segment_kernel(offsets, order, day, netto, five, two, end):
+    n = len(offsets) - 1
+    first_day = np.full(n, MAX_DAY, dtype=np.int64)
+    last_day = np.full(n, NAT_DAY, dtype=np.int64)
+    frequency = np.zeros((n, 3), dtype=np.int64)
+    monetary = np.zeros((n, 3), dtype=np.float64)
+    month_mask = np.zeros(n, dtype=np.int64)
+    year_count = np.zeros(n, dtype=np.int64)
+
+    for c in range(n):
+        sums = np.zeros(3)
+        compensation = np.zeros(3)
+        last_order = np.full(3, -1, dtype=np.int64)
+        mask = 0
+        for i in range(offsets[c], offsets[c + 1]):
+            d = day[i]
+            valid = d != NAT_DAY
+            if valid:
+                first_day[c] = min(first_day[c], d)
+                last_day[c] = max(last_day[c], d)
+                mask |= 1 << (civil_year_month(d)[1] - 1)
+            else:
+                mask |= MISSING_MONTH_BIT
+            # 0: lifetime, 1: 3-5 years ago, 2: last 2 years
+            for w in range(3):
+                if w == 1 and not (valid and d >= five and d < two):
+                    continue
+                if w == 2 and not (valid and d >= two and d < end):
+                    continue
+                # Missing amounts are skipped, like NaN in the pandas group_sum
+                if netto[i] == netto[i]:
+                    sums[w], compensation[w] = compensated_add(sums[w], compensation[w], netto[i])
+                # Lines are sorted by order within a customer: count each order once
+                if order[i] >= 0 and order[i] != last_order[w]:
+                    frequency[c, w] += 1
+                    last_order[w] = order[i]
+        monetary[c] = sums
+        month_mask[c] = mask
+        if last_day[c] != NAT_DAY:
+            multi_year = civil_year_month(first_day[c])[0] < civil_year_month(last_day[c])[0]
+            year_count[c] = 2 if multi_year else 1
+    return first_day, last_day, frequency, monetary, month_mask, year_count
+
+
+def segment_aggregates(index, five, two, end):
+    # Kernel output as the column dict of order_index.aggregate_order_index
+    first_day, last_day, frequency, monetary, month_mask, year_count = segment_kernel(
+        np.asarray(index["offsets"], dtype=np.int64),
+        np.asarray(index["order"], dtype=np.int64),
+        np.asarray(index["day"], dtype=np.int64),
+        np.asarray(index["netto"], dtype=np.float64),
+        five, two, end,
+    )
+    return {
+        "first_kaufdatum": pd.to_datetime(np.where(first_day == MAX_DAY, np.nan, first_day), unit="D"),
+        "recency": pd.to_datetime(np.where(last_day == NAT_DAY, np.nan, last_day), unit="D"),
+        "gesamt_frequency": frequency[:, 0],
+        "gesamt_monetary": monetary[:, 0],
+        "freq_3_to_5_years_ago": frequency[:, 1],
+        "monetary_3_to_5_years_ago": monetary[:, 1],
+        "freq_last_2_years": frequency[:, 2],
+        "monetary_last_2_years": monetary[:, 2],
+        "month_mask": month_mask,
+        "year_count": year_count,
+    }
+
+
+@njit
+def group_sum_kernel(codes, windows, values, totals, compensation):
+    # Continues the compensated sums of the groups over values in line order;
+    # windows[i, w] says whether value i goes into sum w
+    for i in range(len(codes)):
+        v = values[i]
+        if v != v:
+            continue
+        c = codes[i]
+        for w in range(totals.shape[1]):
+            if windows[i, w]:
+                totals[c, w], compensation[c, w] = compensated_add(totals[c, w], compensation[c, w], v)
+
+
+def numpy_group_sums(codes, windows, values, totals, compensation):
+    # The same additions vectorized over the groups: the k-th value of every group is
+    # added in step k, so each group still sums in line order
+    for w in range(totals.shape[1]):
+        selected = windows[:, w] & ~np.isnan(values)
+        group, value = codes[selected], values[selected]
+        by_group = np.argsort(group, kind="stable")
+        group, value = group[by_group], value[by_group]
+        starts = np.flatnonzero(np.diff(group, prepend=-1))
+        rank = np.arange(len(group)) - np.repeat(starts, np.diff(np.append(starts, len(group))))
+        by_rank = np.argsort(rank, kind="stable")
+        steps = np.flatnonzero(np.diff(rank[by_rank], prepend=-1))
+        for rows in np.split(by_rank, steps[1:]):
+            g, v = group[rows], value[rows]
+            total, comp = totals[g, w], compensation[g, w]
+            y = v - comp
+            t = total + y
+            comp = t - total - y
+            comp[comp != comp] = 0.0
+            totals[g, w], compensation[g, w] = t, comp
+
+
+def group_sums(codes, windows, values, totals, compensation, backend=None):
+    # Adds values to the per-group (sum, compensation) state in place, in line order and
+    # skipping NaN, so that sums carried across chunks match one pandas groupby sum
+    codes = np.asarray(codes, dtype=np.int64)
+    windows = np.asarray(windows, dtype=np.bool_)
+    values = np.asarray(values, dtype=np.float64)
+    if kernel_backend(backend) == "numba":
+        group_sum_kernel(codes, windows, values, totals, compensation)
+    else:
+        numpy_group_sums(codes, windows, values, totals, compensation)
+    return totals, compensation
+
+
+@njit
+def bin_kernel(values, edges, labels):
+    # labels[i] for edges[i] <= value < edges[i + 1], 0 outside the edges and for NaT
+    result = np.zeros(len(values), dtype=np.int64)
+    for i in range(len(values)):
+        v = values[i]
+        if v == NAT or v < edges[0] or v >= edges[-1]:
+            continue
+        lo, hi = 0, len(edges) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if edges[mid] <= v:
+                lo = mid
+            else:
+                hi = mid
+        result[i] = labels[lo]
+    return result
+
+
+def recency_scores(recency, bin_edges, bin_labels, backend=None):
+    # r_score of calculate_rfm_scores: the label of the half-year bin, 0 if none
+    backend = kernel_backend(backend)
+    recency = pd.Series(pd.to_datetime(recency))
+    if backend == "pandas":
+        return pd.cut(
+            recency, bins=bin_edges, labels=bin_labels, right=False, include_lowest=True, ordered=False,
+        ).astype("Int64").fillna(0).astype(int)
+
+    # Compared as int64 ticks of one unit, NaT is the smallest int64
+    unit = np.datetime_data(recency.dtype)[0]
+    values = recency.to_numpy().view(np.int64)
+    edges = pd.DatetimeIndex(bin_edges).as_unit(unit).asi8
+    labels = np.asarray(bin_labels, dtype=np.int64)
+    if backend == "numba":
+        scores = bin_kernel(values, edges, labels)
+    else:
+        bins = np.searchsorted(edges, values, side="right") - 1
+        inside = (values != NAT) & (bins >= 0) & (bins < len(labels))
+        scores = np.where(inside, labels[np.clip(bins, 0, len(labels) - 1)], 0)
+    return pd.Series(scores, index=recency.index).astype(int)
@@ -0,0 +1,96 @@
+## Run the per-land work of a flow in separate worker processes.
+## The lands share no data, so with one worker per land a run takes about as long as
+## the largest land. Each worker can be capped in memory so four lands in parallel
+## cannot take the machine down. The workers are spawned, not forked: the parent runs
+## a Prefect flow whose threads, event loop and logging locks a fork would copy in
+## whatever state they are in, which can leave a worker blocked for good.
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from instrumentation import run_logger
+
+
+def limit_memory(memory_limit_gb):
+    # Address space cap for the worker process, allocations beyond it raise MemoryError
+    if memory_limit_gb is None or resource is None:
+        return
+    limit = int(memory_limit_gb * 1024**3)
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError) as e:
+        run_logger().warning(f"Could not set a {memory_limit_gb} GB memory limit in worker {os.getpid()}: {e}")
+
+
+def init_worker(memory_limit_gb, workers):
+    # Memory cap plus the number of land workers sharing the machine, from which the
+    # DuckDB engine derives its own memory and thread limits (order_duckdb.connect)
+    limit_memory(memory_limit_gb)
+    os.environ["RFM_LAND_WORKERS"] = str(workers)
+
+
+def prefect_api_url():
+    # API of the running flow (its temporary server when no PREFECT_API_URL is set),
+    # None outside a flow run
+    try:
+        from prefect.client.orchestration import get_client
+        from prefect.context import FlowRunContext
+    except ImportError:
+        return None
+    if FlowRunContext.get() is None:
+        return None
+    with get_client(sync_client=True) as client:
+        return str(client.api_url)
+
+
+@contextmanager
+def worker_environment():
+    # Spawned workers read the Prefect settings from the environment when they import
+    # prefect; without PREFECT_API_URL each would start a temporary server of its own
+    if os.environ.get("PREFECT_API_URL"):
+        yield
+        return
+    api_url = prefect_api_url()
+    if api_url:
+        os.environ["PREFECT_API_URL"] = api_url
+    try:
+        yield
+    finally:
+        os.environ.pop("PREFECT_API_URL", None)
+
+
+def run_lands(func, lands, workers=1, memory_limit_gb=None, **kwargs):
+    # func must be a module-level function taking the land as first argument;
+    # workers=None runs one worker process per land
+    if workers is not None and workers <= 1:
+        return {land: func(land, **kwargs) for land in lands}
+
+    logger = run_logger()
+    results, errors = {}, {}
+    workers = len(lands) if workers is None else min(workers, len(lands))
+    with worker_environment(), ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(memory_limit_gb, workers),
+    ) as pool:
+        futures = {pool.submit(func, land, **kwargs): land for land in lands}
+        for future in as_completed(futures):
+            land = futures[future]
+            try:
+                results[land] = future.result()
+                logger.info(f"{land} done")
+            except Exception as e:
+                errors[land] = e
+                logger.error(f"{land} failed: {e!r}")
+
+    # Let the other lands finish before reporting the failed ones
+    if errors:
+        raise RuntimeError(f"Processing failed for {sorted(errors)}") from next(iter(errors.values()))
+    return {land: results[land] for land in lands}
@@ -0,0 +1,67 @@
+## Background loading of the next lands' inputs from the network share.
+## While one land is being scored, the inputs of the following land(s) are already
+## read in a background thread. At most `depth` lands are loaded ahead, so memory
+## stays at the current land plus `depth` prefetched ones.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class Prefetcher:
+    def __init__(self, load, lands, depth=1, **kwargs):
+        self.load = load
+        self.lands = list(lands)
+        self.depth = max(depth, 0)
+        self.kwargs = kwargs
+        self.futures = {}
+        self.next_index = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max(self.depth, 1), thread_name_prefix="prefetch")
+        with self.lock:
+            self.fill()
+
+    def fill(self):
+        # Keep up to `depth` lands loading or loaded ahead of the one being processed
+        while len(self.futures) < self.depth and self.next_index < len(self.lands):
+            land = self.lands[self.next_index]
+            self.futures[land] = self.pool.submit(self.load, land, **self.kwargs)
+            self.next_index += 1
+
+    def take(self, land):
+        with self.lock:
+            future = self.futures.pop(land, None)
+            if future is None and land in self.lands[self.next_index:]:
+                # Requested out of order: skip ahead to it
+                self.next_index = self.lands.index(land) + 1
+        data = future.result() if future is not None else self.load(land, **self.kwargs)
+        with self.lock:
+            self.fill()
+        return data
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.pool.shutdown(wait=True)
+        self.futures = {}
+
+
+_active = None
+
+
+@contextmanager
+def prefetch_lands(load, lands, depth=1, **kwargs):
+    # Within this block take_prefetched() serves the lands from the prefetcher
+    global _active
+    _active = Prefetcher(load, lands, depth=depth, **kwargs)
+    try:
+        yield _active
+    finally:
+        _active.close()
+        _active = None
+
+
+def take_prefetched(land, load, **kwargs):
+    prefetcher = _active
+    if prefetcher is not None and land in prefetcher.lands and kwargs == prefetcher.kwargs:
+        return prefetcher.take(land)
+    return load(land, **kwargs)
@@ -2,6 +2,9 @@ import pandas as pd
 import datetime as dt
 from helper import *
 from paths import *
+from extract_cache import read_workbook
+from schemas import apply_schema, load_extract, schema_columns
+from excel_export import export_segments
 
 lands = ["F01", "F02", "F03", "F04"]
 land = 'F01'
@@ -10,31 +13,28 @@ five_years_ago_start, two_years_ago_start, today = get_halfyear_reference_dates(
 half_year_info = get_half_year_info(land=land)
 print(half_year_info)
 ### ============== Import Files ============== ###
-addresses = pd.read_csv(
-    f"/Volumes/MARAL/CSV/{land}/V2AD1001.csv",
-    sep=";",
-    encoding="cp850",
-    usecols=["NUMMER", "SYS_ANLAGE", "QUELLE", "GEBURT", "PLZ", "ANREDE"],
-    parse_dates=["SYS_ANLAGE", "GEBURT"],
-    low_memory=False,
-)
-v21056 = pd.read_csv(
-    f"/Volumes/MARAL/CSV/{land}/V2AD1056.csv", sep=";", encoding="cp850", parse_dates=["AUF_ANLAGE"]
-)
+addresses = load_extract(land, "V2AD1001", "rfm_script")
+v21056 = load_extract(land, "V2AD1056", "rfm_script")
 
-inx = pd.read_excel(
-    inx_path, usecols=["NUMMER", "NL_TYPE"]
+inx = apply_schema(
+    read_workbook(inx_path, columns=schema_columns("rfm_script", "inxmail")), "rfm_script", "inxmail"
 )  ## To be Updated with the path from the inxmail automated list
-kw = pd.read_csv(
-    f"Data/kw_{land}.csv", sep=";", encoding="cp850", usecols=["NUMMER", "Kundengruppe"]
+kw = apply_schema(
+    pd.read_csv(
+        f"Data/kw_{land}.csv", sep=";", encoding="cp850", usecols=schema_columns("rfm_script", "kw")
+    ),
+    "rfm_script",
+    "kw",
+    source=f"kw_{land}",
 )
 
 ### ============== Clean-up Tables ============== ###
 
-addresses = pad_column_with_zeros(addresses, "NUMMER")
-inx = pad_column_with_zeros(inx, "NUMMER")
-kw = pad_column_with_zeros(kw, "NUMMER")
-v21056["NUMMER"] = v21056["VERWEIS"].str[2:12]
+## Customer numbers as int64 keys, padded again only for the export
+addresses["NUMMER"] = customer_keys(addresses["NUMMER"], "V2AD1001")
+inx["NUMMER"] = customer_keys(inx["NUMMER"], "Inxmail")
+kw["NUMMER"] = customer_keys(kw["NUMMER"], f"kw_{land}")
+v21056["NUMMER"] = customer_keys(v21056["VERWEIS"].str[2:12], "V2AD1056 VERWEIS", errors="coerce")
 
 addresses["SYS_ANLAGE"] = pd.to_datetime(
     addresses["SYS_ANLAGE"], format="%Y-%m-%d", errors="coerce"
@@ -104,18 +104,12 @@ addresses_grouped = (
         recency=("AUF_ANLAGE", "max"),
         gesamt_frequency=("AUFTRAG_NR", "nunique"),
         gesamt_monetary=("NETTO_UMSATZ", "sum"),
-        seasonal_ostern=(
-            "AUF_ANLAGE",
-            seasonal_ostern,
-        ),  ## Computing if they only shop during Easter
-        seasonal_weihnachten=(
-            "AUF_ANLAGE",
-            seasonal_weihnachten,
-        ),  ## Computing if they only shop during Christmas
         kundengruppe=("Kundengruppe", "first"),
     )
-    .reset_index()
 )
+## Computing if they only shop during Easter / Christmas (month bitmask per customer)
+season_mask = season_masks(address_details["NUMMER"], address_details["AUF_ANLAGE"])
+addresses_grouped = addresses_grouped.join(season_flags(season_mask)).reset_index()
 
 ## Removing those who had only 2 Orders and returned one of their orders (so they are not really seasonal customers)
 addresses_grouped.loc[addresses_grouped["gesamt_frequency"] == 1, "seasonal_ostern"] = (
@@ -191,8 +185,7 @@ addresses_details_last5years["gesamt_monetary"] = addresses_details_last5years[
 final_addresses = addresses_details_last5years.sort_values(
     by="gesamt_frequency", ascending=False
 )
-final_addresses["anrede"] = final_addresses["anrede"].apply(process_anrede)
-final_addresses["anrede"] = final_addresses["anrede"].replace(anrede)
+final_addresses["anrede"] = normalize_anrede(final_addresses["anrede"])
 final_addresses = assign_age(final_addresses)
 final_addresses = final_addresses.rename(columns={"quelle": "QUELLE"})
 final_addresses = assign_sources(final_addresses)
@@ -296,7 +289,9 @@ final_addresses["mf_score"] = round(
 )
 
 #### ============== Assigning RFM Labels ============== ###
-final_addresses["rfm_label"] = final_addresses.apply(assign_rfm_label, axis=1)
+final_addresses["rfm_label"] = assign_rfm_labels(
+    final_addresses["mf_score"], final_addresses["r_score"]
+)
 
 ## Adding the Interessenten labels to the rfm_label columns
 final_addresses.loc[
@@ -342,9 +337,10 @@ kundengruppe = [
 kw = kw.rename(columns={"Kundengruppe": "Alte_Kundengeruppe"})
 filtered_final_merged = final_addresses.merge(kw, on="NUMMER", how="left")
 filtered_final_merged = filtered_final_merged.drop_duplicates(subset="NUMMER")
+filtered_final_merged["NUMMER"] = format_customer_keys(filtered_final_merged["NUMMER"])
 
 gesamt_table = (
-    filtered_final_merged.groupby(["rfm_label", "Alte_Kundengeruppe"])
+    filtered_final_merged.groupby(["rfm_label", "Alte_Kundengeruppe"], observed=True)
     .agg(Anzahl_Kunden=("NUMMER", "count"), NL_KUNDEN=("nl_type", "count"))
     .reset_index()
 )
@@ -368,45 +364,7 @@ gesamt_gesamt = gesamt_gesamt.sort_values(by="rfm_label")
 #         )
 
 filtered_final_merged.to_csv(f'/Volumes/MARAL/Data/rfm_labels/rfm_labels_{land}.csv', sep=';', index=False, encoding='cp850')
-with pd.ExcelWriter(f"Data/rfm_segments_{today.date()}_{land}.xlsx", engine="xlsxwriter") as writer:
-    for item in kundengruppe:
-        df = filtered_final_merged[filtered_final_merged["rfm_label"] == item]
-        df.to_excel(writer, sheet_name=item, index=False)
-
-        workbook = writer.book
-        worksheet = writer.sheets[item]
-
-        # Define formats
-        date_format = workbook.add_format(
-            {"num_format": "yyyy-mm-dd"}
-        )  # YYYY-MM-DD format
-        currency_format = workbook.add_format(
-            {"num_format": "#,##0 [$€-1];[Red]-#,##0 [$€-1]"}
-        )
-        yellow_fill = workbook.add_format({"bg_color": "#FFFF00"})
-        default_format = workbook.add_format()
-
-        # Set all columns to width 22
-        worksheet.set_column("A:X", 22)
-
-        # Apply date format to columns G and H
-        worksheet.set_column("G:G", 22, date_format)
-        worksheet.set_column("H:H", 22, date_format)
-
-        # Apply currency format to selected columns
-        for col in ["J", "N", "P", "R"]:
-            worksheet.set_column(f"{col}:{col}", 22, currency_format)
-
-        # Highlight and hide M:P
-        worksheet.set_column("M:P", 22, yellow_fill)
-        worksheet.set_column("M:P", 22, None, {"hidden": True})
-
-        # Highlight and hide T:U
-        worksheet.set_column("T:U", 22, yellow_fill)
-        worksheet.set_column("T:U", 22, None, {"hidden": True})
-
-        # Approximate autofit for column X
-        worksheet.set_column("X:X", 22)
+export_segments(filtered_final_merged, f"Data/rfm_segments_{today.date()}_{land}.xlsx", kundengruppe)
 
 
 # Export with formatting
@@ -1,8 +1,25 @@
 import pandas as pd
 import datetime as dt
+import os
 from prefect import task, flow
 from helper import *
 from paths import *
+from extract_cache import extract_path, read_workbook
+from incremental import incremental_order_aggregates
+from order_aggregates import aggregate_orders, join_customers, order_lines, stream_order_aggregates
+from order_index import aggregate_order_index, order_index_for_land
+from order_duckdb import aggregate_orders_duckdb
+from order_kernels import recency_scores
+from parallel import run_lands
+from schemas import apply_schema, load_extract, schema_columns
+from excel_export import export_segments
+from label_export import write_label_table
+from kw_handoff import kw_csv_path, kw_ipc_path, load_kw_labels
+from instrumentation import instrumented, profiling, run_logger, task_metrics
+from task_cache import CACHED_STAGE, refresh_task_cache, stage_cache
+from frame_handoff import arrow_frames, frame_handoff
+from prefetch import prefetch_lands, take_prefetched
+from concurrent.futures import ThreadPoolExecutor
 
 # Constants
 LANDS = ["F01", "F02", "F03", "F04"]
@@ -12,116 +29,91 @@ KUNDENGRUPPE = [
     "Vielversprechende Kunden", "Abwandernde Kunden", "Schlafende Kunden",
     "Verlorene Kunden", "Interessenten", "Nicht klassifiziert"
 ]
+# Order aggregation engines: groupby-based, the persisted customer-sorted order index or
+# SQL in an embedded DuckDB database
+ENGINES = ("pandas", "index", "duckdb")
+# Labeled customer tables (rfm_labels_<land>_prefect.*)
+LABEL_DIR = os.environ.get("RFM_LABEL_DIR", "/Volumes/MARAL/Data/rfm_labels")
 
 @task
+@instrumented
 def get_reference_dates():
     # Use the helper function to get properly typed datetime objects
     five_years_ago_start, two_years_ago_start, today = get_halfyear_reference_dates()
     return five_years_ago_start, two_years_ago_start, pd.Timestamp(today)
 
-@task
-def load_data(land):
-    # Load addresses
-    addresses = pd.read_csv(
-        f"/Volumes/MARAL/CSV/{land}/V2AD1001.csv",
-        sep=";",
-        encoding="cp850",
-        usecols=["NUMMER", "SYS_ANLAGE", "QUELLE", "GEBURT", "PLZ", "ANREDE"],
-        parse_dates=["SYS_ANLAGE", "GEBURT"],
-        low_memory=False,
-    )
-    
-    # Load V2AD1056
-    v21056 = pd.read_csv(
-        f"/Volumes/MARAL/CSV/{land}/V2AD1056.csv", 
-        sep=";", 
-        encoding="cp850", 
-        parse_dates=["AUF_ANLAGE"]
-    )
-    
-    # Load inxmail data
-    inx = pd.read_excel(inx_path, usecols=["NUMMER", "NL_TYPE"])
-    
-    # Load KW data
-    kw = pd.read_csv(
-        f"Data/kw_{land}.csv", 
-        sep=";", 
-        encoding="cp850", 
-        usecols=["NUMMER", "Kundengruppe"]
-    )
-    
-    return addresses, v21056, inx, kw
+def read_addresses(land):
+    # Served from the columnar cache after the first parse
+    return load_extract(land, "V2AD1001", "rfm")
+
+
+def read_orders(land, incremental=False, streaming=False, engine="pandas"):
+    # V2AD1056 for the pandas engine. In streaming mode the orders are aggregated chunk
+    # by chunk later on, in incremental mode only the new lines are merged into the
+    # persisted customer aggregates, the index engine reads its persisted order index
+    # and the duckdb engine scans the extract itself.
+    if streaming or incremental or engine != "pandas":
+        return None
+    return load_extract(land, "V2AD1056", "rfm")
+
+
+def read_inxmail():
+    # Parsed once per run and served from the columnar cache while the workbook is unchanged
+    inx = read_workbook(inx_path, columns=schema_columns("rfm", "inxmail"))
+    return apply_schema(inx, "rfm", "inxmail")
+
+
+def read_kw(land):
+    # Arrow table published by the KW stage (memory-mapped Data/kw_<land>.arrow),
+    # Data/kw_<land>.csv if there is none
+    kw = load_kw_labels(land)
+    return apply_schema(kw, "rfm", "kw", source=f"kw_{land}")
+
+
+def read_land_inputs(land, incremental=False, streaming=False, engine="pandas", with_addresses=True):
+    # The four inputs of a land are read concurrently from the share. Without
+    # with_addresses the caller already has V2AD1001 and the KW labels (combined flow).
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"load_{land}") as pool:
+        addresses = pool.submit(read_addresses, land) if with_addresses else None
+        v21056 = pool.submit(read_orders, land, incremental, streaming, engine)
+        inx = pool.submit(read_inxmail)
+        kw = pool.submit(read_kw, land) if with_addresses else None
+        return (
+            addresses.result() if addresses is not None else None,
+            v21056.result(),
+            inx.result(),
+            kw.result() if kw is not None else None,
+        )
 
-@task
-def clean_data(addresses, v21056, inx, kw, land):
-    # Pad with zeros
-    addresses = pad_column_with_zeros(addresses, "NUMMER")
-    inx = pad_column_with_zeros(inx, "NUMMER")
-    kw = pad_column_with_zeros(kw, "NUMMER")
-    
-    # Extract NUMMER from VERWEIS
-    v21056["NUMMER"] = v21056["VERWEIS"].str[2:12]
-    
-    # Convert dates
-    addresses["SYS_ANLAGE"] = pd.to_datetime(addresses["SYS_ANLAGE"], format="%Y-%m-%d", errors="coerce")
-    addresses["GEBURT"] = pd.to_datetime(addresses["GEBURT"], format="%Y-%m-%d", errors="coerce")
-    v21056["AUF_ANLAGE"] = pd.to_datetime(v21056["AUF_ANLAGE"], format="%Y-%m-%d", errors="coerce")
-    
-    return addresses, v21056, inx, kw
 
 @task
-def merge_data(addresses, v21056, inx):
-    # Merge all data
-    address_details = pd.merge(addresses, v21056, on="NUMMER", how="left")
-    address_details = pd.merge(address_details, inx, on="NUMMER", how="left")
-    
-    # Compute netto umsatz
-    address_details["NETTO_UMSATZ"] = (
-        address_details["BEST_WERT"]
-        - address_details["MWST1"]
-        - address_details["MWST2"]
-        - address_details["MWST3"]
-    )
-    
-    # Clean up table
-    address_details = address_details[
-        [
-            "NUMMER", "QUELLE", "GEBURT", "SYS_ANLAGE", "PLZ", "ANREDE", "NL_TYPE",
-            "AUFTRAG_NR", "MEDIACODE", "BEST_WERT", "MWST1", "MWST2", "MWST3",
-            "NETTO_UMSATZ", "AUF_ANLAGE"
-        ]
-    ]
-    
-    return address_details
+@instrumented
+def load_data(land, incremental=False, streaming=False, engine="pandas", with_addresses=True):
+    # Inputs prefetched by main_flow are picked up here, otherwise they are read now
+    options = {"incremental": incremental, "streaming": streaming, "engine": engine}
+    if not with_addresses:
+        return read_land_inputs(land, **options, with_addresses=False)
+    return take_prefetched(land, read_land_inputs, **options)
 
 @task
-def group_addresses(address_details, half_year_info):
-    # First perform the grouping to create first_kaufdatum
-    addresses_grouped = (
-        address_details.groupby("NUMMER")
-        .agg(
-            geburt=("GEBURT", "first"),
-            anrede=("ANREDE", "first"),
-            QUELLE=("QUELLE", "first"),
-            plz=("PLZ", "first"),
-            nl_type=("NL_TYPE", "first"),
-            registered_since=("SYS_ANLAGE", "first"),
-            first_kaufdatum=("AUF_ANLAGE", "min"),
-            recency=("AUF_ANLAGE", "max"),
-            gesamt_frequency=("AUFTRAG_NR", "nunique"),
-            gesamt_monetary=("NETTO_UMSATZ", "sum"),
-            seasonal_ostern=("AUF_ANLAGE", seasonal_ostern),
-            seasonal_weihnachten=("AUF_ANLAGE", seasonal_weihnachten),
-        )
-        .reset_index()
-    )
+@instrumented
+def clean_data(addresses, v21056, inx, kw, land):
+    # Customer numbers as int64 keys (padded again only in export_results), ISO dates.
+    # Addresses already normalized by the combined flow pass through unchanged.
+    addresses = normalize_addresses(addresses)
+    inx["NUMMER"] = customer_keys(inx["NUMMER"], "Inxmail")
+    kw["NUMMER"] = customer_keys(kw["NUMMER"], f"kw_{land}")
     
-    # Initialize Kundengruppe column
-    addresses_grouped["kundengruppe"] = None
+    # Order lines: NUMMER from VERWEIS, netto umsatz, parsed dates (nothing is loaded
+    # yet in streaming and incremental mode and for the index and duckdb engines)
+    if v21056 is not None:
+        v21056 = order_lines(v21056)
     
-    return addresses_grouped
+    return addresses, v21056, inx, kw
 
-@task
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
 def process_customer_groups(addresses_grouped, half_year_info):
     # Clean seasonal flags
     addresses_grouped.loc[addresses_grouped["gesamt_frequency"] == 1, "seasonal_ostern"] = False
@@ -153,46 +145,9 @@ def process_customer_groups(addresses_grouped, half_year_info):
     return addresses_grouped
 
 
-@task
-def split_time_periods(address_details, five_years_ago_start, two_years_ago_start, today):
-    # Ensure all dates are pandas Timestamps for consistent comparison
-    address_detail_5to3 = address_details[
-        (address_details["AUF_ANLAGE"] >= pd.Timestamp(five_years_ago_start)) &
-        (address_details["AUF_ANLAGE"] < pd.Timestamp(two_years_ago_start))
-    ]
-    
-    address_details_2 = address_details[
-        (address_details["AUF_ANLAGE"] >= pd.Timestamp(two_years_ago_start)) &
-        (address_details["AUF_ANLAGE"] < pd.Timestamp(today))
-    ]
-    
-    return address_detail_5to3, address_details_2
-
-@task
-def calculate_time_period_metrics(address_detail_5to3, address_details_2):
-    # Calculate metrics for 3-5 years ago
-    last_3_to_5_years = (
-        address_detail_5to3.groupby("NUMMER")
-        .agg(
-            freq_3_to_5_years_ago=("AUFTRAG_NR", "nunique"),
-            monetary_3_to_5_years_ago=("NETTO_UMSATZ", "sum"),
-        )
-        .reset_index()
-    )
-    
-    # Calculate metrics for last 2 years
-    last_2_years = (
-        address_details_2.groupby("NUMMER")
-        .agg(
-            freq_last_2_years=("AUFTRAG_NR", "nunique"),
-            monetary_last_2_years=("NETTO_UMSATZ", "sum"),
-        )
-        .reset_index()
-    )
-    
-    return last_3_to_5_years, last_2_years
-
-@task
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
 def merge_time_periods(addresses_grouped, last_3_to_5_years, last_2_years):
     # Merge time periods
     last_5_years = last_3_to_5_years.merge(last_2_years, on="NUMMER", how="outer")
@@ -208,14 +163,19 @@ def merge_time_periods(addresses_grouped, last_3_to_5_years, last_2_years):
     
     return addresses_details_last5years
 
-@task
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
 def final_processing(final_addresses):
     # Process anrede and age groups
-    final_addresses["anrede"] = final_addresses["anrede"].apply(process_anrede)
-    final_addresses["anrede"] = final_addresses["anrede"].replace(anrede)
+    final_addresses["anrede"] = normalize_anrede(final_addresses["anrede"])
     final_addresses = assign_age(final_addresses)
     final_addresses = final_addresses.rename(columns={"quelle": "QUELLE"})
-    final_addresses = assign_sources(final_addresses)
+    final_addresses, source_hits = assign_sources(final_addresses, return_hits=True)
+    altcodes = source_hits[source_hits["SOURCE"] == ALTCODE]
+    run_logger().info(
+        f"{int(altcodes['rows'].sum())} customers with {int(altcodes['codes'].sum())} QUELLE codes left as {ALTCODE}"
+    )
     
     # Reorder columns
     final_addresses = final_addresses[
@@ -238,19 +198,14 @@ def final_processing(final_addresses):
     
     return final_addresses
 
-@task
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
 def calculate_rfm_scores(final_addresses, reference_date):
     # Recency score
     bin_edges, bin_labels = get_halfyear_bins(reference_date)
     final_addresses["recency"] = pd.to_datetime(final_addresses["recency"])
-    final_addresses["r_score"] = pd.cut(
-        final_addresses["recency"],
-        bins=bin_edges,
-        labels=bin_labels,
-        right=False,
-        include_lowest=True,
-        ordered=False,
-    ).astype("Int64").fillna(0).astype(int)
+    final_addresses["r_score"] = recency_scores(final_addresses["recency"], bin_edges, bin_labels)
     
     # Monetary score
     monetary_bins = [0, 48, 98, 208, 603, float("inf")]
@@ -281,7 +236,9 @@ def calculate_rfm_scores(final_addresses, reference_date):
     )
     
     # RFM labels
-    final_addresses["rfm_label"] = final_addresses.apply(assign_rfm_label, axis=1)
+    final_addresses["rfm_label"] = assign_rfm_labels(
+        final_addresses["mf_score"], final_addresses["r_score"]
+    )
     
     # Special cases
     final_addresses.loc[
@@ -299,16 +256,22 @@ def calculate_rfm_scores(final_addresses, reference_date):
     
     return final_addresses
 
+# Not cached: its result is the files it writes, which a cache hit would skip
 @task
-def export_results(final_addresses, kw, land, today):
+@arrow_frames
+@instrumented
+def export_results(
+    final_addresses, kw, land, today, excel_per_segment=False, excel_workers=1, label_formats=("csv",)
+):
     # Merge with KW data
     kw = kw.rename(columns={"Kundengruppe": "Alte_Kundengeruppe"})
     filtered_final_merged = final_addresses.merge(kw, on="NUMMER", how="left")
     filtered_final_merged = filtered_final_merged.drop_duplicates(subset="NUMMER")
+    filtered_final_merged["NUMMER"] = format_customer_keys(filtered_final_merged["NUMMER"])
     
     # Create summary tables
     gesamt_table = (
-        filtered_final_merged.groupby(["rfm_label", "Alte_Kundengeruppe"])
+        filtered_final_merged.groupby(["rfm_label", "Alte_Kundengeruppe"], observed=True)
         .agg(Anzahl_Kunden=("NUMMER", "count"), NL_KUNDEN=("nl_type", "count"))
         .reset_index()
     )
@@ -327,49 +290,23 @@ def export_results(final_addresses, kw, land, today):
     )
     gesamt_gesamt = gesamt_gesamt.sort_values(by="rfm_label")
     
-    # Export CSV
-    filtered_final_merged.to_csv(
-        f'/Volumes/MARAL/Data/rfm_labels/rfm_labels_{land}_prefect.csv',
-        sep=';',
-        index=False,
-        encoding='cp850'
+    # Export the labeled table: cp850 CSV (optionally gzip/zstd compressed) and/or Parquet
+    write_label_table(
+        filtered_final_merged,
+        os.path.join(LABEL_DIR, f"rfm_labels_{land}_prefect"),
+        label_formats,
+        categories={"rfm_label": KUNDENGRUPPE},
     )
     
-    # Export Excel with formatting
-    with pd.ExcelWriter(f"Data/rfm_segments_{today.date()}_{land}_prefect.xlsx", engine="xlsxwriter") as writer:
-        for item in KUNDENGRUPPE:
-            df = filtered_final_merged[filtered_final_merged["rfm_label"] == item]
-            df.to_excel(writer, sheet_name=item, index=False)
-
-            workbook = writer.book
-            worksheet = writer.sheets[item]
-
-            # Define formats
-            date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
-            currency_format = workbook.add_format({"num_format": "#,##0 [$€-1];[Red]-#,##0 [$€-1]"})
-            yellow_fill = workbook.add_format({"bg_color": "#FFFF00"})
-
-            # Set all columns to width 22
-            worksheet.set_column("A:X", 22)
-
-            # Apply date format to columns G and H
-            worksheet.set_column("G:G", 22, date_format)
-            worksheet.set_column("H:H", 22, date_format)
-
-            # Apply currency format to selected columns
-            for col in ["J", "N", "P", "R"]:
-                worksheet.set_column(f"{col}:{col}", 22, currency_format)
-
-            # Highlight and hide M:P
-            worksheet.set_column("M:P", 22, yellow_fill)
-            worksheet.set_column("M:P", 22, None, {"hidden": True})
-
-            # Highlight and hide T:U
-            worksheet.set_column("T:U", 22, yellow_fill)
-            worksheet.set_column("T:U", 22, None, {"hidden": True})
-
-            # Approximate autofit for column X
-            worksheet.set_column("X:X", 22)
+    # Export Excel with formatting: one sheet per segment (or one workbook per segment),
+    # segments beyond the Excel row limit continue on numbered sheets/files
+    export_segments(
+        filtered_final_merged,
+        f"Data/rfm_segments_{today.date()}_{land}_prefect.xlsx",
+        KUNDENGRUPPE,
+        per_file=excel_per_segment,
+        workers=excel_workers,
+    )
 
     # Export summary tables
     with pd.ExcelWriter(
@@ -395,36 +332,132 @@ def export_results(final_addresses, kw, land, today):
         ws2.set_column("C:D", 22, int_format)
 
 
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
+def stream_order_metrics(land, five_years_ago_start, two_years_ago_start, today, chunksize):
+    # Per-customer order aggregates, reading V2AD1056 in chunks of chunksize lines
+    return stream_order_aggregates(
+        extract_path(land, "V2AD1056"), five_years_ago_start, two_years_ago_start, today,
+        chunksize=chunksize,
+    )
+
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
+def aggregate_order_metrics(v21056, five_years_ago_start, two_years_ago_start, today):
+    # Reduce the order lines to customer grain before anything is joined to them
+    return aggregate_orders(v21056, five_years_ago_start, two_years_ago_start, today)
+
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
+def incremental_order_metrics(land, five_years_ago_start, two_years_ago_start, today, chunksize):
+    # Persisted per-customer aggregates with only the appended V2AD1056 lines merged in
+    return incremental_order_aggregates(
+        land, five_years_ago_start, two_years_ago_start, today, chunksize=chunksize
+    )[0]
+
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
+def index_order_metrics(land, five_years_ago_start, two_years_ago_start, today):
+    # Segment reductions over the customer-sorted order index (persisted per land)
+    index = order_index_for_land(land)
+    return aggregate_order_index(index, five_years_ago_start, two_years_ago_start, today)
+
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
+def duckdb_order_metrics(land, five_years_ago_start, two_years_ago_start, today, chunksize):
+    # The same reduction as SQL over V2AD1056 (converted to Parquet in chunks of
+    # chunksize lines), spilling to disk when it does not fit into memory
+    return aggregate_orders_duckdb(land, None, five_years_ago_start, two_years_ago_start, today, chunksize=chunksize)
+
+@task(**CACHED_STAGE)
+@arrow_frames
+@instrumented
+def join_order_metrics(addresses, inx, order_metrics):
+    return join_customers(addresses, inx, order_metrics)
+
+
 @flow(name="process_land_data")
-def process_land_data(land):
+def process_land_data(
+    land, incremental=False, streaming=False, chunksize=1_000_000, engine="pandas",
+    excel_per_segment=False, excel_workers=1, label_formats=("csv",), handoff="memory",
+):
+    # Load the inputs, then score and export; the task metrics are published at the end.
+    # Stages whose inputs, reference dates, code and options are unchanged come from
+    # the task cache, so a failed run resumes after its last completed stage.
+    # handoff="arrow" passes the frames between the stages as memory-mapped Arrow files.
+    check_options(incremental, streaming, engine)
+    options = {
+        "incremental": incremental, "streaming": streaming, "chunksize": chunksize, "engine": engine,
+        "handoff": handoff,
+    }
+    with (
+        task_metrics("process_land_data", land),
+        stage_cache(land, rfm_inputs(land), **options),
+        frame_handoff(land, handoff),
+    ):
+        addresses, v21056, inx, kw = load_data(land, incremental=incremental, streaming=streaming, engine=engine)
+        score_land(
+            land, addresses, v21056, inx, kw,
+            incremental=incremental, streaming=streaming, chunksize=chunksize, engine=engine,
+            excel_per_segment=excel_per_segment, excel_workers=excel_workers, label_formats=label_formats,
+        )
+
+
+def rfm_inputs(land):
+    # Files the stages of a land are computed from (keys of the task cache)
+    return [
+        extract_path(land, "V2AD1001"), extract_path(land, "V2AD1056"), inx_path,
+        kw_ipc_path(land), kw_csv_path(land),
+    ]
+
+
+def check_options(incremental=False, streaming=False, engine="pandas"):
+    if streaming and incremental:
+        raise ValueError("streaming and incremental mode cannot be combined")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    if streaming and engine != "pandas":
+        raise ValueError(f"streaming mode cannot be combined with the {engine} engine")
+    if incremental and engine != "pandas":
+        raise ValueError(f"incremental mode keeps its own customer aggregates and cannot use the {engine} engine")
+
+
+def score_land(
+    land, addresses, v21056, inx, kw, incremental=False, streaming=False, chunksize=1_000_000, engine="pandas",
+    excel_per_segment=False, excel_workers=1, label_formats=("csv",),
+):
+    # RFM stages of one land on loaded inputs (used by process_land_data and the combined flow)
     # Get reference dates using helper functions
     five_years_ago_start, two_years_ago_start, today = get_reference_dates()
     half_year_info = get_half_year_info(land=land)
     
-    # Load and clean data
-    addresses, v21056, inx, kw = load_data(land)
+    # Clean data
     addresses, v21056, inx, kw = clean_data(addresses, v21056, inx, kw, land)
     
-    # Merge data
-    address_details = merge_data(addresses, v21056, inx)
-    
-    # Group addresses first to create first_kaufdatum
-    addresses_grouped = group_addresses(address_details, half_year_info)
+    # Reduce the orders to one row per customer (chunk by chunk in streaming mode, only
+    # the appended lines in incremental mode)
+    if streaming:
+        order_metrics = stream_order_metrics(land, five_years_ago_start, two_years_ago_start, today, chunksize)
+    elif incremental:
+        order_metrics = incremental_order_metrics(land, five_years_ago_start, two_years_ago_start, today, chunksize)
+    elif engine == "index":
+        order_metrics = index_order_metrics(land, five_years_ago_start, two_years_ago_start, today)
+    elif engine == "duckdb":
+        order_metrics = duckdb_order_metrics(land, five_years_ago_start, two_years_ago_start, today, chunksize)
+    else:
+        order_metrics = aggregate_order_metrics(v21056, five_years_ago_start, two_years_ago_start, today)
+    
+    # Join the customer aggregates once to the address and newsletter attributes
+    addresses_grouped, last_3_to_5_years, last_2_years = join_order_metrics(addresses, inx, order_metrics)
     
     # Then process customer groups
     addresses_grouped = process_customer_groups(addresses_grouped, half_year_info)
     
-    # Split time periods with proper datetime conversion
-    address_detail_5to3, address_details_2 = split_time_periods(
-        address_details, 
-        five_years_ago_start, 
-        two_years_ago_start, 
-        today
-    )
-    
-    # Calculate time period metrics
-    last_3_to_5_years, last_2_years = calculate_time_period_metrics(address_detail_5to3, address_details_2)
-    
     # Merge time periods
     addresses_details_last5years = merge_time_periods(addresses_grouped, last_3_to_5_years, last_2_years)
     
@@ -435,13 +468,44 @@ def process_land_data(land):
     final_addresses = calculate_rfm_scores(final_addresses, today)
     
     # Export results
-    export_results(final_addresses, kw, land, today)
+    export_results(final_addresses, kw, land, today, excel_per_segment, excel_workers, label_formats)
 
     
+def run_land(land, **options):
+    # Module-level entry point for the worker processes of run_lands
+    return process_land_data(land, **options)
+
+
 @flow(name="main_flow")
-def main_flow():
-    for land in LANDS:
-        process_land_data(land)
+def main_flow(
+    incremental=False, streaming=False, chunksize=1_000_000, engine="pandas", workers=1, memory_limit_gb=None,
+    prefetch_depth=1, excel_per_segment=False, excel_workers=1, label_formats=("csv",), profile_tasks=None,
+    refresh_cache=False, handoff="memory",
+):
+    # workers > 1 (None: one per land) runs the lands in parallel processes, each capped
+    # at memory_limit_gb; profile_tasks: task names (or "*") to run under cProfile;
+    # refresh_cache: True, a land or a list of lands whose cached stage results are dropped
+    # before the run; handoff: "memory" or "arrow" (frames between the stages as
+    # memory-mapped Arrow files); chunksize: V2AD1056 lines per chunk in streaming mode
+    # and when the incremental order state is rebuilt
+    options = {"incremental": incremental, "streaming": streaming, "engine": engine}
+    stage_options = {
+        "chunksize": chunksize,
+        "excel_per_segment": excel_per_segment,
+        "excel_workers": excel_workers,
+        "label_formats": label_formats,
+        "handoff": handoff,
+    }
+    with profiling(profile_tasks):
+        refresh_task_cache(refresh_cache, LANDS)
+        if workers is None or workers > 1:
+            run_lands(run_land, LANDS, workers=workers, memory_limit_gb=memory_limit_gb, **options, **stage_options)
+            return
+
+        # Sequential: read the next prefetch_depth lands while the current one is scored
+        with prefetch_lands(read_land_inputs, LANDS, depth=prefetch_depth, **options):
+            for land in LANDS:
+                process_land_data(land, **options, **stage_options)
 
 if __name__ == "__main__":
     main_flow()
\ No newline at end of file
@@ -0,0 +1,119 @@
+## Load schemas for the V2AD* extracts and the other inputs of the pipelines.
+## Each consumer (the RFM pipelines, the KW scripts) declares per input the columns it
+## reads and a compact dtype for each of them: "category" for low-cardinality codes,
+## "datetime" (parsed by read_csv), "int" (downcast to the narrowest integer type when
+## the column has no gaps) or None to keep the parsed dtype. Customer numbers stay as
+## parsed and are turned into int64 keys by helper.customer_keys. Amounts stay float64
+## so sums do not change. Every load logs how much memory the compaction saved.
+import pandas as pd
+
+from extract_cache import extract_path, read_extract
+from instrumentation import run_logger
+
+
+SCHEMAS = {
+    "rfm": {
+        "V2AD1001": {
+            "NUMMER": None,
+            "SYS_ANLAGE": "datetime",
+            "QUELLE": "category",
+            "GEBURT": "datetime",
+            "PLZ": "category",
+            "ANREDE": "category",
+        },
+        "V2AD1056": {
+            "VERWEIS": None,
+            "AUFTRAG_NR": "int",
+            "AUF_ANLAGE": "datetime",
+            "BEST_WERT": None,
+            "MWST1": None,
+            "MWST2": None,
+            "MWST3": None,
+        },
+        "inxmail": {"NUMMER": None, "NL_TYPE": "category"},
+        "kw": {"NUMMER": None, "Kundengruppe": "category"},
+    },
+    "kw": {
+        # Plus the two half-year columns Z<n>, Z<n+1> resolved at run time (extra_columns)
+        "V2AD2000": {"NUMMER": None},
+        "V2AD1001": {"NUMMER": None, "SYS_ANLAGE": "datetime"},
+        "V2AD1005": {"NUMMER": None, "ERSTKAUF": "datetime"},
+        "kunden_segments": {"Alt": None, "Neu": None},
+    },
+}
+# The legacy script also carries MEDIACODE through its merged order table
+SCHEMAS["rfm_script"] = {
+    **SCHEMAS["rfm"],
+    "V2AD1056": {**SCHEMAS["rfm"]["V2AD1056"], "MEDIACODE": "category"},
+}
+
+
+def schema(consumer, name):
+    try:
+        return SCHEMAS[consumer][name]
+    except KeyError:
+        raise KeyError(f"No schema for {name} in consumer '{consumer}'") from None
+
+
+def schema_columns(consumer, name, extra_columns=None):
+    # Column list for usecols/columns, None means all columns
+    columns = schema(consumer, name)
+    if columns is None:
+        return None
+    return list({**columns, **(extra_columns or {})})
+
+
+def date_columns(consumer, name, extra_columns=None):
+    columns = {**(schema(consumer, name) or {}), **(extra_columns or {})}
+    return [col for col, dtype in columns.items() if dtype == "datetime"]
+
+
+def compact_column(values, dtype):
+    if dtype == "category":
+        return values.astype("category")
+    if dtype == "int" and pd.api.types.is_numeric_dtype(values) and values.notna().all():
+        if (values % 1 == 0).all():
+            return pd.to_numeric(values, downcast="integer")
+    return values
+
+
+def apply_schema(df, consumer, name, source=None, extra_columns=None):
+    # Compact dtypes for the declared columns; the memory saved is logged and kept with
+    # the frame in df.attrs["load_report"]
+    columns = {**(schema(consumer, name) or {}), **(extra_columns or {})}
+    before = int(df.memory_usage(index=False, deep=True).sum())
+    for col, dtype in columns.items():
+        if col in df and dtype is not None:
+            df[col] = compact_column(df[col], dtype)
+    after = int(df.memory_usage(index=False, deep=True).sum())
+
+    entry = {
+        "consumer": consumer,
+        "name": name,
+        "source": source or name,
+        "rows": len(df),
+        "columns": df.shape[1],
+        "mb_parsed": before / 1024**2,
+        "mb_compact": after / 1024**2,
+        "mb_saved": (before - after) / 1024**2,
+        "skipped_lines": df.attrs.get("skipped_lines"),
+    }
+    df.attrs["load_report"] = entry
+    skipped = "" if entry["skipped_lines"] is None else f", {entry['skipped_lines']} bad lines skipped"
+    run_logger().info(
+        f"{entry['source']}: {entry['columns']} columns, {entry['mb_parsed']:.1f} MB -> "
+        f"{entry['mb_compact']:.1f} MB ({entry['mb_saved']:.1f} MB saved){skipped}"
+    )
+    return df
+
+
+def load_extract(land, name, consumer, extra_columns=None, **read_csv_kwargs):
+    # read_extract with the consumer's projection, date parsing and compact dtypes;
+    # extra_columns (column -> dtype) adds columns only known at run time
+    parse_dates = date_columns(consumer, name, extra_columns)
+    if parse_dates:
+        read_csv_kwargs.setdefault("parse_dates", parse_dates)
+    df = read_extract(
+        extract_path(land, name), columns=schema_columns(consumer, name, extra_columns), **read_csv_kwargs
+    )
+    return apply_schema(df, consumer, name, source=f"{land}/{name}", extra_columns=extra_columns)
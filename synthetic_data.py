@@ -0,0 +1,288 @@
+## Synthetic V2AD extracts for benchmarks and local runs without /Volumes/MARAL.
+## Writes per land V2AD1001 (addresses), V2AD1056 (order lines), V2AD1005 (first
+## purchase) and V2AD2000 (KW history) as cp850/semicolon CSVs in the layout of the
+## share (<root>/CSV/<land>/<name>.csv), plus the Inxmail and segment-mapping
+## workbooks and a paths.py pointing at them. The scale is the number of order lines
+## per land (100k ... 50M); customers, orders and workbooks are derived from it.
+## Files are written in chunks, so memory stays bounded at the largest scales.
+##
+##   python synthetic_data.py /tmp/rfm_bench --order-lines 5M --lands F01 F02
+import argparse
+import datetime as dt
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from excel_export import SHEET_ROWS
+from extract_cache import ENC, SEP
+from helper import get_half_year_info
+
+
+CHUNK_ROWS = 1_000_000
+LINES_PER_CUSTOMER = 10
+FIRST_DAY = np.datetime64("2005-01-01", "D")
+REFERENCE_PREFIX = "10"
+REFERENCE_SUFFIX = "0001"
+
+LAND_PREFIX = {"F01": "DE", "F02": "AT", "F03": "CH", "F04": "NL"}
+# QUELLE rest (after the "<land> " prefix) with its share of the address base; the
+# codes cover the channel, code, rest and contains rules of helper.SOURCE_RULES plus
+# old codes that fall through to Altcode
+QUELLE_CODES = {
+    "102": 0.14, "103": 0.06, "202": 0.05, "304": 0.02, "401": 0.03,
+    "923na": 0.09, "923nr": 0.03, "923nt": 0.02, "923": 0.04,
+    "926sa": 0.06, "926br": 0.04, "926gs": 0.03, "924gs": 0.01, "926": 0.02,
+    "927so": 0.03, "927br": 0.02, "927": 0.01,
+    "921am": 0.03, "921ot": 0.01, "921lh": 0.005, "929": 0.02, "928so": 0.01,
+    "925fb": 0.02, "925ig": 0.02, "925pi": 0.01, "925": 0.01, "936gm": 0.01,
+    "938": 0.005, "943": 0.005, "20i": 0.02, "022iv": 0.002,
+    "011": 0.02, "012": 0.01, "013": 0.01, "040": 0.02, "060": 0.01, "000": 0.03,
+    "030": 0.01, "014": 0.02, "016": 0.01,
+    "XX921am": 0.02, "999": 0.03, "9Z1": 0.008,
+}
+ANREDE_CODES = {"2": 0.52, "1": 0.33, "02": 0.04, "01": 0.03, "3": 0.03, "4": 0.02, "7": 0.01, "X": 0.01, "": 0.01}
+# KW history codes (Alt) and the segment they stand for (Neu) in the mapping workbook
+SEGMENT_MAPPING = {
+    11: "Stammkunden", 12: "Stammkunden", 21: "Mehrfachkäufer", 22: "Einmalkäufer",
+    31: "Inaktive 1", 32: "Inaktive 2", 41: "Reaktivierte", 50: "Interessenten",
+}
+SEGMENT_CODE_WEIGHTS = [0.10, 0.06, 0.14, 0.24, 0.16, 0.14, 0.04, 0.12]
+NL_TYPES = {"Newsletter": 0.7, "Angebote": 0.2, "Rezepte": 0.1}
+
+
+def parse_scale(value):
+    # "100k", "2.5M", "50000000" -> int
+    value = str(value).strip().lower().replace("_", "")
+    factor = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * factor)
+
+
+def weighted_choice(rng, weights, size):
+    values = list(weights)
+    p = np.asarray(list(weights.values()), dtype=float)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=p / p.sum())]
+
+
+def day_strings(days):
+    # int day numbers (days since 1970-01-01) -> "YYYY-MM-DD"
+    return np.datetime_as_string(days.astype("datetime64[D]"), unit="D")
+
+
+def today_day():
+    return np.datetime64(dt.date.today(), "D")
+
+
+def write_chunk(df, path, first):
+    # Encoded once per chunk (to_csv with encoding= encodes line by line); ASCII text,
+    # i.e. everything but the address file, takes the much faster ASCII codec
+    text = df.to_csv(sep=SEP, index=False, header=first)
+    try:
+        data = text.encode("ascii")
+    except UnicodeEncodeError:
+        data = text.encode(ENC)
+    with open(path, "wb" if first else "ab") as f:
+        f.write(data)
+
+
+def acquisition_days(rng, n_customers):
+    # SYS_ANLAGE: the customer base grows over time, more new customers in later years
+    span = int((today_day() - FIRST_DAY).astype(np.int64))
+    days = FIRST_DAY.astype(np.int64) + (span * rng.random(n_customers) ** 0.6).astype(np.int64)
+    return np.sort(days)
+
+
+def write_addresses(path, land, acquired, rng):
+    n = len(acquired)
+    for start in range(0, n, CHUNK_ROWS):
+        stop = min(start + CHUNK_ROWS, n)
+        size = stop - start
+        age_days = (rng.normal(58, 14, size).clip(18, 99) * 365.25).astype(np.int64)
+        geburt = day_strings(today_day().astype(np.int64) - age_days).astype(object)
+        geburt[rng.random(size) < 0.12] = ""
+        chunk = pd.DataFrame(
+            {
+                "NUMMER": np.arange(start + 1, stop + 1),
+                "ANREDE": weighted_choice(rng, ANREDE_CODES, size),
+                "NAME": "Muster",
+                "VORNAME": "Erika",
+                "STRASSE": "Hauptstraße 1",
+                "PLZ": rng.integers(1000, 99999, size),
+                "ORT": "Köln",
+                "SYS_ANLAGE": day_strings(acquired[start:stop]),
+                "QUELLE": LAND_PREFIX.get(land, land[:2]) + " " + weighted_choice(rng, QUELLE_CODES, size),
+                "GEBURT": geburt,
+            }
+        )
+        write_chunk(chunk, path, start == 0)
+
+
+def customer_weights(rng, n_customers):
+    # About a third of the addresses never order, the buyers follow a heavy-tailed
+    # order frequency (many one-time buyers, few regulars)
+    weights = rng.lognormal(0.0, 1.2, n_customers)
+    weights[rng.random(n_customers) < 0.35] = 0.0
+    cumulative = np.cumsum(weights)
+    return cumulative / cumulative[-1]
+
+
+def order_days(rng, acquired):
+    # Uniform between the customer's SYS_ANLAGE and today, a quarter of the orders
+    # moved into the Christmas season of their year (if that is not in the future)
+    today = int(today_day().astype(np.int64))
+    days = acquired + ((today - acquired) * rng.random(len(acquired))).astype(np.int64)
+    seasonal = rng.random(len(days)) < 0.25
+    years = days[seasonal].astype("datetime64[D]").astype("datetime64[Y]")
+    november = years.astype("datetime64[M]") + np.timedelta64(10, "M")
+    moved = november.astype("datetime64[D]").astype(np.int64) + rng.integers(0, 61, len(years))
+    days[seasonal] = np.where((moved <= today) & (moved >= acquired[seasonal]), moved, days[seasonal])
+    return days
+
+
+def write_orders(path, acquired, order_lines, rng):
+    # Returns the first order day per customer (int64 max for customers without orders)
+    cumulative = customer_weights(rng, len(acquired))
+    first_order = np.full(len(acquired), np.iinfo(np.int64).max, dtype=np.int64)
+    written, next_order = 0, 1
+    while written < order_lines:
+        size = min(CHUNK_ROWS, order_lines - written)
+        lines_per_order = 1 + rng.poisson(0.9, size)
+        n_orders = int(np.searchsorted(np.cumsum(lines_per_order), size)) + 1
+        lines_per_order = lines_per_order[:n_orders]
+        lines_per_order[-1] -= lines_per_order.sum() - size
+
+        customer = np.searchsorted(cumulative, rng.random(n_orders), side="right")
+        days = order_days(rng, acquired[customer])
+        order = np.argsort(days, kind="stable")
+        customer, days, lines_per_order = customer[order], days[order], lines_per_order[order]
+        np.minimum.at(first_order, customer, days)
+
+        line_customer = np.repeat(customer, lines_per_order)
+        references = pd.Series(line_customer + 1).astype(str).str.zfill(10)
+        references = (REFERENCE_PREFIX + references + REFERENCE_SUFFIX).to_numpy(dtype=object)
+        # Some references are not customer numbers (the pipeline ignores them)
+        foreign = rng.random(size) < 0.003
+        delivery_notes = pd.Series(rng.integers(0, 10**9, int(foreign.sum()))).astype(str)
+        references[foreign] = ("LS" + delivery_notes).to_numpy(dtype=object)
+        brutto = np.round(rng.lognormal(3.6, 0.8, size), 2)
+        brutto[rng.random(size) < 0.01] *= -1  # credit notes
+        food = rng.random(size)
+        chunk = pd.DataFrame(
+            {
+                "VERWEIS": references,
+                "AUFTRAG_NR": np.repeat(np.arange(next_order, next_order + n_orders), lines_per_order),
+                "MEDIACODE": weighted_choice(rng, {"K25": 0.4, "NL1": 0.3, "WEB": 0.3}, size),
+                "AUF_ANLAGE": day_strings(np.repeat(days, lines_per_order)),
+                "BEST_WERT": brutto,
+                "MWST1": np.round(brutto * food * 0.07 / 1.07, 2),
+                "MWST2": np.round(brutto * (1 - food) * 0.19 / 1.19, 2),
+                "MWST3": 0.0,
+            }
+        )
+        write_chunk(chunk, path, written == 0)
+        written += size
+        next_order += n_orders
+    return first_order
+
+
+def write_first_purchases(path, first_order):
+    for start in range(0, len(first_order), CHUNK_ROWS):
+        days = first_order[start:start + CHUNK_ROWS]
+        erstkauf = day_strings(np.where(days == np.iinfo(np.int64).max, 0, days)).astype(object)
+        erstkauf[days == np.iinfo(np.int64).max] = ""
+        chunk = pd.DataFrame({"NUMMER": np.arange(start + 1, start + len(days) + 1), "ERSTKAUF": erstkauf})
+        write_chunk(chunk, path, start == 0)
+
+
+def half_year_numbers(land, days):
+    # KW history column number (Z<n>) of the half year each day falls into
+    info = get_half_year_info(land=land)
+    today = dt.date.today()
+    current = today.year * 2 + (today.month > 6)
+    dates = days.astype("datetime64[D]")
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    return info["number"] + 1 - (current - (years * 2 + (months > 6)))
+
+
+def write_kw_history(path, land, acquired, rng):
+    # NUMMER plus Z1 ... Z<n+1> (n = last half year), empty before the customer existed
+    last = get_half_year_info(land=land)["number"] + 1
+    codes = np.asarray(list(SEGMENT_MAPPING), dtype=object)
+    p = np.asarray(SEGMENT_CODE_WEIGHTS) / sum(SEGMENT_CODE_WEIGHTS)
+    chunk_rows = max(CHUNK_ROWS // 4, 1)
+    for start in range(0, len(acquired), chunk_rows):
+        acquired_in = half_year_numbers(land, acquired[start:start + chunk_rows])
+        columns = {"NUMMER": np.arange(start + 1, start + len(acquired_in) + 1)}
+        for number in range(1, last + 1):
+            values = codes[rng.choice(len(codes), size=len(acquired_in), p=p)]
+            columns[f"Z{number}"] = np.where(acquired_in <= number, values, "")
+        write_chunk(pd.DataFrame(columns), path, start == 0)
+
+
+def write_workbook(path, columns):
+    # xlsxwriter in constant_memory mode, row by row (the lists can be long)
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, list(columns))
+    for row, values in enumerate(zip(*columns.values()), start=1):
+        worksheet.write_row(row, 0, values)
+    workbook.close()
+
+
+def write_inxmail(path, n_customers, rng):
+    # Newsletter subscribers of all lands, capped at one Excel sheet
+    size = min(int(n_customers * 0.3), SHEET_ROWS)
+    nummer = np.sort(rng.choice(n_customers, size=size, replace=False)) + 1
+    write_workbook(path, {"NUMMER": nummer.tolist(), "NL_TYPE": weighted_choice(rng, NL_TYPES, size).tolist()})
+
+
+def write_segment_mapping(path):
+    write_workbook(path, {"Alt": list(SEGMENT_MAPPING), "Neu": list(SEGMENT_MAPPING.values())})
+
+
+def write_paths_module(root):
+    # The pipelines import inx_path / ks_path from paths.py
+    with open(os.path.join(root, "paths.py"), "w", encoding="utf-8") as f:
+        f.write(f'inx_path = {os.path.join(root, "inx.xlsx")!r}\n')
+        f.write(f'ks_path = {os.path.join(root, "ks.xlsx")!r}\n')
+
+
+def generate(root, order_lines, lands=("F01",), seed=0):
+    # Writes the data set unless root already holds one with the same parameters
+    root = os.path.abspath(root)
+    params = {"order_lines": order_lines, "lands": list(lands), "seed": seed, "date": str(dt.date.today())}
+    meta_path = os.path.join(root, "synthetic.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            if json.load(f) == params:
+                return root
+    n_customers = max(order_lines // LINES_PER_CUSTOMER, 1_000)
+    rng = np.random.default_rng(seed)
+    for land in lands:
+        land_dir = os.path.join(root, "CSV", land)
+        os.makedirs(land_dir, exist_ok=True)
+        print(f"{land}: {n_customers} customers, {order_lines} order lines")
+        acquired = acquisition_days(rng, n_customers)
+        write_addresses(os.path.join(land_dir, "V2AD1001.csv"), land, acquired, rng)
+        first_order = write_orders(os.path.join(land_dir, "V2AD1056.csv"), acquired, order_lines, rng)
+        write_first_purchases(os.path.join(land_dir, "V2AD1005.csv"), first_order)
+        write_kw_history(os.path.join(land_dir, "V2AD2000.csv"), land, acquired, rng)
+    write_inxmail(os.path.join(root, "inx.xlsx"), n_customers, rng)
+    write_segment_mapping(os.path.join(root, "ks.xlsx"))
+    write_paths_module(root)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return root
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic V2AD extracts")
+    parser.add_argument("root")
+    parser.add_argument("--order-lines", default="1M", help="order lines per land, e.g. 100k, 5M, 50M")
+    parser.add_argument("--lands", nargs="+", default=["F01"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.root, parse_scale(args.order_lines), args.lands, args.seed)
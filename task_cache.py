@@ -0,0 +1,149 @@
+## Content-addressed caching of the Prefect stage results.
+## A flow opens `stage_cache(land, inputs, **options)` for a land; the cache key of
+## every stage task run inside it is derived from the fingerprints of the land's input
+## files, the reference dates (today and the half-year windows), the KW half-year
+## number, a hash of the pipeline code and the run options, plus the task's own
+## scalar parameters (frames are covered by the fingerprints they were read from).
+## The cache records live in Data/cache/tasks/<land>-<task>-<digest> and point to the
+## pickled results in Prefect's local result storage (PREFECT_RESULTS_LOCAL_STORAGE_PATH,
+## default ~/.prefect/storage). An unchanged stage is served from there and a failed
+## run resumes after the last stage that completed. Outside stage_cache (or with .fn)
+## nothing is cached.
+##
+##   python task_cache.py clear [--lands F03] [--older-than-days 30]
+import argparse
+import contextvars
+import functools
+import glob
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from prefect.cache_policies import CacheKeyFnPolicy
+
+from extract_cache import CACHE_DIR, source_fingerprint
+from frame_handoff import FrameHandle, clear_frames
+from helper import get_half_year_info, get_halfyear_reference_dates
+from instrumentation import run_logger
+
+
+TASK_CACHE_DIR = os.path.join(CACHE_DIR, "tasks")
+CACHE_MAX_AGE_DAYS = 30
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_FILES = ["*.py", "rfm_label_rules.json"]
+FRAME_TYPES = (pd.DataFrame, pd.Series, np.ndarray, FrameHandle)
+
+_stage = contextvars.ContextVar("stage_cache", default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    # Any change to the pipeline code or the label rules gives new keys
+    digest = hashlib.sha1()
+    paths = sorted(p for pattern in CODE_FILES for p in glob.glob(os.path.join(CODE_DIR, pattern)))
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def input_fingerprints(paths):
+    return {path: source_fingerprint(path) if os.path.exists(path) else None for path in paths}
+
+
+def stable_digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@contextmanager
+def stage_cache(land, inputs, **options):
+    # Cache scope of one land: inputs are the file paths its stages are computed from
+    five_years_ago_start, two_years_ago_start, today = get_halfyear_reference_dates()
+    scope = {
+        "land": land,
+        "inputs": input_fingerprints(inputs),
+        "reference_dates": [five_years_ago_start, two_years_ago_start, today],
+        "half_year": get_half_year_info(land=land)["number"],
+        "code": code_version(),
+        "options": options,
+    }
+    token = _stage.set({"land": land, "digest": stable_digest(scope)})
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def stage_key(context, parameters):
+    # Prefect cache_key_fn; None (no caching) outside stage_cache
+    stage = _stage.get()
+    if stage is None:
+        return None
+    scalars = {name: value for name, value in parameters.items() if not isinstance(value, FRAME_TYPES)}
+    digest = stable_digest({"stage": stage["digest"], "parameters": scalars})[:20]
+    return f"{stage['land']}-{context.task.name}-{digest}"
+
+
+# Options of the cached stage tasks: @task(**CACHED_STAGE)
+CACHED_STAGE = {
+    "cache_policy": CacheKeyFnPolicy(cache_key_fn=stage_key).configure(
+        key_storage=os.path.abspath(TASK_CACHE_DIR)
+    ),
+    "persist_result": True,
+}
+
+
+def remove_record(path):
+    # Cache record plus the result file it points to
+    try:
+        with open(path, encoding="utf-8") as f:
+            storage_key = json.load(f).get("storage_key")
+    except (OSError, ValueError):
+        storage_key = None
+    if storage_key and os.path.isfile(storage_key):
+        os.remove(storage_key)
+    os.remove(path)
+
+
+def clear_task_cache(lands=None, older_than_days=None):
+    # Removes the cached stage results of the given lands (all if None), optionally
+    # only those older than older_than_days; returns the number of removed results
+    cutoff = None if older_than_days is None else time.time() - older_than_days * 86400
+    removed = 0
+    names = os.listdir(TASK_CACHE_DIR) if os.path.isdir(TASK_CACHE_DIR) else []
+    for name in names:
+        path = os.path.join(TASK_CACHE_DIR, name)
+        if lands is not None and not any(name.startswith(f"{land}-") for land in lands):
+            continue
+        if cutoff is not None and os.path.getmtime(path) >= cutoff:
+            continue
+        remove_record(path)
+        removed += 1
+    # Frames handed off as Arrow files, which the cached handles point to
+    clear_frames(lands, older_than_days)
+    return removed
+
+
+def refresh_task_cache(refresh, lands):
+    # Flow parameter: True clears all given lands, a land or list of lands only those;
+    # entries older than CACHE_MAX_AGE_DAYS are dropped on every run
+    if refresh:
+        if isinstance(refresh, str):
+            refresh = [refresh]
+        selected = lands if refresh is True else [land for land in lands if land in refresh]
+        run_logger().info(f"Cleared {clear_task_cache(selected)} cached stage results of {selected}")
+    clear_task_cache(older_than_days=CACHE_MAX_AGE_DAYS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the cached stage results")
+    parser.add_argument("command", choices=["clear"])
+    parser.add_argument("--lands", nargs="+")
+    parser.add_argument("--older-than-days", type=float)
+    args = parser.parse_args()
+    print(f"Removed {clear_task_cache(args.lands, args.older_than_days)} cached stage results")
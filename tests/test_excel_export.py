@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_export import export_segments
+
+
+def test_per_segment_workbooks_written_by_spawned_workers(tmp_path):
+    labels = ["Champions", "Treue Kunden", "Interessenten"]
+    df = pd.DataFrame({"NUMMER": np.arange(30), "rfm_label": np.tile(labels, 10), "Umsatz": 1.5})
+    paths = export_segments(df, str(tmp_path / "rfm.xlsx"), labels, max_rows=4, per_file=True, workers=3)
+    # 10 rows per label, 4 per file
+    assert len(paths) == 9
+    rows = sum(load_workbook(path).active.max_row - 1 for path in paths)
+    assert rows == len(df)
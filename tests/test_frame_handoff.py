@@ -0,0 +1,51 @@
+import os
+
+import pandas as pd
+from prefect import flow, task
+
+from frame_handoff import FRAME_DIR, FrameHandle, arrow_frames, frame_handoff
+from task_cache import CACHED_STAGE, clear_task_cache, stage_cache
+
+# A land known to get_half_year_info (part of the stage cache key)
+LAND = "F04"
+
+
+@task(**CACHED_STAGE)
+@arrow_frames
+def cached_stage(rows):
+    return pd.DataFrame({"NUMMER": range(rows)})
+
+
+@task
+@arrow_frames
+def uncached_stage(frame):
+    return frame.assign(score=1)
+
+
+@flow
+def handoff_flow():
+    with stage_cache(LAND, []), frame_handoff(LAND, "arrow"):
+        cached = cached_stage(3)
+        scored = uncached_stage(cached)
+        assert isinstance(cached, FrameHandle) and isinstance(scored, FrameHandle)
+        return cached.path, scored.path
+
+
+def frame_files():
+    land_dir = os.path.join(FRAME_DIR, LAND)
+    return sorted(os.listdir(land_dir)) if os.path.isdir(land_dir) else []
+
+
+def test_only_frames_of_cached_stages_outlive_the_scope():
+    clear_task_cache([LAND])
+    cached_path, scored_path = handoff_flow()
+    assert os.path.exists(cached_path)
+    assert not os.path.exists(scored_path)
+    files = frame_files()
+
+    # The cache hit returns the same handle, the uncached stage's frame is removed again
+    assert handoff_flow()[0] == cached_path
+    assert frame_files() == files == [os.path.basename(cached_path)]
+
+    clear_task_cache([LAND])
+    assert frame_files() == []
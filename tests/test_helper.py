@@ -0,0 +1,452 @@
+## Parity of the vectorized helpers with the row-wise functions they replaced; the old
+## functions are kept here as the reference implementations
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import order_extract
+from helper import (
+    anrede,
+    assign_age,
+    assign_rfm_labels,
+    assign_sources,
+    build_rfm_label_table,
+    customer_keys,
+    format_customer_keys,
+    normalize_anrede,
+    process_anrede,
+    season_flags,
+    season_masks,
+)
+from order_aggregates import aggregate_orders, join_customers, order_lines
+
+
+def seasonal(months):
+    # helper.seasonal_ostern / seasonal_weihnachten before season_flags
+    def flag(dates):
+        unique_months = set(dates.dt.month.unique())
+        years = dates.dt.year.nunique()
+        if years >= 2 and unique_months.issubset(months):
+            return True
+        return False
+
+    return flag
+
+
+def test_season_flags_match_the_groupby_functions():
+    # NUMMER -> order dates: one year only, two years in and outside the season, a
+    # missing date, a season month in another season and no dated order at all
+    orders = {
+        1: ["2023-03-01", "2024-04-15"],
+        2: ["2024-03-01", "2024-04-15"],
+        3: ["2022-02-01", "2023-03-01", "2024-05-01"],
+        4: ["2022-11-01", "2023-12-24", "2024-10-05"],
+        5: ["2022-12-01", "2023-12-01", None],
+        6: ["2022-03-01", "2023-11-01"],
+        7: [None, None],
+        8: ["2021-04-30", "2021-04-01", "2025-02-28"],
+        9: ["2020-01-01", "2021-12-01"],
+    }
+    lines = pd.DataFrame(
+        [(nummer, day) for nummer, days in orders.items() for day in days], columns=["NUMMER", "AUF_ANLAGE"]
+    )
+    lines["AUF_ANLAGE"] = pd.to_datetime(lines["AUF_ANLAGE"])
+
+    expected = lines.groupby("NUMMER").agg(
+        seasonal_ostern=("AUF_ANLAGE", seasonal({2, 3, 4})),
+        seasonal_weihnachten=("AUF_ANLAGE", seasonal({10, 11, 12})),
+    )
+    flags = season_flags(season_masks(lines["NUMMER"], lines["AUF_ANLAGE"]))
+    pd.testing.assert_frame_equal(flags, expected.astype(bool), check_names=False)
+    assert flags["seasonal_ostern"].any() and flags["seasonal_weihnachten"].any()
+
+
+def assign_rfm_label(row):
+    # helper.assign_rfm_label before rfm_label_rules.json
+    mf = row["mf_score"]
+    r = row["r_score"]
+
+    if mf in [4, 5] and r in [10, 9]:
+        return "Champions"
+    elif mf in [4, 5] and r in [5, 6, 7, 8]:
+        return "Treue Kunden"
+    elif mf == 5 and r in [1, 2, 3, 4]:
+        return 'Nicht zu verlieren'
+    elif mf in [2, 3, 4] and r in [7, 8, 9, 10]:
+        return "Potenziell loyale Kunden"
+    elif mf in [3] and r in [5, 6]:
+        return 'Brauchen Aufmerksamkeit'
+    elif mf in [3, 4] and r in [1, 2, 3, 4]:
+        return "Gefährdete Kunden"
+    elif mf == 1 and r in [9, 10]:
+        return "Reaktivierte Kunden"
+    elif mf == 1 and r in [7, 8]:
+        return "Vielversprechende Kunden"
+    elif mf in [1, 2] and r in [5, 6]:
+        return "Abwandernde Kunden"
+    elif mf == 2 and r in [1, 2, 3, 4]:
+        return "Schlafende Kunden"
+    elif mf == 1 and r in [1, 2, 3, 4]:
+        return "Verlorene Kunden"
+    else:
+        return "Nicht klassifiziert"
+
+
+def test_rfm_labels_match_the_row_wise_rules():
+    # Every score pair, scores outside the rules, fractional and missing scores
+    mf, r = np.meshgrid(np.arange(-1, 8), np.arange(-1, 13))
+    scores = pd.DataFrame({"mf_score": mf.ravel(), "r_score": r.ravel()}).astype("float64")
+    scores.loc[len(scores)] = [4.5, 9]
+    scores.loc[len(scores)] = [np.nan, 9]
+    scores.loc[len(scores)] = [5, np.nan]
+
+    expected = scores.apply(assign_rfm_label, axis=1).to_numpy()
+    labels = assign_rfm_labels(scores["mf_score"], scores["r_score"], build_rfm_label_table())
+    np.testing.assert_array_equal(labels, expected)
+    assert len(set(expected)) == 12
+
+
+def assign_sources_by_loc(aa):
+    # helper.assign_sources before SOURCE_RULES
+    aa["SOURCE"] = ""
+
+    ## Amazon
+    aa.loc[(aa["QUELLE"].str[3:] == "921am"), "SOURCE"] = "Amazon"
+    ## AWIN
+    aa.loc[(aa["QUELLE"].str[3:6] == "929"), "SOURCE"] = "AWIN"
+    ## Blätterkatalog
+    aa.loc[(aa["QUELLE"].str[3:6] == "938"), "SOURCE"] = "Blätterkatalog"
+    ## Corporate Benefits
+    aa.loc[(aa["QUELLE"].str[3:6] == "943"), "SOURCE"] = "Corporate Benefits"
+    ## Genussmagazin
+    aa.loc[(aa["QUELLE"].str.contains(r"936gm|925gm", case=False, regex=True, na=False)),"SOURCE"] = "Genussmagazin"
+    ## Google Shopping
+    aa.loc[(aa["QUELLE"].str.contains(r"926gs|924gs", case=False, regex=True, na=False)),"SOURCE"] = "Google Shopping"
+    ## Internet Import
+    aa.loc[(aa["QUELLE"].str.contains(r"20i|INT", case=False, regex=True, na=False)), "SOURCE"] = "Internet Import"
+    ## Inventur Trost
+    aa.loc[(aa["QUELLE"].str[3:] == "022iv"), "SOURCE"] = "Inventur Trost"
+    ## Lionshome
+    aa.loc[(aa["QUELLE"].str[3:] == "921lh"), "SOURCE"] = "Lionshome"
+    ## Newsletter
+    aa.loc[(aa["QUELLE"].str[3:6] == "923"), "SOURCE"] = "Newsletter"
+    ## Newsletter Angebot
+    aa.loc[(aa["QUELLE"].str[3:] == "923na"), "SOURCE"] = "Newsletter Angebot"
+    ## Newsletter Rezept
+    aa.loc[(aa["QUELLE"].str[3:] == "923nr"), "SOURCE"] = "Newsletter Rezept"
+    ## Newsletter Thema
+    aa.loc[(aa["QUELLE"].str[3:] == "923nt"), "SOURCE"] = "Newsletter Thema"
+    ## Otto
+    aa.loc[(aa["QUELLE"].str[3:] == "921ot"), "SOURCE"] = "Otto"
+    ## Google SEA
+    aa.loc[(aa["QUELLE"].str[3:6] == "926"), "SOURCE"] = "Google SEA"
+    ## SEA Brand
+    aa.loc[(aa["QUELLE"].str[3:] == "926br"), "SOURCE"] = "SEA Brand"
+    ## SEA Non-Brand
+    aa.loc[(aa["QUELLE"].str[3:] == "926sa"), "SOURCE"] = "SEA Non-Brand"
+    ## SEO
+    aa.loc[(aa["QUELLE"].str[3:6] == "927"), "SOURCE"] = "SEO"
+    ## SEO Brand
+    aa.loc[(aa["QUELLE"].str[3:] == "927br"), "SOURCE"] = "SEO Brand"
+    ## SEO Non-Brand
+    aa.loc[(aa["QUELLE"].str[3:] == "927so"), "SOURCE"] = "SEO Non-Brand"
+    ## Social Media
+    aa.loc[(aa["QUELLE"].str[3:6] == "925"), "SOURCE"] = "Social Media"
+    ## Pinterest
+    aa.loc[(aa["QUELLE"].str.contains(
+                r"925pi|925pt|932aa|pinterest", regex=True, case=False, na=False)),"SOURCE"] = "Pinterest"
+    ## Instagram
+    aa.loc[
+        (aa["QUELLE"].str.contains(r"925ig", regex=True, case=False, na=False)),"SOURCE"] = "Instagram"
+    ## Facebook
+    aa.loc[
+        (aa["QUELLE"].str.contains(r"925fb", regex=True, case=False, na=False)),"SOURCE"] = "Facebook"
+    ## Sovendus
+    aa.loc[
+        (aa["QUELLE"].str.contains(r"928so|sov", regex=True, case=False, na=False)),"SOURCE"] = "Sovendus"
+
+    ## Fremdadressen
+    aa.loc[
+        (aa["QUELLE"].str[3].isin(["1", "2", "3", "4"])) & (aa["QUELLE"].str[4:6].isin(["01"])),"SOURCE"] = "Fremdadressen"
+    ## Katalog und Karte
+    aa.loc[
+        (aa["QUELLE"].str[3].isin(["1", "2", "3", "4"])) & (aa["QUELLE"].str[4:6].isin(["02", "03", "04"])), "SOURCE"] = "Katalog und Karte"
+    ## Beilage
+    aa.loc[(aa["QUELLE"].str[3:6].isin(["011", "012", "013"])), "SOURCE"] = "Beilage"
+    aa.loc[(aa["QUELLE"].str[3:6].isin(["040"])), "SOURCE"] = "Beilage"
+    ## Geburtstagskarte
+    aa.loc[(aa["QUELLE"].str[3:6] == "060"), "SOURCE"] = "Geburtstagskarte"
+    ## Kataloganforderung
+    aa.loc[(aa["QUELLE"].str[3:6] == "000"), "SOURCE"] = "Kataloganforderung"
+    ## Freundschaftswerbung
+    aa.loc[(aa["QUELLE"].str[3:6] == "030"), "SOURCE"] = "Freundschaftswerbung"
+    ## Mailing
+    aa.loc[(aa["QUELLE"].str[3:6] == "014"), "SOURCE"] = "Mailing"
+    ## Blackweek
+    aa.loc[(aa["QUELLE"].str[3:6] == "016"), "SOURCE"] = "Blackweek"
+    ## Altcode
+    aa.loc[(aa["SOURCE"] == ""), "SOURCE"] = "Altcode"
+
+    aa["ON-OFF"] = ""
+    ## SOURCE -> Online/Offline
+    aa.loc[
+        aa["SOURCE"].isin(
+            [
+                "Amazon",
+                "AWIN",
+                "Blätterkatalog",
+                "Corporate Benefits",
+                "Genussmagazin",
+                "Google Shopping",
+                "Internet Import",
+                "Inventur Trost",
+                "Lionshome",
+                "Newsletter",
+                "Newsletter Angebot",
+                "Newsletter Rezept",
+                "Newsletter Thema",
+                "Otto",
+                "Google SEA",
+                "SEA Brand",
+                "SEA Non-Brand",
+                "SEO",
+                "SEO Brand",
+                "SEO Non-Brand",
+                "Social Media",
+                "Pinterest",
+                "Instagram",
+                "Facebook",
+                "Sovendus",
+            ]
+        ),
+        "ON-OFF",
+    ] = "Online"
+    aa.loc[
+        aa["SOURCE"].isin(
+            [
+                "Fremdadressen",
+                "Katalog und Karte",
+                "Beilage",
+                "Geburtstagskarte",
+                "Kataloganforderung",
+                "Freundschaftswerbung",
+                "Mailing",
+                "Blackweek",
+            ]
+        ),
+        "ON-OFF",
+    ] = "Offline"
+    aa.loc[aa["SOURCE"].isin(["Altcode"]), "ON-OFF"] = "Altcode"
+    return aa
+
+
+def test_assign_sources_matches_the_loc_assignments():
+    # Every rule code with every suffix, so that later rules override earlier ones as
+    # before; codes shorter than the rules, mixed case and missing QUELLE
+    codes = [
+        "921", "929", "938", "943", "936", "925", "926", "924", "022", "923", "927", "928", "932", "011",
+        "012", "013", "040", "060", "000", "030", "014", "016", "101", "202", "303", "404", "401", "999", "20i",
+    ]
+    suffixes = [
+        "", "am", "gm", "gs", "iv", "lh", "na", "nr", "nt", "ot", "br", "sa", "so", "pi", "pt", "aa", "ig", "fb", "INT",
+    ]
+    quelle = [prefix + code + suffix for prefix in ["F01", "SOV", "Xi"] for code in codes for suffix in suffixes]
+    quelle += [None, "", "F0", "F019", "F01926GS", "Pinterest", "F01int"]
+    addresses = pd.DataFrame({"QUELLE": quelle})
+
+    expected = assign_sources_by_loc(addresses.copy())
+    assigned, rule_hits = assign_sources(addresses.copy(), return_hits=True)
+    for col in ["SOURCE", "ON-OFF"]:
+        np.testing.assert_array_equal(assigned[col].to_numpy(dtype=object), expected[col].to_numpy(dtype=object))
+    assert expected["SOURCE"].nunique() == rule_hits["SOURCE"].nunique()
+    assert rule_hits["rows"].sum() == len(quelle)
+
+
+def assign_age_by_apply(aa, current_date):
+    # helper.assign_age before the age bins, with current_date instead of now()
+    aa["age"] = aa["geburt"].apply(
+        lambda x: current_date.year
+        - x.year
+        - ((current_date.month, current_date.day) < (x.month, x.day))
+    )
+
+    # Define age groups
+    def assign_age_group(age):
+        if age <= 18:
+            return "0-18"
+        elif age <= 30:
+            return "19-30"
+        elif age <= 50:
+            return "31-50"
+        elif age <= 65:
+            return "51-65"
+        elif age > 65:
+            return "65+"
+        else:
+            return "Keine Angabe"
+
+    aa["age_group"] = aa["age"].apply(assign_age_group)
+    return aa
+
+
+def test_age_groups_match_the_row_wise_function():
+    # Birthdays around today on the bin edges, 29 February, a birth date after today
+    # and a missing one
+    today = pd.Timestamp("2026-10-18")
+    geburt = [
+        "2008-10-18", "2008-10-19", "2007-10-18", "1996-10-17", "1995-10-18", "1976-10-18",
+        "1975-10-19", "1961-10-18", "1960-10-18", "1960-10-19", "2004-02-29", "1930-01-01",
+        "2027-01-01", None,
+    ]
+    addresses = pd.DataFrame({"geburt": pd.to_datetime(geburt)})
+
+    expected = assign_age_by_apply(addresses.copy(), today)
+    aged = assign_age(addresses.copy(), today)
+    for col, dtype in [("age", "float64"), ("age_group", object)]:
+        np.testing.assert_array_equal(aged[col].to_numpy(dtype=dtype), expected[col].to_numpy(dtype=dtype))
+    assert expected["age_group"].nunique() == 6
+
+
+def test_normalize_anrede_matches_the_row_wise_function():
+    values = pd.Series([1, 2.0, "01", "02", "3", "3.0", "X", "7", "10", 0, "", np.nan, "Herr"], dtype=object)
+    expected = values.apply(process_anrede).replace(anrede)
+    np.testing.assert_array_equal(normalize_anrede(values).to_numpy(), expected.to_numpy(dtype=object))
+
+
+def fan_out_metrics(addresses, v21056, inx, five_years_ago_start, two_years_ago_start, today):
+    # merge_data, group_addresses, split_time_periods and calculate_time_period_metrics
+    # of rfm_pipeline_prefect before join_customers, on order_lines instead of V2AD1056
+    address_details = pd.merge(addresses, v21056, on="NUMMER", how="left")
+    address_details = pd.merge(address_details, inx, on="NUMMER", how="left")
+    addresses_grouped = (
+        address_details.groupby("NUMMER")
+        .agg(
+            geburt=("GEBURT", "first"),
+            anrede=("ANREDE", "first"),
+            QUELLE=("QUELLE", "first"),
+            plz=("PLZ", "first"),
+            nl_type=("NL_TYPE", "first"),
+            registered_since=("SYS_ANLAGE", "first"),
+            first_kaufdatum=("AUF_ANLAGE", "min"),
+            recency=("AUF_ANLAGE", "max"),
+            gesamt_frequency=("AUFTRAG_NR", "nunique"),
+            gesamt_monetary=("NETTO_UMSATZ", "sum"),
+            seasonal_ostern=("AUF_ANLAGE", seasonal({2, 3, 4})),
+            seasonal_weihnachten=("AUF_ANLAGE", seasonal({10, 11, 12})),
+        )
+        .reset_index()
+    )
+    address_detail_5to3 = address_details[
+        (address_details["AUF_ANLAGE"] >= pd.Timestamp(five_years_ago_start)) &
+        (address_details["AUF_ANLAGE"] < pd.Timestamp(two_years_ago_start))
+    ]
+    address_details_2 = address_details[
+        (address_details["AUF_ANLAGE"] >= pd.Timestamp(two_years_ago_start)) &
+        (address_details["AUF_ANLAGE"] < pd.Timestamp(today))
+    ]
+    last_3_to_5_years = (
+        address_detail_5to3.groupby("NUMMER")
+        .agg(
+            freq_3_to_5_years_ago=("AUFTRAG_NR", "nunique"),
+            monetary_3_to_5_years_ago=("NETTO_UMSATZ", "sum"),
+        )
+        .reset_index()
+    )
+    last_2_years = (
+        address_details_2.groupby("NUMMER")
+        .agg(
+            freq_last_2_years=("AUFTRAG_NR", "nunique"),
+            monetary_last_2_years=("NETTO_UMSATZ", "sum"),
+        )
+        .reset_index()
+    )
+    return addresses_grouped, last_3_to_5_years, last_2_years
+
+
+def window_metrics(last_3_to_5_years, last_2_years, customers):
+    # merge_time_periods without the clipping, per customer
+    windows = last_3_to_5_years.merge(last_2_years, on="NUMMER", how="outer").set_index("NUMMER")
+    return windows.reindex(customers).fillna(0)
+
+
+def test_join_customers_matches_the_fan_out_merge():
+    # Customers with several address rows and Inxmail rows, without orders, without an
+    # Inxmail row, and order lines of customers without an address
+    windows = (pd.Timestamp("2021-07-01"), pd.Timestamp("2024-07-01"), pd.Timestamp("2026-10-18"))
+    lines = order_lines(order_extract(rows=800, seed=5))
+    rng = np.random.default_rng(5)
+    nummer = np.concatenate([np.arange(1, 91), np.arange(1, 91, 7), [3, 3]])
+    addresses = pd.DataFrame(
+        {
+            "NUMMER": nummer,
+            "SYS_ANLAGE": pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3000, len(nummer)), unit="D"),
+            "QUELLE": rng.choice(["F01923na", "F01102", "F01926gs", None], len(nummer)),
+            "GEBURT": pd.to_datetime(rng.choice(["1970-05-01", "1988-12-24", None], len(nummer))),
+            "PLZ": rng.integers(10000, 99999, len(nummer)),
+            "ANREDE": rng.choice(["1", "2", None], len(nummer)),
+        }
+    )
+    inx_nummer = np.concatenate([np.arange(1, 120, 3), np.arange(1, 60, 5)])
+    inx = pd.DataFrame({"NUMMER": inx_nummer, "NL_TYPE": rng.choice(["A", "B", None], len(inx_nummer))})
+
+    expected, expected_5to3, expected_2 = fan_out_metrics(addresses, lines, inx, *windows)
+    grouped, last_3_to_5_years, last_2_years = join_customers(addresses, inx, aggregate_orders(lines, *windows))
+    pd.testing.assert_frame_equal(
+        grouped.drop(columns="kundengruppe"), expected, check_dtype=False, check_index_type=False, rtol=1e-12
+    )
+    pd.testing.assert_frame_equal(
+        window_metrics(last_3_to_5_years, last_2_years, grouped["NUMMER"]),
+        window_metrics(expected_5to3, expected_2, grouped["NUMMER"]),
+        check_dtype=False, rtol=1e-12,
+    )
+    assert (expected["gesamt_frequency"] == 0).any() and expected["seasonal_ostern"].any()
+
+
+def pad_column_with_zeros(df, column_name):
+    # helper.pad_column_with_zeros before the int64 customer keys
+    df[column_name] = df[column_name].astype(str)  # Convert to string
+    df[column_name] = df[column_name].str.zfill(10)  # Pad with zeros
+    return df
+
+
+def process_id(data):
+    # helper.process_id before the int64 customer keys
+    data = data.astype(str)
+    data = data.replace(".0","")
+    data = data.str.zfill(10)
+    return data
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        pd.Series([1, 42, 1234567890, 7]),
+        pd.Series(["0000000001", "42", "1234567890", "007"], dtype=object),
+    ],
+)
+def test_customer_keys_format_like_the_zero_padding(values):
+    expected = pad_column_with_zeros(pd.DataFrame({"NUMMER": values}), "NUMMER")["NUMMER"]
+    keys = customer_keys(values)
+    assert keys.dtype == "int64"
+    np.testing.assert_array_equal(format_customer_keys(keys).to_numpy(), expected.to_numpy(dtype=object))
+    np.testing.assert_array_equal(format_customer_keys(keys).to_numpy(), process_id(values).to_numpy(dtype=object))
+
+
+def test_customer_keys_read_float_ids_and_warn_on_coerced_ones(caplog):
+    # Float IDs were padded as "00000042.0" and never matched the string keys
+    assert process_id(pd.Series([42.0])).tolist() == ["00000042.0"]
+    assert format_customer_keys(customer_keys(pd.Series([42.0, 7.0]))).tolist() == ["0000000042", "0000000007"]
+
+    # run_logger() outside of a run; importing Prefect there replaces the root handlers
+    logger = logging.getLogger("rfm_pipeline")
+    logger.addHandler(caplog.handler)
+    try:
+        keys = customer_keys(pd.Series(["42", "LS123", None]), "V2AD1056 VERWEIS", errors="coerce")
+    finally:
+        logger.removeHandler(caplog.handler)
+    assert keys.tolist() == [42, pd.NA, pd.NA]
+    assert "V2AD1056 VERWEIS: ignoring 1 non-numeric customer IDs" in caplog.text
+    with pytest.raises(ValueError):
+        customer_keys(pd.Series(["42", "LS123"]))
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from conftest import assert_same_aggregates, order_extract, write_extract
+import incremental
+from incremental import incremental_order_aggregates
+from order_aggregates import aggregate_orders, order_lines
+
+LAND = "F02"
+WINDOWS = (pd.Timestamp("2021-07-01"), pd.Timestamp("2024-07-01"), pd.Timestamp("2026-10-18"))
+
+
+def full_aggregates(lines, windows=WINDOWS):
+    written = pd.read_csv(write_extract(LAND, "V2AD1056", lines), sep=";", encoding="cp850", dtype={"VERWEIS": str})
+    return aggregate_orders(order_lines(written), *windows)
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "STATE_DIR", str(tmp_path))
+
+
+def test_first_run_matches_the_full_aggregation():
+    lines = order_extract(seed=1)
+    expected = full_aggregates(lines)
+    aggregates, mode = incremental_order_aggregates(LAND, *WINDOWS, chunksize=500)
+    assert mode == "full"
+    assert_same_aggregates(expected, aggregates, exact=True)
+
+
+def test_appended_lines_are_merged_into_the_state():
+    lines = order_extract(seed=2)
+    cut = lines.index[lines["AUFTRAG_NR"] == lines["AUFTRAG_NR"].iloc[len(lines) // 2]][0]
+    full_aggregates(lines.iloc[:cut])
+    incremental_order_aggregates(LAND, *WINDOWS, chunksize=500)
+
+    expected = full_aggregates(lines)
+    aggregates, mode = incremental_order_aggregates(LAND, *WINDOWS, chunksize=500)
+    assert mode == "incremental"
+    assert_same_aggregates(expected, aggregates, exact=True)
+
+    aggregates, mode = incremental_order_aggregates(LAND, *WINDOWS, chunksize=500)
+    assert mode == "unchanged"
+    assert_same_aggregates(expected, aggregates, exact=True)
+
+
+def test_pending_lines_settle_when_today_moves_on():
+    lines = order_extract(seed=3)
+    full_aggregates(lines)
+    incremental_order_aggregates(LAND, *WINDOWS)
+
+    later = (*WINDOWS[:2], WINDOWS[2] + pd.Timedelta(days=20))
+    aggregates, mode = incremental_order_aggregates(LAND, *later)
+    assert mode == "unchanged"
+    assert_same_aggregates(full_aggregates(lines, later), aggregates, exact=True)
+
+
+def test_new_half_year_rebuilds_the_state():
+    lines = order_extract(seed=4)
+    full_aggregates(lines)
+    incremental_order_aggregates(LAND, *WINDOWS)
+
+    next_half_year = (pd.Timestamp("2022-01-01"), pd.Timestamp("2025-01-01"), pd.Timestamp("2027-01-05"))
+    aggregates, mode = incremental_order_aggregates(LAND, *next_half_year)
+    assert mode == "full"
+    assert_same_aggregates(full_aggregates(lines, next_half_year), aggregates, exact=True)
+
+
+def test_rewritten_extract_rebuilds_the_state():
+    full_aggregates(order_extract(seed=5))
+    incremental_order_aggregates(LAND, *WINDOWS)
+
+    expected = full_aggregates(order_extract(seed=6, rows=3000))
+    aggregates, mode = incremental_order_aggregates(LAND, *WINDOWS)
+    assert mode == "full"
+    assert_same_aggregates(expected, aggregates, exact=True)
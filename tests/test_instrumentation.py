@@ -0,0 +1,29 @@
+import os
+
+from instrumentation import instrumented, profiled_tasks, profiling, take_records, task_metrics
+
+
+def test_profiling_is_reset_after_the_run(monkeypatch):
+    monkeypatch.delenv("RFM_PROFILE_TASKS", raising=False)
+    with profiling(["load_data", "clean_data"]):
+        assert profiled_tasks() == {"load_data", "clean_data"}
+    assert "RFM_PROFILE_TASKS" not in os.environ
+
+    monkeypatch.setenv("RFM_PROFILE_TASKS", "export_results")
+    try:
+        with profiling("*"):
+            assert profiled_tasks() == {"*"}
+            raise RuntimeError("failed run")
+    except RuntimeError:
+        pass
+    assert profiled_tasks() == {"export_results"}
+
+
+def test_instrumented_calls_are_recorded_per_land():
+    @instrumented
+    def double(values):
+        return [v * 2 for v in values]
+
+    with task_metrics("test_flow", "T_METRICS"):
+        double([1, 2])
+        assert [r["task"] for r in take_records("T_METRICS")] == ["double"]
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from conftest import write_extract
+from helper import get_half_year_info, normalize_addresses
+from kw_flow import classify_land, half_year_columns, read_kw_addresses
+
+LAND = "F01"
+
+
+def registration_dates():
+    # One customer registered long before the last half-year, one in the current one
+    # and one before the last half-year ended without any purchase
+    info = get_half_year_info(land=LAND)
+    current_start = pd.Timestamp(info["prev_start"] + relativedelta(months=6))
+    return {
+        1: (pd.Timestamp("2015-03-21"), pd.Timestamp("2015-04-01")),
+        2: (current_start + pd.Timedelta(days=20), current_start + pd.Timedelta(days=25)),
+        3: (pd.Timestamp(info["prev_end"]) - pd.Timedelta(days=40), None),
+    }
+
+
+EXPECTED_LABELS = {1: "Stammkunden", 2: "Neukunden-1", 3: "Interessenten"}
+
+
+def kw_labels(sys_anlage):
+    dates = registration_dates()
+    last_hj, current_hj = half_year_columns(LAND)
+    adresse = normalize_addresses(
+        pd.DataFrame({"NUMMER": ["0000000001", "0000000002", "0000000003"], "SYS_ANLAGE": sys_anlage}),
+        date_format="mixed",
+    )
+    kw = pd.DataFrame({"NUMMER": ["1", "2", "3"], last_hj: ["ST", "ST", "ST"], current_hj: ["ST", "ST", "ST"]})
+    stat = pd.DataFrame({
+        "NUMMER": ["1", "2", "3"],
+        "ERSTKAUF": [None if d is None else d.strftime("%Y-%m-%d") for _, d in dates.values()],
+    })
+    labels = classify_land(LAND, adresse, kw, stat, {"ST": "Stammkunden"})
+    return dict(zip(labels["NUMMER"], labels["Kundengruppe"]))
+
+
+@pytest.mark.parametrize("date_format", ["%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%d 00:00:00", "%Y-%m-%d %H:%M:%S"])
+def test_kw_labels_do_not_depend_on_the_date_format(date_format):
+    sys_anlage = [(d + pd.Timedelta(hours=9)).strftime(date_format) for d, _ in registration_dates().values()]
+    assert kw_labels(sys_anlage) == EXPECTED_LABELS
+
+
+def test_kw_addresses_parse_mixed_dates_like_process_date():
+    # read_csv leaves a column of mixed formats as text; the KW path still parses it
+    values = ["05.01.2020", "2020-01-05 00:00:00", "2020-01-05", "not a date"]
+    write_extract(LAND, "V2AD1001", pd.DataFrame({"NUMMER": ["1", "2", "3", "4"], "SYS_ANLAGE": values}))
+    addresses = read_kw_addresses(LAND)
+    assert addresses["NUMMER"].tolist() == [1, 2, 3, 4]
+    assert addresses["SYS_ANLAGE"].tolist()[:3] == [
+        pd.Timestamp("2020-05-01"), pd.Timestamp("2020-01-05"), pd.Timestamp("2020-01-05"),
+    ]
+    assert pd.isna(addresses["SYS_ANLAGE"].iloc[3])
+
+
+def test_rfm_addresses_keep_iso_dates():
+    addresses = normalize_addresses(pd.DataFrame({"NUMMER": [1, 2], "SYS_ANLAGE": ["2020-01-05", "05.01.2020"]}))
+    assert addresses["SYS_ANLAGE"].iloc[0] == pd.Timestamp("2020-01-05")
+    assert pd.isna(addresses["SYS_ANLAGE"].iloc[1])
@@ -0,0 +1,35 @@
+import os
+
+import pandas as pd
+
+from kw_flow import write_kw_labels
+from kw_handoff import kw_csv_path, kw_ipc_path, load_kw_labels, publish_kw_labels
+
+LAND = "T_KW"
+
+
+def labels(group):
+    return pd.DataFrame({"NUMMER": [1, 2], "Kundengruppe": [group, "Interessenten"]})
+
+
+def test_published_labels_are_served_while_the_file_is_unchanged():
+    publish_kw_labels(LAND, labels("Stammkunden"))
+    assert load_kw_labels(LAND)["Kundengruppe"].tolist() == ["Stammkunden", "Interessenten"]
+
+
+def test_newer_ipc_file_of_another_run_wins_over_the_published_table():
+    publish_kw_labels(LAND, labels("Stammkunden"))
+    # Another process writes the labels of a later KW run
+    other = kw_ipc_path(LAND) + ".other"
+    publish_kw_labels("T_OTHER", labels("Neukunden-1"), path=other)
+    os.replace(other, kw_ipc_path(LAND))
+    assert load_kw_labels(LAND)["Kundengruppe"].tolist() == ["Neukunden-1", "Interessenten"]
+
+
+def test_newer_csv_wins_over_the_published_table():
+    publish_kw_labels(LAND, labels("Stammkunden"))
+    write_kw_labels(labels("Reaktivierte"), kw_csv_path(LAND))
+    stamp = os.path.getmtime(kw_ipc_path(LAND)) + 10
+    os.utime(kw_csv_path(LAND), (stamp, stamp))
+    assert load_kw_labels(LAND)["Kundengruppe"].tolist() == ["Reaktivierte", "Interessenten"]
+    os.remove(kw_csv_path(LAND))
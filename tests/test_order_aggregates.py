@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from conftest import assert_same_aggregates, order_extract, write_extract
+from order_aggregates import aggregate_orders, order_lines, stream_order_aggregates
+
+WINDOWS = (pd.Timestamp("2021-07-01"), pd.Timestamp("2024-07-01"), pd.Timestamp("2026-10-18"))
+
+
+@pytest.fixture(scope="module")
+def extract():
+    # Written to the share layout and read back like the pandas engine reads it
+    path = write_extract("F03", "V2AD1056", order_extract(rows=5000, seed=9))
+    lines = order_lines(pd.read_csv(path, sep=";", encoding="cp850", dtype={"VERWEIS": str}))
+    return path, aggregate_orders(lines, *WINDOWS)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+@pytest.mark.parametrize("chunksize", [97, 1000, 1_000_000])
+def test_streaming_matches_the_whole_frame(extract, chunksize, backend, monkeypatch):
+    # To the last bit: the window sums are truncated to whole euros later on
+    if backend == "numba":
+        pytest.importorskip("numba")
+    monkeypatch.setenv("RFM_KERNELS", backend)
+    path, expected = extract
+    assert_same_aggregates(expected, stream_order_aggregates(path, *WINDOWS, chunksize=chunksize), exact=True)
+
+
+def test_streaming_keeps_orders_whole_across_chunks():
+    # An order split over two chunks would be counted twice
+    path = write_extract("F04", "V2AD1056", order_extract(rows=300, seed=10))
+    expected = aggregate_orders(
+        order_lines(pd.read_csv(path, sep=";", encoding="cp850", dtype={"VERWEIS": str})), *WINDOWS
+    )
+    streamed = stream_order_aggregates(path, *WINDOWS, chunksize=3)
+    assert streamed["gesamt_frequency"].sum() == expected["gesamt_frequency"].sum()
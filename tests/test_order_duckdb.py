@@ -0,0 +1,103 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import assert_same_aggregates, order_extract, write_extract
+from order_aggregates import aggregate_orders, order_lines
+from schemas import load_extract
+
+duckdb = pytest.importorskip("duckdb")
+import order_duckdb  # noqa: E402
+from order_duckdb import aggregate_orders_duckdb, order_parquet, order_parquet_files  # noqa: E402
+
+LAND = "T_DUCKDB"
+WINDOWS = (pd.Timestamp("2021-07-01"), pd.Timestamp("2024-07-01"), pd.Timestamp("2026-10-18"))
+
+
+@pytest.fixture(scope="module")
+def lines():
+    write_extract(LAND, "V2AD1056", order_extract(rows=5000, seed=21))
+    return order_lines(load_extract(LAND, "V2AD1056", "rfm"))
+
+
+def test_extract_scan_matches_the_groupby_aggregation(lines):
+    expected = aggregate_orders(lines, *WINDOWS)
+    # Small chunks: the Parquet copy is written in several row groups
+    aggregates = aggregate_orders_duckdb(LAND, None, *WINDOWS, chunksize=700)
+    assert_same_aggregates(expected, aggregates, exact=True)
+
+
+def test_registered_order_lines_match_the_groupby_aggregation(lines):
+    expected = aggregate_orders(lines, *WINDOWS)
+    assert_same_aggregates(expected, aggregate_orders_duckdb(LAND, lines, *WINDOWS), exact=True)
+
+
+def test_unparseable_dates_match_the_pandas_date_parsing():
+    # Dates order_lines turns into NaT must not be read by the query either, among them
+    # some that strptime would take; the rest of the extract keeps read_csv from
+    # inferring another date format for the column
+    land = f"{LAND}_DATES"
+    extract = order_extract(rows=600, seed=23)
+    odd = [
+        "not a date", "05.01.2020", "2020-01-05 00:00:00", "2020-02-30", " 2023-03-04", "2023-03-04 ",
+        "999-01-01", "20230304", "2023/03/04", "2020-1-5",
+    ]
+    rows = extract.index[3::37][: len(odd)]
+    extract.loc[rows, "AUF_ANLAGE"] = odd
+    write_extract(land, "V2AD1056", extract)
+
+    lines = order_lines(load_extract(land, "V2AD1056", "rfm"))
+    assert lines.loc[rows, "AUF_ANLAGE"].isna().sum() == len(odd) - 1
+    aggregates = aggregate_orders_duckdb(land, None, *WINDOWS)
+    assert_same_aggregates(aggregate_orders(lines, *WINDOWS), aggregates, exact=True)
+
+
+class OutOfMemory:
+    # DuckDB connection that runs out of memory below min_partitions customer partitions
+    def __init__(self, con, min_partitions):
+        self.con = con
+        self.min_partitions = min_partitions
+        self.partitions = []
+
+    def execute(self, sql, params=None):
+        if params is None:
+            return self.con.execute(sql)
+        self.partitions.append(params["partitions"])
+        if params["partitions"] < self.min_partitions:
+            raise duckdb.OutOfMemoryException("Out of Memory Error: failed to allocate data")
+        return self.con.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self.con, name)
+
+
+@pytest.mark.parametrize("min_partitions", [4, 16])
+def test_out_of_memory_repeats_the_query_over_customer_partitions(lines, monkeypatch, min_partitions):
+    connections = []
+    connect = order_duckdb.connect
+
+    def out_of_memory_connect(memory_limit=None):
+        connections.append(OutOfMemory(connect(memory_limit), min_partitions))
+        return connections[-1]
+
+    monkeypatch.setattr(order_duckdb, "connect", out_of_memory_connect)
+    aggregates = aggregate_orders_duckdb(LAND, lines, *WINDOWS)
+    assert set(connections[0].partitions) == {p for p in [1, 4, 16] if p <= min_partitions}
+    assert_same_aggregates(aggregate_orders(lines, *WINDOWS), aggregates, exact=True)
+
+    monkeypatch.setattr(order_duckdb, "MAX_PARTITIONS", min_partitions // 4)
+    with pytest.raises(duckdb.OutOfMemoryException):
+        aggregate_orders_duckdb(LAND, lines, *WINDOWS)
+
+
+def test_parquet_copy_is_reused_until_the_extract_changes(lines):
+    parquet_path = order_parquet(LAND)
+    mtime = os.path.getmtime(parquet_path)
+    assert order_parquet(LAND) == parquet_path and os.path.getmtime(parquet_path) == mtime
+    assert pd.read_parquet(parquet_path).dtypes["AUFTRAG_NR"] == "float64"
+
+    rewritten = order_extract(rows=300, seed=22)
+    write_extract(LAND, "V2AD1056", rewritten)
+    order_parquet(LAND)
+    assert len(pd.read_parquet(order_parquet_files(LAND)[0])) == len(rewritten)
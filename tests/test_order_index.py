@@ -0,0 +1,75 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import order_index
+from conftest import assert_same_aggregates, order_extract, write_extract
+from order_aggregates import aggregate_orders, order_lines
+from order_index import aggregate_order_index, build_order_index, order_index_for_land
+from schemas import load_extract
+
+LAND = "T_INDEX"
+WINDOWS = (pd.Timestamp("2021-07-01"), pd.Timestamp("2024-07-01"), pd.Timestamp("2026-10-18"))
+
+
+@pytest.fixture(scope="module")
+def lines():
+    write_extract(LAND, "V2AD1056", order_extract(rows=5000, seed=11))
+    return order_lines(load_extract(LAND, "V2AD1056", "rfm"))
+
+
+def test_index_matches_the_groupby_aggregation(lines):
+    expected = aggregate_orders(lines, *WINDOWS)
+    aggregates = aggregate_order_index(build_order_index(lines), *WINDOWS, backend="numpy")
+    assert_same_aggregates(expected, aggregates)
+
+
+def test_persisted_index_is_reused_until_the_extract_changes(lines):
+    built = order_index_for_land(LAND)
+    loaded = order_index_for_land(LAND)
+    assert isinstance(loaded["netto"], np.memmap)
+    for name, values in build_order_index(lines).items():
+        np.testing.assert_array_equal(np.asarray(loaded[name]), values, err_msg=name)
+        np.testing.assert_array_equal(np.asarray(built[name]), values, err_msg=name)
+
+    write_extract(LAND, "V2AD1056", order_extract(rows=300, seed=12))
+    rebuilt = order_index_for_land(LAND)
+    assert len(rebuilt["day"]) < len(loaded["day"])
+
+
+def test_persisted_index_is_rebuilt_for_a_new_index_version_or_an_edited_extract(monkeypatch):
+    extract = order_extract(rows=2000, seed=13)
+    path = write_extract(LAND, "V2AD1056", extract)
+    order_index_for_land(LAND)
+    assert isinstance(order_index_for_land(LAND)["netto"], np.memmap)
+
+    # Arrays of an older layout are never memory-mapped, even for the same extract
+    monkeypatch.setattr(order_index, "INDEX_VERSION", order_index.INDEX_VERSION + 1)
+    assert not isinstance(order_index_for_land(LAND)["netto"], np.memmap)
+    with open(os.path.join(order_index.index_dir(LAND), "meta.json"), encoding="utf-8") as f:
+        assert json.load(f)["version"] == order_index.INDEX_VERSION
+    assert isinstance(order_index_for_land(LAND)["netto"], np.memmap)
+
+    # Amounts edited in place, as by a later export: only the modification time changes
+    with open(path, encoding="cp850") as f:
+        header, *rows = f.read().splitlines()
+    amount = header.split(";").index("BEST_WERT")
+    digits = str.maketrans("123456789", "234567891")
+    for i, row in enumerate(rows):
+        fields = row.split(";")
+        fields[amount] = fields[amount].translate(digits)
+        rows[i] = ";".join(fields)
+    stat = os.stat(path)
+    with open(path, "w", encoding="cp850") as f:
+        f.write("\n".join([header, *rows]) + "\n")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert os.path.getsize(path) == stat.st_size
+    rebuilt = order_index_for_land(LAND)
+    assert not isinstance(rebuilt["netto"], np.memmap)
+    assert_same_aggregates(
+        aggregate_orders(order_lines(load_extract(LAND, "V2AD1056", "rfm")), *WINDOWS),
+        aggregate_order_index(rebuilt, *WINDOWS, backend="numpy"),
+    )
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import order_kernels
+from conftest import ROOT, assert_same_aggregates, order_extract, write_extract
+from helper import get_halfyear_bins
+from order_aggregates import aggregate_orders, finish_partials, fold_order_lines, order_lines
+from order_index import aggregate_order_index, build_order_index
+from order_kernels import kernel_backend, numba, recency_scores
+from schemas import load_extract
+
+LAND = "T_KERNELS"
+TODAY = pd.Timestamp("2026-10-18")
+WINDOWS = (pd.Timestamp("2021-07-01"), pd.Timestamp("2024-07-01"), TODAY)
+BACKENDS = ["numpy", pytest.param("numba", marks=pytest.mark.skipif(numba is None, reason="numba not installed"))]
+
+
+@pytest.fixture(scope="module")
+def lines():
+    # Blank dates, dates after today and missing amounts (order_extract); enough lines
+    # that missing amounts fall between other amounts of a customer's sums
+    write_extract(LAND, "V2AD1056", order_extract(rows=20000, seed=31))
+    return order_lines(load_extract(LAND, "V2AD1056", "rfm"))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_order_index_kernels_match_the_groupby_aggregation(lines, backend):
+    assert lines["AUF_ANLAGE"].isna().any() and lines["NETTO_UMSATZ"].isna().any()
+    expected = aggregate_orders(lines, *WINDOWS)
+    aggregates = aggregate_order_index(build_order_index(lines), *WINDOWS, backend=backend)
+    # Only the compiled sums are compensated like the pandas groupby sums
+    assert_same_aggregates(expected, aggregates, exact=backend == "numba")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_recency_scores_match_pd_cut(lines, backend):
+    bin_edges, bin_labels = get_halfyear_bins(TODAY)
+    recency = pd.concat(
+        [
+            aggregate_orders(lines, *WINDOWS)["recency"],
+            # NaT, on and around the outer edges and outside them
+            pd.Series(pd.to_datetime([
+                None, "1899-12-31", "1900-01-01", "2017-06-30", "2017-07-01", TODAY, TODAY + pd.Timedelta(days=1),
+                "2100-01-01",
+            ])),
+        ],
+        ignore_index=True,
+    )
+    expected = recency_scores(recency, bin_edges, bin_labels, backend="pandas")
+    scores = recency_scores(recency, bin_edges, bin_labels, backend=backend)
+    assert scores.dtype == expected.dtype
+    np.testing.assert_array_equal(scores.to_numpy(), expected.to_numpy())
+    assert (scores.iloc[-8:].to_numpy()[[0, 1, -2, -1]] == 0).all()
+
+
+def test_numpy_kernels_without_numba(lines, monkeypatch):
+    # The default backend without numba: the numpy kernels, and numba only on request
+    monkeypatch.setattr(order_kernels, "numba", None)
+    monkeypatch.delenv("RFM_KERNELS", raising=False)
+    assert kernel_backend() == "numpy"
+    with pytest.raises(ImportError):
+        kernel_backend("numba")
+    monkeypatch.setenv("RFM_KERNELS", "numba")
+    with pytest.raises(ImportError):
+        kernel_backend()
+    monkeypatch.delenv("RFM_KERNELS")
+
+    expected = aggregate_orders(lines, *WINDOWS)
+    assert_same_aggregates(expected, aggregate_order_index(build_order_index(lines), *WINDOWS))
+    assert_same_aggregates(expected, finish_partials(fold_order_lines(None, lines, *WINDOWS)), exact=True)
+    bin_edges, bin_labels = get_halfyear_bins(TODAY)
+    pd.testing.assert_series_equal(
+        recency_scores(expected["recency"], bin_edges, bin_labels),
+        recency_scores(expected["recency"], bin_edges, bin_labels, backend="pandas"),
+        check_names=False,
+    )
+
+
+def test_kernels_import_without_numba():
+    # njit leaves the kernels as plain Python functions when numba cannot be imported
+    code = (
+        "import sys; sys.modules['numba'] = None\n"
+        "import order_kernels\n"
+        "assert order_kernels.numba is None and order_kernels.kernel_backend() == 'numpy'\n"
+        "assert not hasattr(order_kernels.group_sum_kernel, 'py_func')\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, env={**os.environ, "RFM_KERNELS": ""})
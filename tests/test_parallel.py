@@ -0,0 +1,22 @@
+import multiprocessing
+import os
+
+from parallel import run_lands
+
+
+def worker_info(land, suffix):
+    return os.getpid(), multiprocessing.get_start_method(), os.environ.get("RFM_LAND_WORKERS"), land + suffix
+
+
+def test_lands_run_in_spawned_workers():
+    results = run_lands(worker_info, ["A", "B"], workers=None, suffix="-done")
+    assert list(results) == ["A", "B"]
+    for land, (pid, start_method, workers, value) in results.items():
+        assert pid != os.getpid()
+        assert start_method == "spawn"
+        assert workers == "2"
+        assert value == f"{land}-done"
+
+
+def test_single_worker_runs_in_process():
+    assert run_lands(worker_info, ["A"], workers=1, suffix="")["A"][0] == os.getpid()